@@ -9,39 +9,172 @@ const openai = new OpenAI({
   baseURL: 'https://api.together.xyz/v1',
 });
 
-const EMBEDDING_MODEL = 'togethercomputer/m2-bert-80M-2k-retrieval'; // Using all-MiniLM-L6-v2 compatible model
+const EMBEDDING_MODEL = 'togethercomputer/m2-bert-80M-2k-retrieval'; // Fallback only: a different space from the local all-MiniLM-L6-v2 stores
+const EMBEDDING_DIM = 768; // m2-bert-80M output size
 const CHAT_MODEL = 'meta-llama/Meta-Llama-3.1-70B-Instruct-Turbo';
 const TAVILY_API_KEY = process.env.TAVILY_API_KEY?.trim();
+// scripts/twin_server.py (or scripts/retrieval.py serve); when unset, chunks are scored in-process
+const RETRIEVAL_URL = process.env.RETRIEVAL_URL?.trim();
 
 export const dynamic = 'force-dynamic';
 
-async function getTwinData(twinId: string) {
-  try {
-    const metadataPath = path.join(process.cwd(), 'data', 'twins', twinId, 'metadata.json');
-    const kbPath = path.join(process.cwd(), 'data', 'twins', twinId, 'knowledge_base.json');
+type Chunk = { text: string; metadata?: Record<string, any> };
+
+type KnowledgeBase = {
+  model?: string;
+  count: number;
+  dim: number;
+  vectors: Float32Array;
+  getChunks: (indices: number[]) => Promise<Chunk[]>;
+};
+
+function halfToFloat(h: number) {
+  const sign = h & 0x8000 ? -1 : 1;
+  const exponent = (h >> 10) & 0x1f;
+  const fraction = h & 0x03ff;
+  if (exponent === 0) return sign * Math.pow(2, -14) * (fraction / 1024);
+  if (exponent === 0x1f) return fraction ? NaN : sign * Infinity;
+  return sign * Math.pow(2, exponent - 15) * (1 + fraction / 1024);
+}
+
+// Typed array views need an aligned byteOffset; copy the buffer when it isn't.
+function alignedBuffer(buffer: Buffer, alignment: number) {
+  if (buffer.byteOffset % alignment === 0) return buffer;
+  return Buffer.from(buffer);
+}
+
+// Binary store written by scripts/kb_store.py: vectors are read straight into a
+// typed array and chunk text is only read for the rows that are returned.
+async function loadBinaryKnowledgeBase(kbDir: string): Promise<KnowledgeBase> {
+  const header = JSON.parse(await fs.readFile(path.join(kbDir, 'header.json'), 'utf-8'));
+  const { model, count, dim, dtype } = header;
+
+  const raw = alignedBuffer(await fs.readFile(path.join(kbDir, 'vectors.bin')), 4);
+  let vectors: Float32Array;
+  if (dtype === 'float16') {
+    const halves = new Uint16Array(raw.buffer, raw.byteOffset, count * dim);
+    vectors = Float32Array.from(halves, halfToFloat);
+  } else {
+    vectors = new Float32Array(raw.buffer, raw.byteOffset, count * dim);
+  }
+
+  const offsetBytes = alignedBuffer(await fs.readFile(path.join(kbDir, 'offsets.bin')), 8);
+  const offsets = new BigUint64Array(offsetBytes.buffer, offsetBytes.byteOffset, count + 1);
+
+  const getChunks = async (indices: number[]) => {
+    const handle = await fs.open(path.join(kbDir, 'chunks.jsonl'), 'r');
+    try {
+      return await Promise.all(indices.map(async (i) => {
+        const start = Number(offsets[i]);
+        const length = Number(offsets[i + 1]) - start;
+        const buffer = Buffer.alloc(length);
+        await handle.read(buffer, 0, length, start);
+        return JSON.parse(buffer.toString('utf-8'));
+      }));
+    } finally {
+      await handle.close();
+    }
+  };
+
+  return { model, count, dim, vectors, getChunks };
+}
+
+// Legacy knowledge_base.json: [{ text, metadata, embedding }, ...]
+async function loadJsonKnowledgeBase(kbPath: string): Promise<KnowledgeBase> {
+  const items = JSON.parse(await fs.readFile(kbPath, 'utf-8'));
+  const dim = items.length > 0 ? items[0].embedding.length : 0;
+  const vectors = new Float32Array(items.length * dim);
+  items.forEach((item: any, i: number) => vectors.set(item.embedding, i * dim));
+
+  const getChunks = async (indices: number[]) =>
+    indices.map((i) => ({ text: items[i].text, metadata: items[i].metadata }));
+
+  return { count: items.length, dim, vectors, getChunks };
+}
 
-    const metadata = JSON.parse(await fs.readFile(metadataPath, 'utf-8'));
-    const knowledgeBase = JSON.parse(await fs.readFile(kbPath, 'utf-8'));
+function twinDir(twinId: string) {
+  return path.join(process.cwd(), 'data', 'twins', twinId);
+}
 
-    return { metadata, knowledgeBase };
+// The twin server keeps every twin's metadata resident; ask it first so a chat
+// request doesn't touch the disk at all.
+async function getTwinMetadata(twinId: string) {
+  if (RETRIEVAL_URL) {
+    try {
+      const response = await fetch(`${RETRIEVAL_URL.replace(/\/$/, '')}/twins/${encodeURIComponent(twinId)}`);
+      if (response.ok) {
+        const data = await response.json();
+        if (data.metadata) return data.metadata;
+      }
+    } catch (error) {
+      console.error('Twin server error:', error);
+    }
+  }
+
+  try {
+    return JSON.parse(await fs.readFile(path.join(twinDir(twinId), 'metadata.json'), 'utf-8'));
   } catch (error) {
-    console.error(`Error reading twin data for ${twinId}:`, error);
+    console.error(`Error reading twin metadata for ${twinId}:`, error);
     return null;
   }
 }
 
-function cosineSimilarity(vecA: number[], vecB: number[]) {
+// Only needed when the retrieval service can't answer
+async function loadKnowledgeBase(twinId: string): Promise<KnowledgeBase | null> {
+  const dir = twinDir(twinId);
+  const kbDir = path.join(dir, 'kb');
+  try {
+    // The legacy JSON is only read for twins that have no store; a store that fails to load is an error
+    const hasStore = await fs.access(path.join(kbDir, 'header.json')).then(() => true, () => false);
+    return hasStore
+      ? await loadBinaryKnowledgeBase(kbDir)
+      : await loadJsonKnowledgeBase(path.join(dir, 'knowledge_base.json'));
+  } catch (error) {
+    console.error(`Error reading knowledge base for ${twinId}:`, error);
+    return null;
+  }
+}
+
+function cosineSimilarity(vecA: number[], vecB: Float32Array, offset: number) {
   let dotProduct = 0;
   let normA = 0;
   let normB = 0;
   for (let i = 0; i < vecA.length; i++) {
-    dotProduct += vecA[i] * vecB[i];
+    const b = vecB[offset + i];
+    dotProduct += vecA[i] * b;
     normA += vecA[i] * vecA[i];
-    normB += vecB[i] * vecB[i];
+    normB += b * b;
   }
   return dotProduct / (Math.sqrt(normA) * Math.sqrt(normB));
 }
 
+// Top-k search in the Python retrieval service (pre-normalized vectors, argpartition,
+// BM25 keyword matches fused in). The service embeds the query locally with the
+// same model the knowledge base was built with. Returns null when the service is
+// unavailable so the caller can fall back.
+async function searchRetrievalService(twinId: string, query: string, k: number): Promise<Chunk[] | null> {
+  if (!RETRIEVAL_URL) return null;
+
+  try {
+    const response = await fetch(`${RETRIEVAL_URL.replace(/\/$/, '')}/search`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ twin: twinId, query, k }),
+    });
+
+    if (!response.ok) {
+      console.error('Retrieval service failed:', response.status, await response.text());
+      return null;
+    }
+
+    const data = await response.json();
+    return data.results;
+  } catch (error) {
+    console.error('Retrieval service error:', error);
+    return null;
+  }
+}
+
 async function searchWeb(query: string) {
   if (!TAVILY_API_KEY) {
     console.log('No Tavily API key configured, skipping web search');
@@ -96,18 +229,16 @@ export async function POST(
   const { twinId } = params;
   const lastMessage = messages[messages.length - 1];
 
-  // Load twin data
-  const twinData = await getTwinData(twinId);
+  // Load twin metadata
+  const metadata = await getTwinMetadata(twinId);
 
-  if (!twinData) {
+  if (!metadata) {
     return new Response(JSON.stringify({ error: 'Twin not found' }), {
       status: 404,
       headers: { 'Content-Type': 'application/json' },
     });
   }
 
-  const { metadata, knowledgeBase } = twinData;
-
   // 1. Check if we should search the web for current information
   let webSearchResults = '';
   if (shouldSearchWeb(lastMessage.content)) {
@@ -126,35 +257,51 @@ export async function POST(
     }
   }
 
-  // 2. Embed the user's query
-  let embedding = null;
-  try {
-    const response = await openai.embeddings.create({
-      model: EMBEDDING_MODEL,
-      input: lastMessage.content,
-    });
-
-    embedding = response.data[0].embedding;
-
-  } catch (error) {
-    console.error("Embedding error:", error);
+  // 2. Retrieve relevant chunks, preferably through the retrieval service
+  let contextString = "";
+  let topChunks: Chunk[] | null = await searchRetrievalService(twinId, lastMessage.content, 5);
+
+  // 3. Otherwise load the knowledge base, embed the user's query remotely and scan in-process
+  const knowledgeBase = topChunks ? null : await loadKnowledgeBase(twinId);
+  // Vectors from a different model live in a different space; scoring them would be noise
+  const comparable = knowledgeBase !== null && knowledgeBase.dim === EMBEDDING_DIM &&
+    (knowledgeBase.model === undefined || knowledgeBase.model === EMBEDDING_MODEL);
+  if (knowledgeBase && knowledgeBase.count > 0 && !comparable) {
+    console.error(`Knowledge base for ${twinId} (${knowledgeBase.model ?? 'unknown model'}, ${knowledgeBase.dim} dimensions) ` +
+      `can't be searched with ${EMBEDDING_MODEL} query embeddings; ` +
+      'set RETRIEVAL_URL to embed queries with the matching local model');
   }
+  if (knowledgeBase && comparable && knowledgeBase.count > 0) {
+    let embedding = null;
+    try {
+      const response = await openai.embeddings.create({
+        model: EMBEDDING_MODEL,
+        input: lastMessage.content,
+      });
+
+      embedding = response.data[0].embedding;
+
+    } catch (error) {
+      console.error("Embedding error:", error);
+    }
 
-  // 3. Retrieve relevant chunks
-  let contextString = "";
-  if (embedding && knowledgeBase.length > 0) {
-    const chunksWithScores = knowledgeBase.map((chunk: any) => ({
-        ...chunk,
-        score: cosineSimilarity(embedding, chunk.embedding)
-    }));
+    if (embedding) {
+      const { count, dim, vectors } = knowledgeBase;
+      const scored: { index: number; score: number }[] = [];
+      for (let i = 0; i < count; i++) {
+        scored.push({ index: i, score: cosineSimilarity(embedding, vectors, i * dim) });
+      }
 
-    // Sort by score descending
-    chunksWithScores.sort((a: any, b: any) => b.score - a.score);
+      // Sort by score descending
+      scored.sort((a, b) => b.score - a.score);
 
-    // Take top 5
-    const topChunks = chunksWithScores.slice(0, 5);
+      // Take top 5, reading only their text from disk
+      topChunks = await knowledgeBase.getChunks(scored.slice(0, 5).map((s) => s.index));
+    }
+  }
 
-    const context = topChunks.map((chunk: any) => chunk.text).join("\n\n");
+  if (topChunks) {
+    const context = topChunks.map((chunk) => chunk.text).join("\n\n");
     contextString = `\n\nContext from YouTube Channel:\n${context}`;
   }
 
@@ -0,0 +1,181 @@
+"""
+ANN Index
+Pure-NumPy IVF (inverted file) index for approximate top-k search over a
+twin's knowledge base store.
+
+Rows are clustered with spherical k-means; each query scores the centroids,
+then only the rows in the nprobe closest lists. The index is saved as
+ivf.npz inside the store directory and stamped with the store revision it
+was built from, so a store that has changed since is searched exactly until
+the index is rebuilt.
+
+Usage:
+    python scripts/ann_index.py build data/twins/retail/kb --nlist 256
+"""
+import os
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from kb_store import KnowledgeBaseReader, normalize_rows, read_header
+
+INDEX_FILE = "ivf.npz"
+DEFAULT_NPROBE = 8
+# Below this many rows an exact scan is already sub-millisecond
+MIN_ROWS = 5000
+KMEANS_ITERATIONS = 10
+# Rows used to train the centroids, per list
+TRAIN_ROWS_PER_LIST = 64
+# Rows scored against the centroids at a time while assigning, to bound memory
+ASSIGN_BLOCK = 8192
+
+
+def default_nlist(count: int) -> int:
+    """~4 * sqrt(n) lists, the usual IVF rule of thumb."""
+    return max(1, int(4 * np.sqrt(count)))
+
+
+def _assign(vectors, centroids) -> np.ndarray:
+    """Index of the most similar centroid for each (unit-norm) row."""
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGN_BLOCK):
+        block = normalize_rows(vectors[start:start + ASSIGN_BLOCK])
+        labels[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def spherical_kmeans(vectors, nlist: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0) -> np.ndarray:
+    """Unit-norm centroids for the rows of vectors (cosine k-means)."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), nlist * TRAIN_ROWS_PER_LIST)
+    sample = normalize_rows(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))])
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)]
+
+    for _ in range(iterations):
+        labels = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        counts = np.bincount(labels, minlength=nlist)
+        # Reseed empty lists from random sample rows
+        empty = counts == 0
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+class IVFIndex:
+    """Centroids plus, per list, the store rows assigned to it."""
+
+    def __init__(self, centroids, list_offsets, list_rows, revision: int, count: int):
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+        self.revision = revision
+        self.count = count
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, vectors, nlist: int = None, revision: int = 0, seed: int = 0) -> "IVFIndex":
+        nlist = min(nlist or default_nlist(len(vectors)), len(vectors))
+        centroids = spherical_kmeans(vectors, nlist, seed=seed)
+        labels = _assign(vectors, centroids)
+        list_rows = np.argsort(labels, kind="stable")
+        list_offsets = np.zeros(nlist + 1, dtype=np.int64)
+        list_offsets[1:] = np.cumsum(np.bincount(labels, minlength=nlist))
+        return cls(centroids, list_offsets, list_rows, revision, len(vectors))
+
+    def save(self, kb_dir):
+        path = Path(kb_dir) / INDEX_FILE
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, centroids=self.centroids, list_offsets=self.list_offsets, list_rows=self.list_rows,
+                     revision=self.revision, count=self.count)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, kb_dir, revision: int = None):
+        """Load the store's index, or None if there isn't one or it predates `revision`."""
+        path = Path(kb_dir) / INDEX_FILE
+        if not path.exists():
+            return None
+        with np.load(path) as data:
+            index = cls(data["centroids"], data["list_offsets"], data["list_rows"],
+                        int(data["revision"]), int(data["count"]))
+        if revision is not None and index.revision != revision:
+            return None
+        return index
+
+    def candidates(self, query, nprobe: int = DEFAULT_NPROBE) -> np.ndarray:
+        """Store rows in the nprobe lists whose centroids are closest to the (unit-norm) query."""
+        centroid_scores = self.centroids @ query
+        nprobe = min(nprobe, self.nlist)
+        probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        return np.concatenate([self.list_rows[self.list_offsets[p]:self.list_offsets[p + 1]] for p in probes])
+
+
+def build_index(kb_dir, nlist: int = None) -> IVFIndex:
+    """Cluster the store's vectors and save the index next to them."""
+    start = time.perf_counter()
+    with KnowledgeBaseReader(kb_dir) as reader:
+        index = IVFIndex.build(reader.vectors, nlist=nlist, revision=reader.revision)
+    index.save(kb_dir)
+    print(f"Built IVF index: {index.count} rows in {index.nlist} lists ({time.perf_counter() - start:.1f}s)")
+    return index
+
+
+def refresh_index(kb_dir, nlist: int = None, create: bool = False, force: bool = False):
+    """Rebuild the store's index if it is stale, build one if create and there is none,
+    or rebuild it regardless with force. An up-to-date index is returned as is.
+
+    create skips stores under MIN_ROWS; an index that already exists is kept
+    up to date however small the store gets.
+    """
+    kb_dir = Path(kb_dir)
+    header = read_header(kb_dir)
+    if not header["count"]:
+        # Nothing to cluster; a stale index is ignored by its revision
+        return None
+    existing = IVFIndex.load(kb_dir)
+    if existing is None and not (force or (create and header["count"] >= MIN_ROWS)):
+        return None
+    if existing is not None and existing.revision == header.get("revision", 0) and not force:
+        return existing
+    return build_index(kb_dir, nlist)
+
+
+def add_index_arguments(parser):
+    """Register the ANN index CLI flags shared by the ingesters."""
+    parser.add_argument("--ann", action="store_true",
+                        help=f"Build an IVF index for approximate search once the store has {MIN_ROWS} rows "
+                             "(kept up to date once it exists)")
+    parser.add_argument("--ann-rebuild", action="store_true",
+                        help="Rebuild the IVF index even if it is up to date (e.g. after changing --ann-lists)")
+    parser.add_argument("--ann-lists", type=int, default=None, help="IVF lists (default: 4 * sqrt(rows))")
+
+
+def refresh_index_from_args(args, kb_dir):
+    """Build or refresh the index described by add_index_arguments() flags."""
+    return refresh_index(kb_dir, nlist=args.ann_lists, create=args.ann, force=args.ann_rebuild)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build an IVF index for a knowledge base store.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Cluster a store's vectors and save ivf.npz next to them")
+    build_parser.add_argument("kb_dir", type=str, help="Store directory")
+    build_parser.add_argument("--nlist", type=int, default=None, help="Number of lists (default: 4 * sqrt(rows))")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_index(args.kb_dir, args.nlist)
+
+
+if __name__ == "__main__":
+    main()
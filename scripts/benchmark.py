@@ -0,0 +1,1319 @@
+"""
+Ingestion & Retrieval Benchmarks
+Micro-benchmarks for the Python side of the twin pipeline. Each subcommand
+prints a small table; run from the project root:
+
+    python scripts/benchmark.py startup
+    python scripts/benchmark.py backends --n 2000
+    python scripts/benchmark.py batching --n 2000
+    python scripts/benchmark.py workers --n 5000 --workers 1 2 4 8 16 32
+    python scripts/benchmark.py retrieval --n 50000
+    python scripts/benchmark.py ann --n 50000 --nprobe 1 4 8 16 32
+    python scripts/benchmark.py hybrid --kb data/twins/bcstat/kb --eval eval.jsonl
+    python scripts/benchmark.py filters --n 200000
+    python scripts/benchmark.py serve --n 50000 --clients 8 --duration 10
+    python scripts/benchmark.py chunking --videos 200
+    python scripts/benchmark.py dedup --videos 100 --pages 50
+    python scripts/benchmark.py fixtures
+    python scripts/benchmark.py captions --hours 20
+    python scripts/benchmark.py html --mb 10
+    python scripts/benchmark.py sections --mb 4
+    python scripts/benchmark.py http --files 200
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).parent
+CAPTION_FIXTURES = SCRIPTS_DIR / "fixtures" / "captions"
+HTML_FIXTURES = SCRIPTS_DIR / "fixtures" / "html"
+DEFAULT_SAMPLE = SCRIPTS_DIR.parent / "data" / "twins" / "bcstat" / "knowledge_base.json"
+
+try:
+    import resource  # Not available on Windows
+except ImportError:
+    resource = None
+
+
+def _run_child(cmd, env=None):
+    """Run a child process; returns (wall seconds, peak RSS in MB or None, exit code, output)."""
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env, text=True)
+    if resource is not None and hasattr(os, "wait4"):
+        output = proc.stdout.read()
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        elapsed = time.perf_counter() - start
+        # ru_maxrss is KB on Linux
+        return elapsed, usage.ru_maxrss / 1024, proc.returncode, output
+    output, _ = proc.communicate()
+    return time.perf_counter() - start, None, proc.returncode, output
+
+
+def _print_table(headers, rows):
+    widths = [max(len(str(h)), *(len(str(r[i])) for r in rows)) for i, h in enumerate(headers)]
+    print("  ".join(str(h).ljust(w) for h, w in zip(headers, widths)))
+    print("  ".join("-" * w for w in widths))
+    for row in rows:
+        print("  ".join(str(c).ljust(w) for c, w in zip(row, widths)))
+
+
+def load_sample_texts(path, n=None):
+    """Chunk texts from a store directory or legacy knowledge_base.json, repeated up to n."""
+    import json
+    from kb_store import KnowledgeBaseReader, store_exists
+
+    path = Path(path)
+    if store_exists(path):
+        with KnowledgeBaseReader(path) as reader:
+            texts = [c["text"] for c in reader.iter_chunks()]
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            texts = [item["text"] for item in json.load(f)]
+    if n:
+        texts = (texts * (n // len(texts) + 1))[:n]
+    return texts
+
+
+def _throughput(fn, texts, runs=1):
+    """Best-of-runs wall time for fn(texts); returns (seconds, result of the last run)."""
+    best, result = None, None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn(texts)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def _row_cosines(a, b):
+    import numpy as np
+
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    return (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+
+def bench_backends(args):
+    """Chunks/sec per embedding backend, with cosine parity against the torch baseline."""
+    from embedder import BACKENDS, LocalEmbedder
+
+    texts = load_sample_texts(args.sample, args.n)
+    print(f"Encoding {len(texts)} chunks on {args.device}")
+
+    baseline, rows, failed = None, [], False
+    for backend in args.backends or BACKENDS:
+        embedder = LocalEmbedder(backend=backend, device=args.device)
+        embedder.encode(texts[:8])  # Load and warm up outside the timed region
+        elapsed, vectors = _throughput(embedder.encode, texts, args.runs)
+        if baseline is None:
+            baseline = vectors
+        cosines = _row_cosines(baseline, vectors)
+        ok = cosines.min() >= args.min_cosine
+        failed |= not ok
+        rows.append([backend, f"{len(texts) / elapsed:.1f}", f"{cosines.mean():.4f}", f"{cosines.min():.4f}",
+                     "ok" if ok else f"FAIL (< {args.min_cosine})"])
+
+    _print_table(["backend", "chunks/sec", "mean cos", "min cos", "parity"], rows)
+    if failed:
+        sys.exit(1)
+
+
+def bench_batching(args):
+    """Fixed batches of 32 (the original encode call) vs token-budget batches."""
+    import numpy as np
+    from embedder import DEFAULT_ENCODE_BATCH_SIZE, LocalEmbedder, plan_token_batches
+
+    texts = load_sample_texts(args.sample, args.n)
+    embedder = LocalEmbedder(backend=args.backend, device=args.device)
+    lengths = embedder.token_lengths(texts)
+    real_tokens = int(lengths.sum())
+
+    # sentence-transformers sorts by character length, then slices fixed batches
+    by_chars = np.argsort([-len(t) for t in texts], kind="stable")
+    fixed_plan = [by_chars[i:i + DEFAULT_ENCODE_BATCH_SIZE] for i in range(0, len(texts), DEFAULT_ENCODE_BATCH_SIZE)]
+
+    rows = []
+    baseline = None
+    for label, budget, plan in (
+        ("fixed x32", 0, fixed_plan),
+        (f"budget {args.token_budget}", args.token_budget, plan_token_batches(lengths, args.token_budget)),
+    ):
+        padded = sum(len(batch) * int(lengths[batch].max()) for batch in plan)
+        embedder.token_budget = budget
+        embedder.encode(texts[:8])  # Warm up outside the timed region
+        elapsed, vectors = _throughput(embedder.encode, texts, args.runs)
+        if baseline is None:
+            baseline = vectors
+        rows.append([label, len(plan), f"{100.0 * real_tokens / padded:.1f}%",
+                     f"{real_tokens / elapsed:,.0f}", f"{len(texts) / elapsed:.1f}",
+                     f"{_row_cosines(baseline, vectors).min():.4f}"])
+
+    print(f"{len(texts)} chunks, {real_tokens:,} tokens, backend {args.backend} on {args.device}")
+    _print_table(["batching", "batches", "pad efficiency", "tokens/sec", "chunks/sec", "min cos"], rows)
+
+
+def bench_workers(args):
+    """Speedup curve for multi-process CPU encoding; outputs must match the single-process run."""
+    import numpy as np
+    from embedder import LocalEmbedder
+
+    texts = load_sample_texts(args.sample, args.n)
+    print(f"Encoding {len(texts)} chunks on {os.cpu_count()} cores, backend {args.backend}")
+
+    baseline, base_elapsed, rows, failed = None, None, [], False
+    for workers in args.workers:
+        embedder = LocalEmbedder(backend=args.backend, device="cpu", workers=workers,
+                                 threads_per_worker=args.threads)
+        try:
+            embedder.encode(texts)  # Start the pool and load every worker's model outside the timed region
+            elapsed, vectors = _throughput(embedder.encode, texts, args.runs)
+        finally:
+            embedder.close()
+        if baseline is None:
+            baseline, base_elapsed = vectors, elapsed
+        max_diff = float(np.abs(baseline - vectors).max())
+        ok = max_diff <= args.max_diff
+        failed |= not ok
+        rows.append([workers, embedder.threads_per_worker, f"{len(texts) / elapsed:.1f}",
+                     f"{base_elapsed / elapsed:.2f}x", f"{max_diff:.2e}", "ok" if ok else "FAIL"])
+
+    _print_table(["workers", "threads", "chunks/sec", "speedup", "max |diff|", "parity"], rows)
+    if failed:
+        sys.exit(1)
+
+
+def _latency_row(label, timings, baseline_p50=None):
+    timings = sorted(timings)
+    p50 = timings[len(timings) // 2] * 1000
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000
+    speedup = f"{baseline_p50 / p50:.1f}x" if baseline_p50 else "1.0x"
+    return [label, f"{p50:.2f}", f"{p99:.2f}", speedup], p50
+
+
+SYNTHETIC_TICKERS = ("WMT", "TGT", "COST", "HD", "AMZN")
+
+
+def _synthetic_metadata(rng, n):
+    """EDGAR-style chunk metadata: ticker, filing type and filing date."""
+    import numpy as np
+
+    tickers = rng.integers(0, len(SYNTHETIC_TICKERS), n)
+    # Roughly one 10-K per three 10-Qs
+    types = np.where(rng.random(n) < 0.25, "10-K", "10-Q")
+    days = rng.integers(0, 365 * 10, n)
+    dates = np.datetime64("2015-01-01") + days.astype("timedelta64[D]")
+    return [{"ticker": SYNTHETIC_TICKERS[t], "filing_type": str(f), "filing_date": str(d)}
+            for t, f, d in zip(tickers, types, dates)]
+
+
+def _synthetic_store(kb_dir, n, dim, seed=0, topics=0, metadata=False):
+    """Random vectors with placeholder chunks, written as a normal store.
+
+    With topics > 0 rows are scattered around that many random centres, which
+    is closer to how real chunk embeddings cluster than uniform noise. With
+    metadata, chunks carry EDGAR-style fields for filter benchmarks.
+    """
+    import numpy as np
+    from kb_store import write_knowledge_base
+
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    if topics:
+        centres = rng.standard_normal((topics, dim)).astype(np.float32) * 2
+        vectors += centres[rng.integers(0, topics, n)]
+    metadatas = _synthetic_metadata(rng, n) if metadata else [{}] * n
+    chunks = [{"text": f"chunk {i}", "metadata": m} for i, m in enumerate(metadatas)]
+    write_knowledge_base(kb_dir, chunks, vectors, model="synthetic")
+
+
+def brute_force_search(vectors, query, k):
+    """The chat route's original algorithm: per-row cosine recomputing both norms, then a full sort."""
+    import math
+
+    scored = []
+    for i, row in enumerate(vectors):
+        dot = float(row @ query)
+        norms = math.sqrt(float(query @ query)) * math.sqrt(float(row @ row))
+        scored.append({"index": i, "score": dot / norms})
+    scored.sort(key=lambda s: s["score"], reverse=True)
+    return [s["index"] for s in scored[:k]]
+
+
+def bench_retrieval(args):
+    """Query latency: route.ts-style brute force vs pre-normalized matvec + argpartition."""
+    import tempfile
+    import numpy as np
+    from retrieval import Retriever
+
+    with tempfile.TemporaryDirectory() as tmp:
+        kb_dir = args.kb
+        if kb_dir is None:
+            kb_dir = Path(tmp) / "kb"
+            _synthetic_store(kb_dir, args.n, args.dim)
+        retriever = Retriever(kb_dir)
+        raw = np.array(retriever.reader.vectors, dtype=np.float32)
+        queries = np.random.default_rng(1).standard_normal((args.queries, retriever.dim)).astype(np.float32)
+        print(f"{len(retriever)} vectors x {retriever.dim}d, {args.queries} queries, k={args.k}")
+
+        def full_sort(query):
+            scores = (raw @ query) / (np.linalg.norm(raw, axis=1) * np.linalg.norm(query))
+            return np.argsort(-scores, kind="stable")[:args.k]
+
+        methods = [
+            ("full sort, numpy", full_sort),
+            ("normalized + argpartition", lambda q: [row for row, _ in retriever.search(q, args.k)]),
+        ]
+        if not args.skip_brute_force:
+            methods.insert(0, ("brute force (route.ts)", lambda q: brute_force_search(raw, q, args.k)))
+
+        rows, baseline_p50, reference, mismatches = [], None, None, 0
+        for label, fn in methods:
+            timings, results = [], []
+            for query in queries:
+                start = time.perf_counter()
+                results.append(list(fn(query)))
+                timings.append(time.perf_counter() - start)
+            if reference is None:
+                reference = results
+            mismatches += sum(set(a) != set(b) for a, b in zip(reference, results))
+            row, p50 = _latency_row(label, timings, baseline_p50)
+            baseline_p50 = baseline_p50 or p50
+            rows.append(row)
+        retriever.close()
+
+    _print_table(["method", "p50 ms", "p99 ms", "speedup"], rows)
+    print(f"Top-{args.k} mismatches vs the first method: {mismatches}")
+
+
+def bench_ann(args):
+    """IVF recall@k and latency against exact search, for a range of nprobe values."""
+    import tempfile
+    import numpy as np
+    from ann_index import build_index
+    from retrieval import Retriever
+
+    with tempfile.TemporaryDirectory() as tmp:
+        kb_dir = args.kb
+        if kb_dir is None:
+            kb_dir = Path(tmp) / "kb"
+            _synthetic_store(kb_dir, args.n, args.dim, topics=args.topics)
+        start = time.perf_counter()
+        index = build_index(kb_dir, args.nlist)
+        build_seconds = time.perf_counter() - start
+        retriever = Retriever(kb_dir)
+
+        # Queries are perturbed store rows, like a question phrased close to a chunk
+        rng = np.random.default_rng(1)
+        picks = rng.choice(len(retriever), args.queries, replace=False)
+        queries = np.array(retriever.vectors[picks]) + 0.5 * rng.standard_normal((args.queries, retriever.dim)).astype(np.float32) / np.sqrt(retriever.dim)
+        print(f"{len(retriever)} vectors x {retriever.dim}d, {index.nlist} lists (built in {build_seconds:.1f}s), "
+              f"{args.queries} queries, k={args.k}")
+
+        rows, exact, baseline_p50 = [], None, None
+        for nprobe in [0] + args.nprobe:
+            timings, results = [], []
+            for query in queries:
+                start = time.perf_counter()
+                results.append({row for row, _ in retriever.search(query, args.k, nprobe=nprobe)})
+                timings.append(time.perf_counter() - start)
+            if exact is None:
+                exact = results
+            recall = np.mean([len(a & b) / len(a) for a, b in zip(exact, results)])
+            row, p50 = _latency_row("exact" if nprobe == 0 else f"nprobe {nprobe}", timings, baseline_p50)
+            baseline_p50 = baseline_p50 or p50
+            rows.append(row + [f"{recall:.3f}"])
+        retriever.close()
+
+    _print_table(["search", "p50 ms", "p99 ms", "speedup", f"recall@{args.k}"], rows)
+
+
+def _sample_eval_queries(retriever, n, words=6, seed=0):
+    """Keyword-style eval queries: a short span of words lifted from a random chunk.
+
+    Every row containing the span counts as relevant.
+    """
+    import random
+
+    rng = random.Random(seed)
+    texts = [chunk["text"] for chunk in retriever.reader.iter_chunks()]
+    queries = []
+    for row in rng.sample(range(len(texts)), min(n, len(texts))):
+        tokens = texts[row].split()
+        if len(tokens) < words:
+            continue
+        start = rng.randrange(len(tokens) - words + 1)
+        span = " ".join(tokens[start:start + words])
+        queries.append({"query": span, "relevant": [i for i, t in enumerate(texts) if span in t]})
+    return queries
+
+
+def _load_eval_queries(path, retriever):
+    """Read {"query", "relevant": [rows]} or {"query", "expect": substring} lines from a JSONL file."""
+    import json
+
+    texts = None
+    queries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if "relevant" not in item:
+                if texts is None:
+                    texts = [chunk["text"] for chunk in retriever.reader.iter_chunks()]
+                item["relevant"] = [i for i, t in enumerate(texts) if item["expect"].lower() in t.lower()]
+            queries.append(item)
+    return queries
+
+
+def bench_hybrid(args):
+    """Offline eval: hit-rate@k and per-query latency for vector, BM25 and fused retrieval."""
+    import numpy as np
+    from bm25_index import refresh_index
+    from embedder import LocalEmbedder
+    from retrieval import Retriever
+
+    refresh_index(args.kb)
+    retriever = Retriever(args.kb)
+    queries = (_load_eval_queries(args.eval, retriever) if args.eval
+               else _sample_eval_queries(retriever, args.queries))
+    queries = [q for q in queries if q["relevant"]]
+    print(f"{len(queries)} eval queries against {len(retriever)} chunks, k={args.k}")
+
+    methods = [("bm25", lambda q, v: [row for row, _ in retriever.bm25.search(q["query"], args.k)])]
+    embeddings = None
+    try:
+        embedder = LocalEmbedder(retriever.model, backend=args.backend)
+        start = time.perf_counter()
+        embeddings = embedder.encode([q["query"] for q in queries])
+        print(f"Query embedding: {1000 * (time.perf_counter() - start) / len(queries):.2f} ms/query (not included below)")
+    except Exception as e:
+        print(f"Could not embed queries with {retriever.model} ({str(e)[:80]}); evaluating BM25 only")
+    if embeddings is not None:
+        methods.insert(0, ("vector", lambda q, v: [row for row, _ in retriever.search(v, args.k)]))
+        methods.append(("hybrid (RRF)", lambda q, v: [row for row, _ in retriever.hybrid_search(v, q["query"], args.k)]))
+
+    rows = []
+    for label, fn in methods:
+        timings, hits = [], 0
+        for i, query in enumerate(queries):
+            vector = embeddings[i] if embeddings is not None else None
+            start = time.perf_counter()
+            found = fn(query, vector)
+            timings.append(time.perf_counter() - start)
+            hits += bool(set(found) & set(query["relevant"]))
+        timings = np.sort(timings) * 1000
+        rows.append([label, f"{hits / len(queries):.3f}", f"{timings[len(timings) // 2]:.2f}",
+                     f"{timings[min(len(timings) - 1, int(len(timings) * 0.99))]:.2f}"])
+    retriever.close()
+
+    _print_table(["retrieval", f"hit@{args.k}", "p50 ms", "p99 ms"], rows)
+
+
+def bench_filters(args):
+    """Filtered search latency against the size of the matching subset."""
+    import tempfile
+    import numpy as np
+    from metadata_index import build_index
+    from retrieval import Retriever
+
+    filters = [
+        ("none", None),
+        ("ticker=WMT", {"ticker": "WMT"}),
+        ("WMT 10-K", {"ticker": "WMT", "filing_type": "10-K"}),
+        ("WMT 10-K after 2023", {"ticker": "WMT", "filing_type": "10-K", "filing_date": {"gte": "2024"}}),
+        ("WMT 10-K in Jan 2024", {"ticker": "WMT", "filing_type": "10-K",
+                                 "filing_date": {"gte": "2024-01-01", "lt": "2024-02-01"}}),
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        kb_dir = Path(tmp) / "kb"
+        _synthetic_store(kb_dir, args.n, args.dim, metadata=True)
+        build_index(kb_dir)
+        retriever = Retriever(kb_dir)
+        queries = np.random.default_rng(1).standard_normal((args.queries, retriever.dim)).astype(np.float32)
+        print(f"{len(retriever)} vectors x {retriever.dim}d, {args.queries} queries, k={args.k}")
+
+        rows = []
+        for label, spec in filters:
+            matched = len(retriever.filter_rows(spec)) if spec else len(retriever)
+            timings = []
+            for query in queries:
+                start = time.perf_counter()
+                retriever.search(query, args.k, filters=spec)
+                timings.append(time.perf_counter() - start)
+            row, _ = _latency_row(label, timings)
+            rows.append([row[0], matched, f"{100.0 * matched / len(retriever):.2f}%", row[1], row[2]])
+        retriever.close()
+
+    _print_table(["filter", "rows", "subset", "p50 ms", "p99 ms"], rows)
+
+
+def _process_cpu_seconds(pid):
+    """User + system CPU seconds of a running process, or None off Linux."""
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    # utime and stime are fields 14 and 15 of /proc/<pid>/stat
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def bench_serve(args):
+    """Load test against a twin_server.py subprocess: p50/p99 latency, req/s and req/s per CPU core."""
+    import json
+    import socket
+    import tempfile
+    import threading
+    import http.client
+    import numpy as np
+
+    with tempfile.TemporaryDirectory() as tmp:
+        twins_dir = Path(tmp) / "twins"
+        _synthetic_store(twins_dir / "bench" / "kb", args.n, args.dim, topics=args.topics)
+        twins_file = Path(tmp) / "twins.json"
+        twins_file.write_text(json.dumps([{"id": "bench", "name": "Benchmark", "isActive": True}]))
+
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        cmd = [sys.executable, str(SCRIPTS_DIR / "twin_server.py"), "--twins-file", str(twins_file),
+               "--twins-dir", str(twins_dir), "--port", str(port), "--quiet", "--poll-interval", "0",
+               "--cache-size", str(args.cache_size)]
+        server = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        try:
+            for line in server.stdout:
+                if "listening" in line:
+                    break
+            else:
+                raise RuntimeError("twin_server.py exited before it started listening")
+
+            rng = np.random.default_rng(1)
+            bodies = [json.dumps({"twin": "bench", "embedding": v.tolist(), "k": args.k, "nprobe": args.nprobe})
+                      for v in rng.standard_normal((args.distinct, args.dim)).astype(np.float32)]
+            latencies = [[] for _ in range(args.clients)]
+            errors = []
+            deadline = [0.0]
+
+            def client(i):
+                conn = http.client.HTTPConnection("127.0.0.1", port)
+                n = i
+                while time.perf_counter() < deadline[0]:
+                    start = time.perf_counter()
+                    conn.request("POST", "/search", bodies[n % len(bodies)], {"Content-Type": "application/json"})
+                    response = conn.getresponse()
+                    response.read()
+                    latencies[i].append(time.perf_counter() - start)
+                    if response.status != 200:
+                        errors.append(response.status)
+                    n += args.clients
+                conn.close()
+
+            threads = [threading.Thread(target=client, args=(i,)) for i in range(args.clients)]
+            cpu_before = _process_cpu_seconds(server.pid)
+            started = time.perf_counter()
+            deadline[0] = started + args.duration
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - started
+            cpu_after = _process_cpu_seconds(server.pid)
+        finally:
+            server.terminate()
+            server.wait()
+
+    timings = sorted(t for per_client in latencies for t in per_client)
+    requests = len(timings)
+    row, _ = _latency_row(f"{args.clients} clients", timings)
+    cpu = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+    print(f"{args.n} vectors x {args.dim}d, nprobe {args.nprobe}, result cache {'off' if not args.cache_size else 'on'}, "
+          f"{args.duration:.0f}s")
+    _print_table(["load", "requests", "req/s", "p50 ms", "p99 ms", "server CPU s", "req/s per core"], [[
+        row[0], requests, f"{requests / elapsed:.0f}", row[1], row[2],
+        f"{cpu:.1f}" if cpu is not None else "n/a",
+        f"{requests / cpu:.0f}" if cpu else "n/a",
+    ]])
+    if errors:
+        print(f"{len(errors)} non-200 responses")
+        sys.exit(1)
+
+
+def fixed_window_chunks(text, chunk_size=1000, overlap=200):
+    """The original per-ingester chunker: fixed character windows over the joined text."""
+    chunks = []
+    start = 0
+    while start < len(text):
+        chunks.append(text[start:start + chunk_size])
+        start += chunk_size - overlap
+    return chunks
+
+
+def _synthetic_transcripts(videos, minutes, seed=0, punctuated=True):
+    """Caption cues shaped like YouTube's: ~2.5 s each, 4-10 words, sentences running across cues."""
+    import random
+
+    rng = random.Random(seed)
+    vocabulary = [w for w in """
+        the market growth store customers price data team product video people think really
+        going know because supply chain inventory quarter revenue margin online delivery local
+        county report crime health budget code enforcement dashboard traffic policy build ship
+        learn why what good great simple fast model query search index cache server rust python
+    """.split()]
+    transcripts = []
+    for _ in range(videos):
+        cues, t = [], 0.0
+        while t < minutes * 60:
+            sentence_left = rng.randint(6, 24)
+            while sentence_left and t < minutes * 60:
+                n = min(rng.randint(4, 10), sentence_left)
+                cue_words = [rng.choice(vocabulary) for _ in range(n)]
+                sentence_left -= n
+                if not sentence_left and punctuated:
+                    cue_words[-1] += rng.choice(".....?!")
+                cues.append((round(t, 3), round(t + 2.5, 3), " ".join(cue_words)))
+                t += 2.5
+        transcripts.append(cues)
+    return transcripts
+
+
+def bench_chunking(args):
+    """Fixed 1000/200-char windows over joined transcripts vs the streaming sentence chunker."""
+    from chunker import SENTENCE_END_RE, chunk_cues
+
+    transcripts = _synthetic_transcripts(args.videos, args.minutes, punctuated=not args.unpunctuated)
+    source_chars = sum(len(text) + 1 for cues in transcripts for _, _, text in cues)
+
+    def fixed(corpus):
+        return [chunk for cues in corpus for chunk in fixed_window_chunks(" ".join(text for _, _, text in cues))]
+
+    def streaming(corpus):
+        return [chunk["text"] for cues in corpus
+                for chunk in chunk_cues(cues, args.chunk_tokens, args.chunk_overlap)]
+
+    embedder = None
+    if args.embed:
+        from embedder import LocalEmbedder
+        embedder = LocalEmbedder(backend=args.backend, device=args.device)
+        embedder.encode(["warm up"])
+
+    rows = []
+    baseline_chunks = None
+    for label, fn in (("fixed 1000/200 chars", fixed),
+                      (f"sentences {args.chunk_tokens}/{args.chunk_overlap} tokens", streaming)):
+        elapsed, chunks = _throughput(fn, transcripts, args.runs)
+        embedded_chars = sum(len(c) for c in chunks)
+        # A chunk that ends mid-sentence splits that sentence across two embeddings
+        clean = sum(1 for c in chunks if SENTENCE_END_RE.match(c[-1] + " "))
+        baseline_chunks = baseline_chunks or len(chunks)
+        row = [label, f"{elapsed * 1000:.0f}", f"{source_chars / elapsed / 1e6:.1f}", len(chunks),
+               f"{len(chunks) / baseline_chunks:.2f}x", f"{embedded_chars / source_chars:.2f}x",
+               f"{100 * clean / len(chunks):.0f}%"]
+        if embedder is not None:
+            # Encoder cost grows with the text it is given, so this is where the saving shows
+            start = time.perf_counter()
+            embedder.encode(chunks)
+            encode = time.perf_counter() - start
+            row += [f"{encode:.1f}", f"{encode + elapsed:.1f}"]
+        rows.append(row)
+
+    print(f"{args.videos} transcripts x {args.minutes} min, {source_chars / 1e6:.1f}M chars"
+          f"{' (unpunctuated)' if args.unpunctuated else ''}")
+    headers = ["chunker", "chunk ms", "MB/s", "chunks", "vs fixed", "chars embedded / source", "end on sentence"]
+    if embedder is not None:
+        headers += ["encode s", "total s"]
+    _print_table(headers, rows)
+
+
+def _rolling_captions(cues):
+    """Auto-caption style: every cue shows the previous line again above the new one."""
+    rolled = []
+    for i, (start, end, text) in enumerate(cues):
+        if i:
+            rolled.append((start, end, cues[i - 1][2]))
+        rolled.append((start, end, text))
+    return rolled
+
+
+def bench_dedup(args):
+    """Chunks and embedding time removed by cue- and chunk-level near-duplicate filtering."""
+    from chunker import chunk_cues, chunk_text
+    from dedup import Deduplicator
+
+    transcripts = _synthetic_transcripts(args.videos, args.minutes, seed=1)
+    # Pages share a navigation/disclaimer block, like the scraped BCstat pages
+    texts = [" ".join(text for _, _, text in cues) for cues in _synthetic_transcripts(args.pages + 1, 3, seed=2)]
+    boilerplate, bodies = texts[0], texts[1:]
+    corpora = (
+        ("distinct transcripts", [("cues", cues) for cues in transcripts]),
+        ("rolling captions", [("cues", _rolling_captions(cues)) for cues in transcripts]),
+        ("pages + boilerplate", [("text", boilerplate + "\n\n" + body) for body in bodies]),
+    )
+
+    seconds_per_chunk = None
+    if args.embed:
+        from embedder import LocalEmbedder
+        embedder = LocalEmbedder(backend=args.backend, device=args.device)
+        sample = [c["text"] for c in chunk_cues(transcripts[0])]
+        embedder.encode(sample[:8])
+        start = time.perf_counter()
+        embedder.encode(sample)
+        seconds_per_chunk = (time.perf_counter() - start) / len(sample)
+
+    def chunked(kind, item, dedup):
+        if kind == "cues":
+            return list(chunk_cues(dedup.cues(item) if dedup else item))
+        return list(chunk_text(item))
+
+    rows = []
+    for label, corpus in corpora:
+        before = sum(len(chunked(kind, item, None)) for kind, item in corpus)
+        dedup = Deduplicator(threshold=args.threshold)
+        start = time.perf_counter()
+        after = sum(len(dedup.filter_chunks(chunked(kind, item, dedup))) for kind, item in corpus)
+        elapsed = time.perf_counter() - start
+        removed = before - after
+        row = [label, dedup.cues_removed, before, after, f"{100 * removed / before:.0f}%", f"{elapsed * 1000:.0f}"]
+        if seconds_per_chunk is not None:
+            row.append(f"{removed * seconds_per_chunk:.1f}")
+        rows.append(row)
+
+    headers = ["corpus", "cues removed", "chunks", "after dedup", "removed", "chunk+dedup ms"]
+    if seconds_per_chunk is not None:
+        headers.append("embed s saved")
+    print(f"{args.videos} transcripts x {args.minutes} min, {args.pages} pages, threshold {args.threshold}")
+    _print_table(headers, rows)
+
+
+def line_filter_transcript(vtt_content):
+    """The original get_transcript() VTT handling: drop header/timing lines, join the rest."""
+    texts = []
+    for line in vtt_content.split('\n'):
+        line = line.strip()
+        if (line and
+            not line.startswith('WEBVTT') and
+            not '-->' in line and
+            not line.isdigit() and
+            not line.startswith('NOTE') and
+            not line.startswith('Kind:') and
+            not line.startswith('Language:')):
+            texts.append(line)
+    return " ".join(texts).strip()
+
+
+def _vtt_timestamp(seconds):
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{seconds:06.3f}"
+
+
+def _auto_caption_vtt(cues):
+    """Render cues the way YouTube serves auto-captions: word timing tags, rolling lines, snapshot cues."""
+    out = ["WEBVTT", "Kind: captions", "Language: en", ""]
+    previous = None
+    for start, end, text in cues:
+        words = text.split()
+        step = (end - start) / len(words)
+        tagged = words[0] + "".join(f"<{_vtt_timestamp(start + i * step)}><c> {w}</c>"
+                                    for i, w in enumerate(words[1:], 1))
+        out += [f"{_vtt_timestamp(start)} --> {_vtt_timestamp(end - 0.01)} align:start position:0%", " "]
+        if previous:
+            out[-1:] = [previous]
+        out += [tagged, ""]
+        out += [f"{_vtt_timestamp(end - 0.01)} --> {_vtt_timestamp(end)} align:start position:0%", text, " ", ""]
+        previous = text
+    return "\n".join(out)
+
+
+def _check_caption_fixtures():
+    """Parse every fixture and compare with its .json expectation; returns table rows and failures."""
+    import io
+    import json
+    from captions import parse_srv3, parse_vtt
+
+    rows, failures = [], 0
+    for path in sorted(CAPTION_FIXTURES.glob("*")):
+        if path.suffix == ".json":
+            continue
+        # Expected cues for name.vtt live in name.vtt.json
+        expected = json.loads(path.with_name(path.name + ".json").read_text(encoding="utf-8"))
+        if path.suffix == ".vtt":
+            cues = list(parse_vtt(io.StringIO(path.read_text(encoding="utf-8"))))
+        else:
+            cues = list(parse_srv3(str(path)))
+        ok = len(cues) == len(expected) and all(
+            abs(c[0] - e[0]) < 1e-6 and abs(c[1] - e[1]) < 1e-6 and c[2] == e[2] for c, e in zip(cues, expected))
+        failures += not ok
+        rows.append([path.name, len(cues), "ok" if ok else f"FAIL: {cues!r}"])
+    return rows, failures
+
+
+def _check_store_rebuild():
+    """--full over an existing store: the revision must go up and the indexes must follow the new rows."""
+    import tempfile
+    import numpy as np
+    from ann_index import refresh_index as refresh_ann_index
+    from bm25_index import refresh_index as refresh_bm25_index
+    from chunker import chunk_source
+    from kb_store import read_header
+    from manifest import IngestManifest
+    from metadata_index import refresh_index as refresh_metadata_index
+    from pipeline import ingest
+    from retrieval import Retriever
+
+    rng = np.random.default_rng(0)
+    embed = lambda chunks: rng.random((len(chunks), 8))
+    sources = [{"key": f"doc{i}", "text": f"Rebuild check document number {i}.", "metadata": {"n": i}}
+               for i in range(3)]
+    rows, failures = [], 0
+    with tempfile.TemporaryDirectory() as kb_dir:
+        revisions = []
+        for label, run_sources, full in (("first ingest", sources, False), ("--full rebuild", sources[:2], True)):
+            ingest(kb_dir, IngestManifest.load(kb_dir), iter(run_sources), chunk_source, embed,
+                   model="check", full=full)
+            refresh_bm25_index(kb_dir)
+            refresh_metadata_index(kb_dir)
+            # Built once, as --ann-rebuild would; the rebuild must keep it current however small the store is
+            refresh_ann_index(kb_dir, force=not full)
+            header = read_header(kb_dir)
+            revisions.append(header["revision"])
+            retriever = Retriever(kb_dir)
+            problems = []
+            if len(revisions) > 1 and revisions[-1] <= revisions[-2]:
+                problems.append(f"revision {revisions[-2]} -> {revisions[-1]}")
+            for name, index in (("bm25", retriever.bm25), ("metadata", retriever.metadata), ("ann", retriever.ann)):
+                if index is None or index.count != header["count"]:
+                    problems.append(f"{name} index not rebuilt")
+            if retriever.bm25 is not None and any(row >= header["count"]
+                                                  for row, _ in retriever.bm25.search("document", 5)):
+                problems.append("bm25 returned a deleted row")
+            retriever.reader.close()
+            failures += bool(problems)
+            rows.append([label, f"rev {header['revision']}, {header['count']} rows",
+                         "ok" if not problems else "FAIL: " + "; ".join(problems)])
+    return rows, failures
+
+
+def _check_chunk_overlap():
+    """Consecutive chunks must share text, with and without sentence punctuation."""
+    from chunker import chunk_cues
+
+    rows, failures = [], 0
+    for label, punctuated in (("punctuated cues", True), ("unpunctuated cues", False)):
+        cues = _synthetic_transcripts(1, 15, seed=4, punctuated=punctuated)[0]
+        chunks = [chunk["text"] for chunk in chunk_cues(cues, 240, 32)]
+        # The start of each chunk repeats the end of the one before it
+        missing = sum(1 for prev, chunk in zip(chunks, chunks[1:]) if chunk.split()[0] not in prev[-32 * 4:])
+        failures += bool(missing)
+        rows.append([label, len(chunks), "ok" if not missing else f"FAIL: {missing} chunks without overlap"])
+    return rows, failures
+
+
+def _check_cue_dedup():
+    """Short cues that differ must survive cue dedup; rolling repeats must not."""
+    from dedup import Deduplicator
+
+    line = "so the next thing we want to do is open the settings page"
+    cases = (
+        ("reordered short cues", ["the dog bit the man", "the man bit the dog"], 2),
+        ("short cues, punctuation differs", ["because.", "because!"], 2),
+        ("repeated short cue", ["okay let's go", "Okay  let's go"], 1),
+        ("rolling long cue", [line, line.capitalize() + ".", "and then click save"], 2),
+    )
+    rows, failures = [], 0
+    for label, texts, expected in cases:
+        kept = list(Deduplicator().cues((i, i + 1, text) for i, text in enumerate(texts)))
+        ok = len(kept) == expected
+        failures += not ok
+        rows.append([label, f"{len(kept)} of {len(texts)}", "ok" if ok else f"FAIL: expected {expected} kept"])
+    return rows, failures
+
+
+def check_fixtures(args):
+    """Parser fixtures and store invariants, with nothing timed; exits 1 on any failure."""
+    rows, failures = _check_caption_fixtures()
+    _print_table(["caption fixture", "cues", "result"], rows)
+    print()
+    html_rows, html_failures = _check_html_fixtures()
+    _print_table(["html fixture", "chars", "result"], html_rows)
+    print()
+    chunk_rows, chunk_failures = _check_chunk_overlap()
+    _print_table(["chunk overlap", "chunks", "result"], chunk_rows)
+    print()
+    dedup_rows, dedup_failures = _check_cue_dedup()
+    _print_table(["cue dedup", "kept", "result"], dedup_rows)
+    print()
+    store_rows, store_failures = _check_store_rebuild()
+    _print_table(["store check", "state", "result"], store_rows)
+    if failures or html_failures or chunk_failures or dedup_failures or store_failures:
+        sys.exit(1)
+
+
+def bench_captions(args):
+    """Caption parser throughput on large auto-caption files (fixture correctness: the fixtures command)."""
+    import io
+    from captions import parse_vtt
+
+    transcripts = _synthetic_transcripts(1, args.hours * 60, punctuated=False, seed=3)
+    source_words = sum(len(text.split()) for _, _, text in transcripts[0])
+    vtt = _auto_caption_vtt(transcripts[0])
+    megabytes = len(vtt.encode("utf-8")) / 1e6
+
+    def legacy(content):
+        return line_filter_transcript(content)
+
+    def streaming(content):
+        return list(parse_vtt(io.StringIO(content)))
+
+    rows = []
+    for label, fn, text_of in (("line filter (joined text)", legacy, lambda r: r),
+                               ("parse_vtt (cues)", streaming, lambda r: " ".join(c[2] for c in r))):
+        elapsed, result = _throughput(fn, vtt, args.runs)
+        text = text_of(result)
+        rows.append([label, f"{elapsed * 1000:.0f}", f"{megabytes / elapsed:.1f}", text.count("<"),
+                     f"{len(text.split()) / source_words:.2f}x"])
+
+    print(f"{args.hours:g} hours of rolling auto-captions, {megabytes:.1f} MB of VTT")
+    _print_table(["parser", "ms", "MB/s", "tags leaked", "words / spoken words"], rows)
+
+
+def soup_filing_text(html):
+    """The original download_filing_text() extraction: BeautifulSoup tree, get_text(), re-split and join."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+    for script in soup(["script", "style"]):
+        script.decompose()
+    text = soup.get_text()
+    lines = (line.strip() for line in text.splitlines())
+    chunks_text = (phrase.strip() for line in lines for phrase in line.split("  "))
+    return ' '.join(chunk for chunk in chunks_text if chunk)
+
+
+def _synthetic_filing(megabytes, seed=0):
+    """Inline XBRL 10-K-like HTML: a large hidden ix:header, styled spans, tagged facts and tables."""
+    import random
+
+    rng = random.Random(seed)
+    vocabulary = [f"word{i}" for i in range(5000)]
+    target = int(megabytes * 1e6)
+    # Hidden facts and contexts run to a fifth of a real filing; every one should be dropped
+    hidden = "".join(
+        f'<ix:nonNumeric name="dei:Fact{i}" contextRef="c-{i}">HIDDENFACT{i}</ix:nonNumeric>'
+        f'<xbrli:context id="c-{i}"><xbrli:entity><xbrli:identifier scheme="http://www.sec.gov/CIK">'
+        f'0000999999</xbrli:identifier></xbrli:entity></xbrli:context>'
+        for i in range(target // 5 // 260))
+    parts = ['<?xml version="1.0" encoding="utf-8"?><html xmlns:ix="http://www.xbrl.org/2013/inlineXBRL"><head>'
+             '<title>bench-10k</title><style>p{margin:0}</style></head><body>'
+             f'<div style="display:none"><ix:header><ix:hidden>{hidden}</ix:hidden></ix:header></div>']
+    size = len(parts[0])
+    while size < target:
+        if rng.random() < 0.2:
+            rows = "".join(
+                f'<tr><td style="padding:2px"><span style="font-family:Arial">{rng.choice(vocabulary)}</span></td>'
+                f'<td><span>$</span></td><td><span><ix:nonFraction name="us-gaap:Revenues" contextRef="c-1" '
+                f'unitRef="usd" decimals="-6">{rng.randint(1, 999999):,}</ix:nonFraction></span></td></tr>'
+                for _ in range(8))
+            block = f"<table>{rows}</table>"
+        else:
+            words = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(40, 120)))
+            block = (f'<div style="margin-top:6pt;text-align:justify"><span style="font-family:Arial;'
+                     f'font-size:10pt">{words}.</span></div>')
+        parts.append(block)
+        size += len(block)
+    parts.append("</body></html>")
+    return "".join(parts).encode("utf-8")
+
+
+def _check_html_fixtures():
+    """Extract every HTML fixture and compare with its .txt expectation; returns table rows and failures."""
+    from html_text import PAGE_CHROME_TAGS, SKIPPED_TAGS, html_to_text
+
+    rows, failures = [], 0
+    for path in sorted(HTML_FIXTURES.glob("*")):
+        if path.suffix == ".txt":
+            continue
+        expected = path.with_name(path.name + ".txt").read_text(encoding="utf-8").rstrip("\n")
+        # page_* fixtures are web pages, extracted the way ingest_bcstat.py does
+        if path.name.startswith("page_"):
+            text = html_to_text(path.read_bytes(), SKIPPED_TAGS | PAGE_CHROME_TAGS, main_only=True)
+        else:
+            text = html_to_text(path.read_bytes())
+        ok = text == expected
+        failures += not ok
+        rows.append([path.name, len(text), "ok" if ok else f"FAIL: {text[:200]!r}"])
+    return rows, failures
+
+
+def bench_html(args):
+    """HTML extractor correctness on the fixtures, then MB/s and peak memory vs BeautifulSoup on a large filing."""
+    import tracemalloc
+    from html_text import html_to_text
+
+    rows, failures = _check_html_fixtures()
+    _print_table(["fixture", "chars", "result"], rows)
+    print()
+
+    html = _synthetic_filing(args.mb)
+    megabytes = len(html) / 1e6
+    rows = []
+    for label, fn in (("BeautifulSoup html.parser", soup_filing_text), ("html_text streaming", html_to_text)):
+        elapsed, text = _throughput(fn, html, args.runs)
+        tracemalloc.start()
+        fn(html)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        rows.append([label, f"{elapsed * 1000:.0f}", f"{megabytes / elapsed:.1f}", f"{peak / 1e6:.0f}",
+                     f"{len(text) / 1e6:.2f}", text.count("HIDDENFACT")])
+
+    print(f"Synthetic inline XBRL filing, {megabytes:.1f} MB")
+    _print_table(["extractor", "ms", "MB/s", "peak MB", "text MB", "hidden facts leaked"], rows)
+    if failures:
+        sys.exit(1)
+
+
+# Items each fixture filing should split into (TOC entries ignored), cover included
+FIXTURE_ITEMS = {"filing_ixbrl.htm": ["cover", "1", "1A", "7", "8"]}
+# (Part, Item, share of the filing's text) for a synthetic 10-K; the financials dominate
+SYNTHETIC_10K_ITEMS = (
+    ("I", "1", 0.08), ("I", "1A", 0.10), ("I", "1B", 0.002), ("I", "1C", 0.005), ("I", "2", 0.005),
+    ("I", "3", 0.005), ("I", "4", 0.001), ("II", "5", 0.01), ("II", "6", 0.001), ("II", "7", 0.15),
+    ("II", "7A", 0.01), ("II", "8", 0.35), ("II", "9", 0.002), ("II", "9A", 0.01), ("II", "9B", 0.002),
+    ("III", "10", 0.005), ("III", "11", 0.005), ("III", "12", 0.005), ("III", "13", 0.005),
+    ("III", "14", 0.005), ("IV", "15", 0.2), ("IV", "16", 0.001),
+)
+# What ingest_edgar.py used to keep of every filing
+LEGACY_FILING_CHARS = 500000
+
+
+def _synthetic_10k(megabytes, seed=0):
+    """10-K-like HTML with a cover page, a table of contents and SYNTHETIC_10K_ITEMS sized sections."""
+    import random
+    from edgar_sections import ITEM_TITLES
+
+    rng = random.Random(seed)
+    vocabulary = [f"word{i}" for i in range(5000)]
+    target = int(megabytes * 1e6)
+
+    def paragraphs(chars):
+        written = 0
+        while written < chars:
+            words = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(40, 120)))
+            block = f'<div><span style="font-family:Arial">{words}.</span></div>'
+            written += len(block)
+            yield block
+
+    parts = ['<html><body><div style="text-align:center"><span>FORM 10-K</span></div>']
+    parts.extend(paragraphs(target * 0.02))
+    parts.append('<table>')
+    parts.extend(f'<tr><td>Item {item}.</td><td>{ITEM_TITLES[item]}</td><td>{page}</td></tr>'
+                 for page, (_, item, _) in enumerate(SYNTHETIC_10K_ITEMS, start=3))
+    parts.append('</table>')
+    current_part = None
+    for part, item, share in SYNTHETIC_10K_ITEMS:
+        if part != current_part:
+            parts.append(f'<div><span style="font-weight:700">PART {part}</span></div>')
+            current_part = part
+        parts.append(f'<div><span style="font-weight:700">Item&#160;{item}. {ITEM_TITLES[item]}</span></div>')
+        parts.extend(paragraphs(target * share))
+    parts.append("</body></html>")
+    return "".join(parts).encode("utf-8")
+
+
+def bench_sections(args):
+    """Item splitting on the fixtures, then text kept and chunks to embed: 500k truncation vs selected Items."""
+    from chunker import chunk_sections, chunk_text
+    from edgar_sections import DEFAULT_ITEMS, filing_sections
+    from html_text import html_blocks
+
+    rows, failures = [], 0
+    for name, expected in FIXTURE_ITEMS.items():
+        found = [section["item"] for section in filing_sections(html_blocks((HTML_FIXTURES / name).read_bytes()))]
+        ok = found == expected
+        failures += not ok
+        rows.append([name, ", ".join(found), "ok" if ok else f"FAIL: expected {', '.join(expected)}"])
+    _print_table(["fixture", "items", "result"], rows)
+    print()
+
+    html = _synthetic_10k(args.mb)
+    start = time.perf_counter()
+    blocks = list(html_blocks(html))
+    every = filing_sections(blocks)
+    elapsed = time.perf_counter() - start
+    text = "\n\n".join(blocks)
+    wanted = DEFAULT_ITEMS["10-K"]
+    selected = [section for section in every if section["item"] in wanted]
+    expected = [item for _, item, _ in SYNTHETIC_10K_ITEMS]
+    failures += [section["item"] for section in every[1:]] != expected
+
+    # How much of the wanted Items' text falls inside the old truncation
+    wanted_chars = sum(len(section["text"]) for section in selected)
+    truncated_chars = 0
+    for section in selected:
+        begin = text.find(section["text"])
+        truncated_chars += max(0, min(begin + len(section["text"]), LEGACY_FILING_CHARS) - begin)
+
+    rows = []
+    for label, kept_chars, covered, chunks in (
+            (f"first {LEGACY_FILING_CHARS:,} chars", min(len(text), LEGACY_FILING_CHARS), truncated_chars,
+             chunk_text(text[:LEGACY_FILING_CHARS])),
+            (f"Items {','.join(wanted)}", wanted_chars, wanted_chars,
+             chunk_sections({"text": s["text"], "metadata": {"item": s["item"]}} for s in selected)),
+            ("every Item", sum(len(section["text"]) for section in every), wanted_chars,
+             chunk_sections({"text": s["text"], "metadata": {"item": s["item"]}} for s in every))):
+        rows.append([label, f"{kept_chars / 1e6:.2f}", sum(1 for _ in chunks), f"{covered / wanted_chars:.0%}"])
+
+    print(f"Synthetic 10-K, {len(html) / 1e6:.1f} MB of HTML, {len(text) / 1e6:.2f} MB of text, "
+          f"{len(every) - 1} Items found in {elapsed * 1000:.0f} ms")
+    _print_table(["kept", "text MB", "chunks", f"of Items {','.join(wanted)}"], rows)
+    if failures:
+        sys.exit(1)
+
+
+def bench_http(args):
+    """Bare requests.get vs the pooled HttpClient against an in-process stub: throughput,
+    revalidation, retries through injected 503s, the on-disk response cache (including
+    offline) and the per-host rate limit."""
+    import re
+    import random
+    import tempfile
+    import threading
+    import requests
+    from http_client import HttpClient
+    from query_cache import TTLCache
+    from response_cache import IMMUTABLE, ResponseCache
+    from stub_server import make_server
+
+    rng = random.Random(0)
+    vocabulary = [f"word{i}" for i in range(2000)]
+    with tempfile.TemporaryDirectory() as tmp:
+        static_dir = Path(tmp) / "static"
+        static_dir.mkdir()
+        for i in range(args.files):
+            words = [rng.choice(vocabulary) for _ in range(args.kb * 1024 // 8)]
+            (static_dir / f"doc{i}.html").write_text(" ".join(words), encoding="utf-8")
+
+        server = make_server(port=0, static_dir=static_dir)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_address[1]}/static"
+        urls = [f"{base}/doc{i}.html" for i in range(args.files)]
+        stats = server.stats
+
+        def timed(label, fetch, client=None):
+            before = dict(stats)
+            start = time.perf_counter()
+            failures = sum(fetch(url).status_code != 200 for url in urls)
+            elapsed = time.perf_counter() - start
+            return [label, len(urls), f"{len(urls) / elapsed:.0f}", stats["not_modified"] - before["not_modified"],
+                    client.cached if client else 0, f"{(stats['bytes_sent'] - before['bytes_sent']) / 1e6:.2f}",
+                    client.retries if client else 0, failures]
+
+        rows = [timed("requests.get", lambda url: requests.get(url, timeout=30))]
+        client = HttpClient(rate=0, cache=TTLCache(args.files, ttl=0))
+        rows.append(timed("HttpClient, first pass", client.get, client))
+        rows.append(timed("HttpClient, revalidated", client.get, client))
+        server.fail_every = 3
+        retrying = HttpClient(rate=0)
+        rows.append(timed("HttpClient, 503 every 3rd", lambda url: retrying.get(url, conditional=False), retrying))
+        server.fail_every = 0
+
+        # Loopback URLs stand in for EDGAR archive documents, which never change
+        rules = [(re.compile(r"^http://127\.0\.0\.1"), IMMUTABLE)]
+        cache_path = Path(tmp) / "responses.sqlite"
+        for label in ("ResponseCache, first run", "ResponseCache, rerun"):
+            cached = HttpClient(rate=0, cache=ResponseCache(cache_path), cache_rules=rules)
+            rows.append(timed(label, cached.get, cached))
+            cached.close()
+
+        limited = HttpClient(rate=0, host_rates={"127.0.0.1": args.rate})
+        n = int(args.rate * 3)
+        start = time.perf_counter()
+        for i in range(n):
+            limited.get(urls[i % len(urls)], conditional=False)
+        observed = (n - 1) / (time.perf_counter() - start)
+        server.shutdown()
+        server.server_close()
+
+        offline = HttpClient(cache=ResponseCache(cache_path), offline=True)
+        rows.append(timed("ResponseCache, offline", offline.get, offline))
+        offline.close()
+
+    print(f"{args.files} files of ~{args.kb} KB over loopback")
+    _print_table(["client", "GETs", "req/s", "304s", "from cache", "MB sent", "retries", "failed"], rows)
+    print(f"\nRate limit {args.rate:g}/s for the host: {n} GETs at {observed:.1f}/s observed")
+    if any(row[-1] for row in rows) or observed > args.rate * 1.05:
+        sys.exit(1)
+
+
+def bench_startup(args):
+    """Time-to-first-useful-work: --help for each ingester, and first encode call."""
+    env = dict(os.environ, PYTHONPATH=str(SCRIPTS_DIR), YOUTUBE_API_KEY=os.getenv("YOUTUBE_API_KEY", "benchmark"))
+    rows = []
+    for script in ("ingest_local.py", "ingest_edgar.py", "ingest_bcstat.py"):
+        timings, rss, code = [], None, 0
+        for _ in range(args.runs):
+            elapsed, rss, code, _ = _run_child([sys.executable, str(SCRIPTS_DIR / script), "--help"], env=env)
+            timings.append(elapsed)
+        rows.append([f"{script} --help", f"{statistics.median(timings):.2f}s",
+                     f"{rss:.0f} MB" if rss is not None else "n/a",
+                     "" if code == 0 else f"exit {code}"])
+
+    first_encode = (
+        "import time; t = time.perf_counter();"
+        "from embedder import get_embedder; e = get_embedder();"
+        "ready = time.perf_counter() - t; e.encode(['hello world']);"
+        "print(f'{ready:.3f} {time.perf_counter() - t:.3f}')"
+    )
+    elapsed, rss, code, output = _run_child([sys.executable, "-c", first_encode], env=env)
+    if code == 0:
+        ready, encoded = output.strip().splitlines()[-1].split()
+        rows.append(["embedder import (unloaded)", f"{float(ready):.2f}s", "", ""])
+        rows.append(["first encode (model load)", f"{float(encoded):.2f}s",
+                     f"{rss:.0f} MB" if rss is not None else "n/a", ""])
+    else:
+        last_line = output.strip().splitlines()[-1] if output.strip() else ""
+        rows.append(["first encode (model load)", "failed", "", last_line[:80]])
+
+    _print_table(["stage", "median wall", "peak RSS", "note"], rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the ingestion and retrieval scripts.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    startup = subparsers.add_parser("startup", help="Ingester startup time and first-encode latency")
+    startup.add_argument("--runs", type=int, default=3, help="Runs per measurement (median is reported)")
+    startup.set_defaults(func=bench_startup)
+
+    backends = subparsers.add_parser("backends", help="Embedding backend throughput and parity")
+    backends.add_argument("--sample", type=str, default=str(DEFAULT_SAMPLE), help="Store dir or knowledge_base.json to take chunk texts from")
+    backends.add_argument("--n", type=int, default=1000, help="Number of chunks to encode")
+    backends.add_argument("--runs", type=int, default=1, help="Timed runs per backend (best is reported)")
+    backends.add_argument("--device", type=str, default="cpu")
+    backends.add_argument("--backends", nargs="+", help="Backends to compare; the first is the parity baseline")
+    backends.add_argument("--min-cosine", type=float, default=0.99, help="Minimum per-chunk cosine vs the baseline")
+    backends.set_defaults(func=bench_backends)
+
+    batching = subparsers.add_parser("batching", help="Fixed-count vs token-budget encode batching")
+    batching.add_argument("--sample", type=str, default=str(DEFAULT_SAMPLE), help="Store dir or knowledge_base.json to take chunk texts from")
+    batching.add_argument("--n", type=int, default=1000, help="Number of chunks to encode")
+    batching.add_argument("--runs", type=int, default=1, help="Timed runs per strategy (best is reported)")
+    batching.add_argument("--device", type=str, default="cpu")
+    batching.add_argument("--backend", type=str, default="torch")
+    batching.add_argument("--token-budget", type=int, default=8192)
+    batching.set_defaults(func=bench_batching)
+
+    workers = subparsers.add_parser("workers", help="Multi-process CPU encode speedup curve")
+    workers.add_argument("--sample", type=str, default=str(DEFAULT_SAMPLE), help="Store dir or knowledge_base.json to take chunk texts from")
+    workers.add_argument("--n", type=int, default=2000, help="Number of chunks to encode")
+    workers.add_argument("--runs", type=int, default=1, help="Timed runs per worker count (best is reported)")
+    workers.add_argument("--backend", type=str, default="torch")
+    workers.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Worker counts to try; the first is the baseline")
+    workers.add_argument("--threads", type=int, default=None, help="Torch threads per worker (default: cores / workers)")
+    workers.add_argument("--max-diff", type=float, default=1e-5, help="Largest allowed element difference vs the baseline")
+    workers.set_defaults(func=bench_workers)
+
+    retrieval = subparsers.add_parser("retrieval", help="Top-k query latency, brute force vs prebuilt index")
+    retrieval.add_argument("--kb", type=str, default=None, help="Store directory to search (default: synthetic store)")
+    retrieval.add_argument("--n", type=int, default=20000, help="Rows in the synthetic store")
+    retrieval.add_argument("--dim", type=int, default=768, help="Dimension of the synthetic store")
+    retrieval.add_argument("--queries", type=int, default=50)
+    retrieval.add_argument("--k", type=int, default=5)
+    retrieval.add_argument("--skip-brute-force", action="store_true", help="Skip the slow per-row baseline")
+    retrieval.set_defaults(func=bench_retrieval)
+
+    ann = subparsers.add_parser("ann", help="IVF index recall and latency vs exact search")
+    ann.add_argument("--kb", type=str, default=None, help="Store directory to index (default: synthetic store); ivf.npz is written into it")
+    ann.add_argument("--n", type=int, default=50000, help="Rows in the synthetic store")
+    ann.add_argument("--dim", type=int, default=384, help="Dimension of the synthetic store")
+    ann.add_argument("--topics", type=int, default=200, help="Clusters in the synthetic store")
+    ann.add_argument("--nlist", type=int, default=None, help="IVF lists (default: 4 * sqrt(rows))")
+    ann.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    ann.add_argument("--queries", type=int, default=200)
+    ann.add_argument("--k", type=int, default=5)
+    ann.set_defaults(func=bench_ann)
+
+    hybrid = subparsers.add_parser("hybrid", help="Hit-rate and latency of vector, BM25 and hybrid retrieval")
+    hybrid.add_argument("--kb", type=str, required=True, help="Store directory to evaluate (a BM25 index is built if missing)")
+    hybrid.add_argument("--eval", type=str, default=None,
+                        help='JSONL of {"query", "relevant": [rows]} or {"query", "expect": substring} (default: sampled spans)')
+    hybrid.add_argument("--queries", type=int, default=200, help="Sampled queries when --eval is not given")
+    hybrid.add_argument("--k", type=int, default=5)
+    hybrid.add_argument("--backend", type=str, default="torch", help="Embedding backend for the queries")
+    hybrid.set_defaults(func=bench_hybrid)
+
+    filters = subparsers.add_parser("filters", help="Metadata-filtered search latency vs subset size")
+    filters.add_argument("--n", type=int, default=200000, help="Rows in the synthetic store")
+    filters.add_argument("--dim", type=int, default=384)
+    filters.add_argument("--queries", type=int, default=50)
+    filters.add_argument("--k", type=int, default=5)
+    filters.set_defaults(func=bench_filters)
+
+    serve = subparsers.add_parser("serve", help="Load test the twin_server.py daemon")
+    serve.add_argument("--n", type=int, default=50000, help="Rows in the synthetic twin")
+    serve.add_argument("--dim", type=int, default=384)
+    serve.add_argument("--topics", type=int, default=200, help="Clusters in the synthetic twin")
+    serve.add_argument("--clients", type=int, default=8, help="Concurrent keep-alive connections")
+    serve.add_argument("--duration", type=float, default=10.0, help="Seconds of load")
+    serve.add_argument("--distinct", type=int, default=1000, help="Distinct query vectors, cycled")
+    serve.add_argument("--k", type=int, default=5)
+    serve.add_argument("--nprobe", type=int, default=0, help="IVF lists per query (the synthetic twin has no index, so exact)")
+    serve.add_argument("--cache-size", type=int, default=0, help="Server result cache size (0 = measure uncached retrieval)")
+    serve.set_defaults(func=bench_serve)
+
+    chunking = subparsers.add_parser("chunking", help="Fixed-window vs streaming sentence chunking")
+    chunking.add_argument("--videos", type=int, default=200, help="Synthetic transcripts")
+    chunking.add_argument("--minutes", type=float, default=15.0, help="Length of each transcript")
+    chunking.add_argument("--unpunctuated", action="store_true", help="Auto-caption style text with no sentence ends")
+    chunking.add_argument("--chunk-tokens", type=int, default=240)
+    chunking.add_argument("--chunk-overlap", type=int, default=32)
+    chunking.add_argument("--runs", type=int, default=3)
+    chunking.add_argument("--embed", action="store_true", help="Also encode each chunker's output with the local model")
+    chunking.add_argument("--backend", type=str, default="torch")
+    chunking.add_argument("--device", type=str, default="cpu")
+    chunking.set_defaults(func=bench_chunking)
+
+    dedup = subparsers.add_parser("dedup", help="Near-duplicate cue and chunk removal")
+    dedup.add_argument("--videos", type=int, default=100, help="Synthetic transcripts")
+    dedup.add_argument("--minutes", type=float, default=15.0, help="Length of each transcript")
+    dedup.add_argument("--pages", type=int, default=50, help="Synthetic pages sharing a boilerplate block")
+    dedup.add_argument("--threshold", type=float, default=0.8, help="Jaccard similarity counted as a duplicate")
+    dedup.add_argument("--embed", action="store_true", help="Time the local model to estimate embedding seconds saved")
+    dedup.add_argument("--backend", type=str, default="torch")
+    dedup.add_argument("--device", type=str, default="cpu")
+    dedup.set_defaults(func=bench_dedup)
+
+    fixtures = subparsers.add_parser("fixtures", help="Check the parsers against their fixtures and the store invariants")
+    fixtures.set_defaults(func=check_fixtures)
+
+    captions = subparsers.add_parser("captions", help="Caption parser VTT throughput")
+    captions.add_argument("--hours", type=float, default=20.0, help="Hours of synthetic auto-captions to parse")
+    captions.add_argument("--runs", type=int, default=3)
+    captions.set_defaults(func=bench_captions)
+
+    html = subparsers.add_parser("html", help="HTML-to-text fixtures and throughput vs BeautifulSoup")
+    html.add_argument("--mb", type=float, default=10.0, help="Size of the synthetic inline XBRL filing")
+    html.add_argument("--runs", type=int, default=3)
+    html.set_defaults(func=bench_html)
+
+    sections = subparsers.add_parser("sections", help="EDGAR Item splitting vs the old 500k-char truncation")
+    sections.add_argument("--mb", type=float, default=4.0, help="Size of the synthetic 10-K")
+    sections.set_defaults(func=bench_sections)
+
+    http = subparsers.add_parser("http", help="Pooled HTTP client vs bare requests against the stub server")
+    http.add_argument("--files", type=int, default=200, help="Static files served by the stub")
+    http.add_argument("--kb", type=int, default=64, help="Approximate size of each file")
+    http.add_argument("--rate", type=float, default=10.0, help="Per-host limit to verify (SEC allows 10/s)")
+    http.set_defaults(func=bench_http)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+BM25 Index
+Compact inverted index (term -> postings with term frequency) over a twin's
+chunk text, for keyword-heavy questions that embedding search misses:
+tickers, form types, dashboard names.
+
+The index is saved as bm25.npz inside the store directory:
+
+    terms        sorted vocabulary
+    term_starts  offset of each term's postings (len(terms) + 1)
+    doc_ids      posting rows, grouped by term, ascending within a term
+    tfs          term frequency for each posting
+    doc_lengths  tokens per row
+
+Like the IVF index it is stamped with the store revision it was built from
+and ignored once the store has changed.
+
+Usage:
+    python scripts/bm25_index.py build data/twins/bcstat/kb
+    python scripts/bm25_index.py search data/twins/bcstat/kb "code enforcement"
+"""
+import os
+import re
+import time
+import argparse
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from kb_store import KnowledgeBaseReader, read_header
+
+INDEX_FILE = "bm25.npz"
+K1 = 1.2
+B = 0.75
+
+# Keeps hyphenated and dotted tokens whole: "10-q", "covid-19", "u.s"
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-.'][a-z0-9]+)*")
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have how i in is it its of on or
+that the this to was were what when where which who why will with you your
+""".split())
+
+
+def tokenize(text: str) -> list:
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over the chunks of one store."""
+
+    def __init__(self, terms, term_starts, doc_ids, tfs, doc_lengths, revision: int):
+        self.terms = terms
+        self.term_starts = term_starts
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        self.revision = revision
+        self.count = len(doc_lengths)
+        self.avg_length = float(doc_lengths.mean()) if self.count else 0.0
+
+    @classmethod
+    def build(cls, texts, revision: int = 0) -> "BM25Index":
+        postings = {}
+        doc_lengths = []
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append((row, tf))
+
+        terms = sorted(postings)
+        term_starts = np.zeros(len(terms) + 1, dtype=np.int64)
+        term_starts[1:] = np.cumsum([len(postings[t]) for t in terms])
+        flat = [posting for t in terms for posting in postings[t]]
+        doc_ids = np.array([row for row, _ in flat], dtype=np.int32)
+        tfs = np.array([tf for _, tf in flat], dtype=np.uint16) if flat else np.zeros(0, dtype=np.uint16)
+        return cls(np.array(terms, dtype=str), term_starts, doc_ids, tfs,
+                   np.array(doc_lengths, dtype=np.int32), revision)
+
+    def save(self, kb_dir):
+        path = Path(kb_dir) / INDEX_FILE
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, terms=self.terms, term_starts=self.term_starts, doc_ids=self.doc_ids,
+                     tfs=self.tfs, doc_lengths=self.doc_lengths, revision=self.revision)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, kb_dir, revision: int = None):
+        """Load the store's index, or None if there isn't one or it predates `revision`."""
+        path = Path(kb_dir) / INDEX_FILE
+        if not path.exists():
+            return None
+        with np.load(path) as data:
+            index = cls(data["terms"], data["term_starts"], data["doc_ids"], data["tfs"],
+                        data["doc_lengths"], int(data["revision"]))
+        if revision is not None and index.revision != revision:
+            return None
+        return index
+
+    def _postings(self, term: str):
+        i = int(np.searchsorted(self.terms, term))
+        if i == len(self.terms) or self.terms[i] != term:
+            return None, None
+        start, end = self.term_starts[i], self.term_starts[i + 1]
+        return self.doc_ids[start:end], self.tfs[start:end]
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every row for the query (0 for rows sharing no terms)."""
+        scores = np.zeros(self.count, dtype=np.float32)
+        for term in set(tokenize(query)):
+            rows, tfs = self._postings(term)
+            if rows is None:
+                continue
+            idf = np.log(1 + (self.count - len(rows) + 0.5) / (len(rows) + 0.5))
+            tfs = tfs.astype(np.float32)
+            norm = K1 * (1 - B + B * self.doc_lengths[rows] / self.avg_length)
+            scores[rows] += idf * tfs * (K1 + 1) / (tfs + norm)
+        return scores
+
+    def search(self, query: str, k: int, rows=None):
+        """Return [(row, score), ...] for the k best-matching rows with a non-zero score.
+
+        rows, if given, restricts the result to those row ids (e.g. a metadata filter).
+        """
+        from retrieval import top_k
+
+        scores = self.scores(query)
+        if rows is not None:
+            subset = scores[rows]
+            best = top_k(subset, k)
+            return [(int(rows[i]), float(subset[i])) for i in best if subset[i] > 0]
+        best = top_k(scores, k)
+        return [(int(row), float(scores[row])) for row in best if scores[row] > 0]
+
+
+def build_index(kb_dir) -> BM25Index:
+    """Tokenize every chunk in the store and save the inverted index next to it."""
+    start = time.perf_counter()
+    with KnowledgeBaseReader(kb_dir) as reader:
+        index = BM25Index.build((chunk["text"] for chunk in reader.iter_chunks()), revision=reader.revision)
+    index.save(kb_dir)
+    print(f"Built BM25 index: {index.count} rows, {len(index.terms)} terms ({time.perf_counter() - start:.1f}s)")
+    return index
+
+
+def refresh_index(kb_dir):
+    """Rebuild the index unless it already matches the store revision."""
+    existing = BM25Index.load(kb_dir, read_header(kb_dir).get("revision", 0))
+    return existing if existing is not None else build_index(kb_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query a store's BM25 keyword index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Tokenize a store's chunks and save bm25.npz next to them")
+    build_parser.add_argument("kb_dir", type=str, help="Store directory")
+
+    search_parser = subparsers.add_parser("search", help="Print the best keyword matches for a query")
+    search_parser.add_argument("kb_dir", type=str, help="Store directory")
+    search_parser.add_argument("query", type=str)
+    search_parser.add_argument("--k", type=int, default=5)
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_index(args.kb_dir)
+    elif args.command == "search":
+        index = refresh_index(args.kb_dir)
+        with KnowledgeBaseReader(args.kb_dir) as reader:
+            for row, score in index.search(args.query, args.k):
+                print(f"{score:6.2f}  [{row}] {reader.get_chunk(row)['text'][:100]!r}")
+
+
+if __name__ == "__main__":
+    main()
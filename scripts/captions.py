@@ -0,0 +1,115 @@
+"""
+Captions
+Single-pass streaming parsers for the caption formats YouTube serves, yielding
+(start, end, text) cues in seconds.
+
+- WebVTT: header, NOTE/STYLE/REGION blocks, cue identifiers and cue settings
+  are skipped; inline tags (<c>, <c.colorE5E5E5>, <00:00:01.234>, <v Name>,
+  <i>, <b>) are stripped and entities unescaped.
+- SRV3 (timedtext format 3): <p t="ms" d="ms"> paragraphs, with the text of
+  their <s> word spans joined.
+
+Auto-generated captions roll: each cue repeats the line(s) shown by the
+previous cue above the new words, and ~10 ms "snapshot" cues repeat it
+outright. Both parsers collapse that, so each spoken line appears once, in
+the cue where it first appeared.
+
+Usage:
+    with open("video.en.vtt", encoding="utf-8") as f:
+        for start, end, text in parse_vtt(f): ...
+"""
+import re
+from html import unescape
+from xml.etree import ElementTree
+
+TIMESTAMP = r"(?:(\d+):)?(\d{1,2}):(\d{2})[.,](\d{3})"
+TIMING_RE = re.compile(r"^\s*" + TIMESTAMP + r"\s+-->\s+" + TIMESTAMP)
+TAG_RE = re.compile(r"<[^>]*>")
+# Blocks that carry no cue text
+SKIPPED_BLOCKS = ("WEBVTT", "NOTE", "STYLE", "REGION")
+
+
+def _seconds(hours, minutes, seconds, millis) -> float:
+    return int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds) + int(millis) / 1000
+
+
+def clean_line(line: str) -> str:
+    """Caption text with inline tags removed, entities unescaped and whitespace collapsed."""
+    if "<" in line:
+        line = TAG_RE.sub("", line)
+    if "&" in line:
+        line = unescape(line)
+    return " ".join(line.split())
+
+
+def collapse_rolling(cues):
+    """(start, end, [lines]) -> (start, end, text), dropping lines repeated from the previous cue.
+
+    The longest run of leading lines that matches the end of the previous
+    cue is removed; a cue with nothing left is skipped.
+    """
+    previous = []
+    for start, end, lines in cues:
+        if not lines:
+            continue
+        overlap = min(len(lines), len(previous))
+        while overlap and lines[:overlap] != previous[-overlap:]:
+            overlap -= 1
+        previous = lines
+        new = lines[overlap:]
+        if new:
+            yield start, end, " ".join(new)
+
+
+def _vtt_cues(lines):
+    """(start, end, [cleaned lines]) for each cue block of a WebVTT stream."""
+    timing = None
+    text = []
+    skipping = False
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if not line:
+            # An empty line ends the current block (auto-captions use " " lines inside cues)
+            if timing is not None:
+                yield timing[0], timing[1], text
+            timing, text, skipping = None, [], False
+            continue
+        if skipping:
+            continue
+        if timing is None:
+            match = TIMING_RE.match(line) if "-->" in line else None
+            if match:
+                parts = match.groups()
+                timing = (_seconds(*parts[:4]), _seconds(*parts[4:]))
+            elif line.lstrip("\ufeff").startswith(SKIPPED_BLOCKS):
+                skipping = True
+            # Anything else before the timing line is a cue identifier
+            continue
+        cleaned = clean_line(line)
+        if cleaned:
+            text.append(cleaned)
+    if timing is not None:
+        yield timing[0], timing[1], text
+
+
+def parse_vtt(lines):
+    """Yield (start, end, text) cues from an iterable of WebVTT lines (a file, a response)."""
+    return collapse_rolling(_vtt_cues(lines))
+
+
+def _srv3_cues(source):
+    """(start, end, [lines]) for each <p> of a timedtext format 3 document."""
+    for _, element in ElementTree.iterparse(source, events=("end",)):
+        if element.tag != "p":
+            continue
+        start = int(element.get("t", 0)) / 1000
+        end = start + int(element.get("d", 0)) / 1000
+        raw = "".join(element.itertext())
+        element.clear()
+        lines = [cleaned for cleaned in (clean_line(line) for line in raw.split("\n")) if cleaned]
+        yield start, end, lines
+
+
+def parse_srv3(source):
+    """Yield (start, end, text) cues from an SRV3 file path or binary file object."""
+    return collapse_rolling(_srv3_cues(source))
@@ -0,0 +1,229 @@
+"""
+Chunker
+Streaming, sentence-aware chunking shared by the ingesters.
+
+Sources are consumed as an iterator of segments - caption cues with
+timestamps, or paragraphs with their character offset - a block of
+BLOCK_SEGMENTS at a time, so a long transcript is never held in memory whole.
+Each block's segments are joined into one string and cut into chunks of up to
+a token budget: a chunk ends at the last sentence end in the second half of
+its window, or at the last space when the text has no sentence punctuation
+there (auto-generated captions, tables). Sentence ends are found with
+str.rfind plus a regex match at each candidate, and segments are joined with
+SEPARATOR so str.count maps a chunk back to its segments.
+
+The next chunk starts up to the overlap budget before the previous one ended:
+at the first whole sentence that fits, or, when the last sentence (or run-on)
+is longer than the budget, at the first word boundary inside it.
+
+Every chunk records where it came from: start_time/end_time in seconds (to
+cue granularity) for cues, char_start/char_end offsets into the source text
+for paragraphs. A source split into sections is chunked section by section,
+so no chunk spans two of them; chunks carry their section's metadata and
+offsets into the section's text.
+
+Tokens are estimated as CHARS_PER_TOKEN characters each, which keeps the
+default budget inside all-MiniLM-L6-v2's 256-token window for English text.
+"""
+import re
+from functools import partial
+from itertools import islice
+from operator import itemgetter
+
+CHARS_PER_TOKEN = 4
+DEFAULT_MAX_TOKENS = 240
+DEFAULT_OVERLAP_TOKENS = 32
+# Segments joined and chunked at a time
+BLOCK_SEGMENTS = 4096
+# Joins segments; str.isspace() is true for it, so regexes and strip() treat it as a space
+SEPARATOR = "\x1f"
+
+# Sentence-ending punctuation, optional closing quotes/brackets, then whitespace
+SENTENCE_END_RE = re.compile(r"[.!?]+[\"')\]]*\s+")
+BLANK_LINE_RE = re.compile(r"\n[ \t\r\f\v]*\n\s*")
+NON_SPACE_RE = re.compile(r"\S")
+
+
+def iter_paragraphs(text: str):
+    """Yield (offset, paragraph) for each blank-line-separated block of text."""
+    pos = 0
+    for match in BLANK_LINE_RE.finditer(text):
+        if match.start() > pos:
+            yield pos, text[pos:match.start()]
+        pos = match.end()
+    if pos < len(text):
+        yield pos, text[pos:]
+
+
+def _last_sentence_end(text: str, lo: int, hi: int) -> int:
+    """End (after trailing whitespace) of the last sentence whose punctuation lies in [lo, hi), or -1."""
+    while True:
+        mark = max(text.rfind(".", lo, hi), text.rfind("?", lo, hi), text.rfind("!", lo, hi))
+        if mark < 0:
+            return -1
+        match = SENTENCE_END_RE.match(text, mark)
+        if match is not None:
+            return match.end()
+        hi = mark
+
+
+def _first_sentence_end(text: str, lo: int, hi: int) -> int:
+    """End of the first sentence whose punctuation lies in [lo, hi), or -1."""
+    while True:
+        marks = [m for m in (text.find(".", lo, hi), text.find("?", lo, hi), text.find("!", lo, hi)) if m >= 0]
+        if not marks:
+            return -1
+        match = SENTENCE_END_RE.match(text, min(marks))
+        if match is not None:
+            return match.end()
+        lo = min(marks) + 1
+
+
+def _spans(text: str, pos: int, max_chars: int, overlap_chars: int, final: bool):
+    """Cut text into (start, end) chunk spans from pos; returns (spans, where the next chunk starts).
+
+    Unless final, stops before a chunk whose window would run past the end of
+    text, so the caller can append more text first.
+    """
+    spans = []
+    length = len(text)
+    min_chars = max_chars // 2
+    while True:
+        if text[pos:pos + 1].isspace():
+            match = NON_SPACE_RE.search(text, pos)
+            if match is None:
+                return spans, length
+            pos = match.start()
+        hi = pos + max_chars
+        if hi >= length:
+            if final and pos < length:
+                spans.append((pos, len(text.rstrip())))
+            return spans, (length if final else pos)
+
+        end = _last_sentence_end(text, pos + min_chars, hi)
+        if end < 0:
+            end = max(text.rfind(" ", pos + min_chars, hi), text.rfind(SEPARATOR, pos + min_chars, hi))
+            if end < 0:
+                end = hi
+        # Sentence ends include their trailing whitespace
+        last = end - 1
+        while text[last].isspace():
+            last -= 1
+        spans.append((pos, last + 1))
+
+        # Carry whole trailing sentences that fit the overlap, else a word-aligned tail
+        next_pos = end
+        if overlap_chars:
+            back = end - overlap_chars
+            carried = _first_sentence_end(text, back, last)
+            if carried >= 0:
+                next_pos = carried
+            else:
+                space = text.find(" ", back, last)
+                sep = text.find(SEPARATOR, back, space if space >= 0 else last)
+                if sep >= 0 or space >= 0:
+                    next_pos = (sep if sep >= 0 else space) + 1
+        pos = max(next_pos, pos + min_chars)
+
+
+def _chunk_segments(segments, text_of, max_chars: int, overlap_chars: int, metadata_for):
+    """Chunk segments a block at a time.
+
+    metadata_for(first, last, start_in, end_in) builds a chunk's metadata from
+    the segments it starts and ends in and its offsets inside them.
+    """
+    segments = iter(segments)
+    pending = []
+    # Offset of the next chunk inside the joined pending text
+    pos = 0
+    while True:
+        block = list(islice(segments, BLOCK_SEGMENTS))
+        pending.extend(block)
+        final = len(block) < BLOCK_SEGMENTS
+        if not pending:
+            return
+        texts = list(map(text_of, pending))
+        text = SEPARATOR.join(texts)
+        if text.count(SEPARATOR) != len(texts) - 1:
+            text = SEPARATOR.join(t.replace(SEPARATOR, " ") for t in texts)
+
+        spans, pos = _spans(text, pos, max_chars, overlap_chars, final)
+        # Segment index of `at`; spans move forward, so counting separators from the last one is cheap
+        at = index = 0
+        for start, end in spans:
+            if start >= at:
+                index += text.count(SEPARATOR, at, start)
+            else:
+                index -= text.count(SEPARATOR, start, at)
+            first = index
+            index += text.count(SEPARATOR, start, end - 1)
+            at = end - 1
+            yield {"text": text[start:end].replace(SEPARATOR, " "),
+                   "metadata": metadata_for(pending[first], pending[index],
+                                            start - text.rfind(SEPARATOR, 0, start) - 1,
+                                            at - text.rfind(SEPARATOR, 0, at))}
+        if final:
+            return
+        first = text.count(SEPARATOR, 0, pos)
+        pos -= text.rfind(SEPARATOR, 0, pos) + 1
+        pending = pending[first:]
+
+
+def _cue_metadata(first, last, start_in: int, end_in: int) -> dict:
+    return {"start_time": first[0], "end_time": last[1]}
+
+
+def _paragraph_metadata(first, last, start_in: int, end_in: int) -> dict:
+    return {"char_start": first[0] + start_in, "char_end": last[0] + end_in}
+
+
+def _budgets(max_tokens: int, overlap_tokens: int):
+    max_chars = max(max_tokens * CHARS_PER_TOKEN, 2)
+    overlap_chars = min(overlap_tokens * CHARS_PER_TOKEN, max_chars // 2)
+    return max_chars, overlap_chars
+
+
+def chunk_cues(cues, max_tokens: int = DEFAULT_MAX_TOKENS, overlap_tokens: int = DEFAULT_OVERLAP_TOKENS):
+    """Chunk an iterable of (start, end, text) caption cues; yields {"text", "metadata"} dicts."""
+    max_chars, overlap_chars = _budgets(max_tokens, overlap_tokens)
+    return _chunk_segments(cues, itemgetter(2), max_chars, overlap_chars, _cue_metadata)
+
+
+def chunk_paragraphs(paragraphs, max_tokens: int = DEFAULT_MAX_TOKENS,
+                     overlap_tokens: int = DEFAULT_OVERLAP_TOKENS):
+    """Chunk an iterable of (char offset, paragraph); yields {"text", "metadata"} dicts."""
+    max_chars, overlap_chars = _budgets(max_tokens, overlap_tokens)
+    return _chunk_segments(paragraphs, itemgetter(1), max_chars, overlap_chars, _paragraph_metadata)
+
+
+def chunk_text(text: str, max_tokens: int = DEFAULT_MAX_TOKENS, overlap_tokens: int = DEFAULT_OVERLAP_TOKENS):
+    """Chunk one document, paragraph by paragraph."""
+    return chunk_paragraphs(iter_paragraphs(text), max_tokens, overlap_tokens)
+
+
+def chunk_sections(sections, max_tokens: int = DEFAULT_MAX_TOKENS, overlap_tokens: int = DEFAULT_OVERLAP_TOKENS):
+    """Chunk each {"text", "metadata"} section on its own, tagging its chunks with the section's metadata."""
+    for section in sections:
+        for chunk in chunk_text(section["text"], max_tokens, overlap_tokens):
+            yield {"text": chunk["text"], "metadata": dict(section["metadata"], **chunk["metadata"])}
+
+
+def chunk_source(source: dict, max_tokens: int = DEFAULT_MAX_TOKENS, overlap_tokens: int = DEFAULT_OVERLAP_TOKENS):
+    """Chunk a pipeline source: its "sections", its "cues" if it has them, otherwise its "text"."""
+    if "sections" in source:
+        return chunk_sections(source["sections"], max_tokens, overlap_tokens)
+    if "cues" in source:
+        return chunk_cues(source["cues"], max_tokens, overlap_tokens)
+    return chunk_text(source["text"], max_tokens, overlap_tokens)
+
+
+def add_chunker_arguments(parser):
+    """Register the chunking CLI flags shared by the ingesters."""
+    parser.add_argument("--chunk-tokens", type=int, default=DEFAULT_MAX_TOKENS, help="Token budget per chunk")
+    parser.add_argument("--chunk-overlap", type=int, default=DEFAULT_OVERLAP_TOKENS,
+                        help="Tokens of trailing sentences repeated at the start of the next chunk")
+
+
+def chunker_from_args(args):
+    """The chunk_source() function configured by add_chunker_arguments() flags."""
+    return partial(chunk_source, max_tokens=args.chunk_tokens, overlap_tokens=args.chunk_overlap)
@@ -0,0 +1,170 @@
+"""
+Near-Duplicate Removal
+Drops repeated text before it is embedded, at two levels:
+
+- Cues: rolling YouTube captions repeat the previous line in the next cue.
+  Each cue gets a 64-bit SimHash of its words; a cue within a few bits of
+  one of the last CUE_WINDOW kept cues is dropped. A SimHash ignores word
+  order and repeats, and over a handful of words different cues ("the dog
+  bit the man", "the man bit the dog") collide, so cues under
+  MIN_SIMHASH_WORDS words must repeat a recent cue's text exactly (case and
+  spacing aside).
+- Chunks: pages that share boilerplate (navigation text, disclaimers) and
+  transcripts that repeat themselves produce near-identical chunks. Each
+  chunk gets a MinHash signature over word shingles, bucketed with LSH
+  banding; a chunk whose estimated Jaccard similarity with an earlier chunk
+  in the same run reaches the threshold is dropped.
+
+Shingles and tokens are hashed with crc32, so signatures are stable across
+processes.
+"""
+import re
+import zlib
+from collections import deque
+from functools import lru_cache
+from itertools import islice
+
+import numpy as np
+
+CUE_WINDOW = 8
+CUE_MAX_DISTANCE = 3  # differing SimHash bits
+MIN_SIMHASH_WORDS = 8
+# Cues fingerprinted per numpy pass
+CUE_BLOCK = 512
+DEFAULT_THRESHOLD = 0.8  # Jaccard similarity
+NUM_PERMUTATIONS = 64
+BANDS = 16  # rows per band = NUM_PERMUTATIONS // BANDS
+SHINGLE_WORDS = 3
+
+WORD_RE = re.compile(r"\w+")
+_BITS = np.arange(64, dtype=np.uint64)
+
+
+# Caption vocabularies are small, so most words are hashed once
+@lru_cache(maxsize=1 << 16)
+def _hash64(token: str) -> int:
+    data = token.encode("utf-8")
+    return zlib.crc32(data) | (zlib.crc32(data, 0x9E3779B9) << 32)
+
+
+def simhashes(word_lists) -> list:
+    """64-bit SimHash of each list of words, computed in one pass."""
+    counts = np.array([len(words) for words in word_lists], dtype=np.int64)
+    if not counts.sum():
+        return [0] * len(word_lists)
+    hashes = np.array([_hash64(w) for words in word_lists for w in words], dtype="<u8")
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little").astype(np.int32)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    present = counts > 0
+    votes = np.zeros((len(counts), 64), dtype=np.int32)
+    votes[present] = np.add.reduceat(bits, starts[present], axis=0)
+    majority = (votes * 2 > counts[:, None]).astype(np.uint64)
+    return [int(v) for v in (majority << _BITS).sum(axis=1)]
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash of the lower-cased words of text."""
+    return simhashes([WORD_RE.findall(text.lower())])[0]
+
+
+def shingles(text: str, size: int = SHINGLE_WORDS) -> np.ndarray:
+    """Hashes of the overlapping size-word shingles of text (the whole text if shorter)."""
+    words = WORD_RE.findall(text.lower())
+    grams = [" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))]
+    return np.unique(np.array([zlib.crc32(g.encode("utf-8")) for g in grams], dtype=np.uint64))
+
+
+class MinHasher:
+    """MinHash signatures from multiply-shift hash functions."""
+
+    def __init__(self, num_permutations: int = NUM_PERMUTATIONS, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, 2 ** 63, num_permutations, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 2 ** 63, num_permutations, dtype=np.uint64)
+
+    def signature(self, hashes: np.ndarray) -> np.ndarray:
+        with np.errstate(over="ignore"):
+            return ((self.a[:, None] * hashes[None, :] + self.b[:, None]) >> np.uint64(32)).min(axis=1)
+
+
+class Deduplicator:
+    """Cue- and chunk-level near-duplicate filter for one ingestion run."""
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, cue_distance: int = CUE_MAX_DISTANCE,
+                 cue_window: int = CUE_WINDOW):
+        self.threshold = threshold
+        self.cue_distance = cue_distance
+        self.cue_window = cue_window
+        self.minhasher = MinHasher()
+        self.rows = NUM_PERMUTATIONS // BANDS
+        self.buckets = {}  # (band, band bytes) -> signature ids
+        self.signatures = []
+        self.cues_removed = 0
+        self.chunks_removed = 0
+        self.chars_removed = 0
+
+    def cues(self, cues):
+        """Yield the (start, end, text) cues that aren't near-repeats of a recent cue."""
+        cues = iter(cues)
+        # (normalised text, SimHash or None for cues too short to fingerprint) of the last kept cues
+        recent = deque(maxlen=self.cue_window)
+        distance = self.cue_distance
+        while True:
+            block = list(islice(cues, CUE_BLOCK))
+            if not block:
+                return
+            word_lists = [WORD_RE.findall(text.lower()) for _, _, text in block]
+            for cue, words, fingerprint in zip(block, word_lists, simhashes(word_lists)):
+                text = " ".join(cue[2].lower().split())
+                if len(words) < MIN_SIMHASH_WORDS:
+                    fingerprint = None
+                    duplicate = any(other == text for other, _ in recent)
+                else:
+                    duplicate = any(other is not None and bin(fingerprint ^ other).count("1") <= distance
+                                    for _, other in recent)
+                if duplicate:
+                    self.cues_removed += 1
+                    continue
+                recent.append((text, fingerprint))
+                yield cue
+
+    def is_duplicate(self, text: str) -> bool:
+        """True if text nearly matches a chunk seen earlier in the run; otherwise remember it."""
+        signature = self.minhasher.signature(shingles(text))
+        keys = [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(BANDS)]
+        candidates = {i for key in keys for i in self.buckets.get(key, ())}
+        for i in candidates:
+            # Fraction of agreeing minima estimates the Jaccard similarity
+            if np.mean(self.signatures[i] == signature) >= self.threshold:
+                self.chunks_removed += 1
+                self.chars_removed += len(text)
+                return True
+        for key in keys:
+            self.buckets.setdefault(key, []).append(len(self.signatures))
+        self.signatures.append(signature)
+        return False
+
+    def filter_chunks(self, chunks):
+        """The {"text", ...} chunks that aren't near-duplicates of earlier ones."""
+        return [chunk for chunk in chunks if not self.is_duplicate(chunk["text"])]
+
+    def stats_line(self, seconds_per_chunk: float = None) -> str:
+        line = (f"Near-duplicates removed: {self.cues_removed} cues, {self.chunks_removed} chunks "
+                f"({self.chars_removed / 1024:.0f} KB of text)")
+        if seconds_per_chunk and self.chunks_removed:
+            line += f", ~{self.chunks_removed * seconds_per_chunk:.1f}s of embedding saved"
+        return line
+
+
+def add_dedup_arguments(parser):
+    """Register the near-duplicate CLI flags shared by the ingesters."""
+    parser.add_argument("--no-dedup", action="store_true", help="Embed near-duplicate cues and chunks too")
+    parser.add_argument("--dedup-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Estimated Jaccard similarity at which a chunk counts as a duplicate")
+
+
+def deduplicator_from_args(args):
+    """The Deduplicator described by add_dedup_arguments() flags, or None with --no-dedup."""
+    if args.no_dedup:
+        return None
+    return Deduplicator(threshold=args.dedup_threshold)
@@ -0,0 +1,151 @@
+"""
+EDGAR Sections
+Splits a filing's text blocks (html_text.iter_blocks) into its Items - 1, 1A,
+7, 7A, 8... for a 10-K, 2.02, 9.01... for an 8-K - so the ingester can embed
+the sections that matter in full and skip the cover page and boilerplate.
+
+An Item starts at a short block that begins "Item <number>". The table of
+contents lists every Item too, so when an Item heading appears more than
+once (per Part, since 10-Q Parts reuse numbers) the occurrence with the most
+text under it is the real one. Text before the first Item is the "cover"
+section.
+
+Usage:
+    sections = filing_sections(iter_blocks(chunks), items=("1A", "7"))
+"""
+import re
+
+COVER = "cover"
+ITEM_HEADING_RE = re.compile(r"^item\s+(\d{1,2}(?:\.\d{2})?[a-c]?)\b\s*[.:\-–—]?\s*(.*)$", re.IGNORECASE)
+PART_HEADING_RE = re.compile(r"^part\s+(iv|i{1,3})\b", re.IGNORECASE)
+# Longer blocks that start with "Item 7" are cross-references, not headings
+MAX_HEADING_CHARS = 200
+
+# Form 10-K Item titles; other forms are titled from their headings
+ITEM_TITLES = {
+    "1": "Business",
+    "1A": "Risk Factors",
+    "1B": "Unresolved Staff Comments",
+    "1C": "Cybersecurity",
+    "2": "Properties",
+    "3": "Legal Proceedings",
+    "4": "Mine Safety Disclosures",
+    "5": "Market for Registrant's Common Equity, Related Stockholder Matters and Issuer Purchases of Equity Securities",
+    "6": "[Reserved]",
+    "7": "Management's Discussion and Analysis of Financial Condition and Results of Operations",
+    "7A": "Quantitative and Qualitative Disclosures About Market Risk",
+    "8": "Financial Statements and Supplementary Data",
+    "9": "Changes in and Disagreements with Accountants on Accounting and Financial Disclosure",
+    "9A": "Controls and Procedures",
+    "9B": "Other Information",
+    "9C": "Disclosure Regarding Foreign Jurisdictions that Prevent Inspections",
+    "10": "Directors, Executive Officers and Corporate Governance",
+    "11": "Executive Compensation",
+    "12": "Security Ownership of Certain Beneficial Owners and Management and Related Stockholder Matters",
+    "13": "Certain Relationships and Related Transactions, and Director Independence",
+    "14": "Principal Accountant Fees and Services",
+    "15": "Exhibits and Financial Statement Schedules",
+    "16": "Form 10-K Summary",
+}
+# Items ingested when none are named: the narrative and the financials. An Item
+# is a number, matched in any Part, or a (Part, number) pair
+DEFAULT_ITEMS = {
+    "10-K": ("1", "1A", "7", "7A", "8"),
+    # Part I Items 1-3 are the financial statements, MD&A and market risk; Part II Item 1A is risk
+    # factors. Part II also numbers legal proceedings, equity sales and defaults 1-3
+    "10-Q": (("I", "1"), ("I", "2"), ("I", "3"), ("II", "1A")),
+}
+
+
+def split_items(blocks) -> list:
+    """Every Item section of a filing in document order, TOC entries included.
+
+    Returns {"item", "part", "heading", "blocks"} dicts; the first is the
+    cover (everything before the first Item heading).
+    """
+    part = None
+    current = {"item": COVER, "part": None, "heading": "", "blocks": []}
+    sections = [current]
+    for block in blocks:
+        if len(block) <= MAX_HEADING_CHARS:
+            match = PART_HEADING_RE.match(block)
+            if match:
+                part = match.group(1).upper()
+                continue
+            match = ITEM_HEADING_RE.match(block)
+            if match:
+                current = {"item": match.group(1).upper(), "part": part, "heading": block, "blocks": []}
+                sections.append(current)
+                continue
+        current["blocks"].append(block)
+    return sections
+
+
+def _size(section) -> int:
+    return sum(len(block) for block in section["blocks"])
+
+
+def _selected(section, items) -> bool:
+    for wanted in items:
+        if isinstance(wanted, tuple):
+            part, item = wanted
+            # Filings without Part headings can only be matched on the number
+            if section["item"] == item.upper() and section["part"] in (part.upper(), None):
+                return True
+        elif section["item"] == wanted.upper():
+            return True
+    return False
+
+
+def filing_sections(blocks, items=None, form: str = "10-K") -> list:
+    """The filing's Items as {"item", "part", "title", "text"} dicts in document order.
+
+    Only the Items listed in items - numbers, or (Part, number) pairs - are
+    returned (all of them, cover included, when items is None). A filing
+    with no Item headings comes back as one section whose item is None.
+    """
+    ten_k = form.upper().replace("/A", "") == "10-K"
+    sections = split_items(blocks)
+    if len(sections) == 1:
+        return [{"item": None, "part": None, "title": None, "text": "\n\n".join(sections[0]["blocks"])}]
+
+    # Table-of-contents entries share their Item's heading but have (almost) nothing under them
+    best = {}
+    for section in sections:
+        key = (section["part"], section["item"])
+        if key not in best or _size(section) > _size(best[key]):
+            best[key] = section
+    # A TOC without Part rows lists Items before any Part heading is seen
+    in_parts = {item for part, item in best if part is not None}
+
+    result = []
+    for section in sections:
+        if best[(section["part"], section["item"])] is not section or not section["blocks"]:
+            continue
+        if section["part"] is None and section["item"] in in_parts:
+            continue
+        if items is not None and not _selected(section, items):
+            continue
+        heading = ITEM_HEADING_RE.match(section["heading"])
+        title = (ten_k and ITEM_TITLES.get(section["item"])) or (heading and heading.group(2).strip()) or None
+        result.append({"item": section["item"], "part": section["part"], "title": title,
+                       "text": "\n\n".join(section["blocks"])})
+    return result
+
+
+def items_for_form(spec: str, form: str):
+    """Items to ingest from a --items value, or the form's defaults when unset.
+
+    The value is 'all' (None) or a comma-separated list of Item numbers, each
+    optionally qualified by its Part as PART:ITEM (II:1A).
+    """
+    if not spec:
+        return DEFAULT_ITEMS.get(form.upper().replace("/A", ""))
+    if spec.lower() == "all":
+        return None
+    items = []
+    for item in spec.upper().split(","):
+        part, _, number = item.strip().rpartition(":")
+        if number:
+            items.append((part, number) if part else number)
+    return tuple(items)
@@ -0,0 +1,151 @@
+"""
+Embedding Cache
+Persistent content-addressed cache of embeddings, keyed by (model name,
+sha256 of the text), stored in a single SQLite file shared by every ingester
+and every twin. Entries are evicted least-recently-used once the cache
+exceeds its size cap.
+"""
+import sqlite3
+import hashlib
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+DEFAULT_CACHE_PATH = Path(__file__).parent.parent / "data" / "cache" / "embeddings.sqlite"
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3  # 2 GB
+
+
+def text_hash(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """(model, text hash) -> float32 vector, with size-capped LRU eviction."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                hash BLOB NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, hash)
+            ) WITHOUT ROWID
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._db.commit()
+
+    def get_many(self, model: str, texts) -> list:
+        """Look up texts; returns a list aligned with texts holding vectors or None."""
+        hashes = [text_hash(t) for t in texts]
+        found = {}
+        with self._lock:
+            # Chunk the IN clause to stay under SQLite's variable limit
+            for i in range(0, len(hashes), 500):
+                batch = hashes[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._db.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                    [model, *batch],
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._db.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND hash = ?",
+                    [(now, model, h) for h in found],
+                )
+                self._db.commit()
+
+        results = [np.frombuffer(found[h], dtype=np.float32) if h in found else None for h in hashes]
+        hits = sum(r is not None for r in results)
+        self.hits += hits
+        self.misses += len(results) - hits
+        return results
+
+    def put_many(self, model: str, texts, vectors):
+        now = time.time()
+        rows = [
+            (model, text_hash(t), np.asarray(v, dtype=np.float32).tobytes(), now)
+            for t, v in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self._db.commit()
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    def evict(self) -> int:
+        """Drop least-recently-used entries until the cache fits in max_bytes."""
+        excess = self.size_bytes() - self.max_bytes
+        if excess <= 0:
+            return 0
+        removed = 0
+        with self._lock:
+            cursor = self._db.execute("SELECT model, hash, LENGTH(vector) FROM embeddings ORDER BY last_used")
+            doomed = []
+            for model, h, size in cursor:
+                if excess <= 0:
+                    break
+                doomed.append((model, h))
+                excess -= size
+            self._db.executemany("DELETE FROM embeddings WHERE model = ? AND hash = ?", doomed)
+            self._db.commit()
+            removed = len(doomed)
+        return removed
+
+    def cached(self, model: str, embed_fn):
+        """Wrap embed_fn(texts) -> (n, dim) so only cache misses are embedded."""
+        def embed(texts):
+            texts = list(texts)
+            vectors = self.get_many(model, texts)
+            missing = [i for i, v in enumerate(vectors) if v is None]
+            if missing:
+                fresh = embed_fn([texts[i] for i in missing])
+                ok = [(i, v) for i, v in zip(missing, fresh) if v is not None]
+                for i, v in ok:
+                    vectors[i] = np.asarray(v, dtype=np.float32)
+                self.put_many(model, [texts[i] for i, _ in ok], [v for _, v in ok])
+            return vectors
+        return embed
+
+    def stats_line(self) -> str:
+        total = self.hits + self.misses
+        rate = 100.0 * self.hits / total if total else 0.0
+        return (f"Embedding cache: {self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate), "
+                f"{self.size_bytes() / 1024 / 1024:.1f} MB on disk")
+
+    def close(self):
+        """Evict down to the size cap and close the database."""
+        removed = self.evict()
+        if removed:
+            print(f"Embedding cache: evicted {removed} least-recently-used entries")
+        with self._lock:
+            self._db.close()
+
+
+def add_cache_arguments(parser):
+    """Register the embedding-cache CLI flags shared by the ingesters."""
+    parser.add_argument("--no-cache", action="store_true", help="Don't read or write the embedding cache")
+    parser.add_argument("--cache-path", type=str, default=str(DEFAULT_CACHE_PATH), help="Embedding cache SQLite file")
+    parser.add_argument("--cache-max-mb", type=int, default=DEFAULT_MAX_BYTES // 1024 ** 2, help="Evict LRU entries above this size")
+
+
+def open_cache(args):
+    """Open the cache described by add_cache_arguments() flags, or None with --no-cache."""
+    if args.no_cache:
+        return None
+    return EmbeddingCache(args.cache_path, max_bytes=args.cache_max_mb * 1024 ** 2)
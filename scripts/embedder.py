@@ -0,0 +1,243 @@
+"""
+Local Embedder
+sentence-transformers model shared by the local ingesters, loaded lazily on
+the first encode call so --help, argument errors, missing API keys and runs
+with nothing new to embed never pay for importing torch or loading weights.
+
+Texts are bucketed by token length and batched by a padded-token budget
+rather than a fixed count, so the short tail chunk of every source doesn't
+get padded out to the length of its full-size neighbours.
+
+With workers > 1, CPU encoding is sharded across a pool of processes, each
+holding its own copy of the model and limited to a few torch threads so the
+pool doesn't oversubscribe the cores. Shards are contiguous and reassembled
+in order, so the output lines up with the input exactly as before.
+
+Three CPU/GPU backends produce vectors in the same space:
+
+    torch      full-precision PyTorch (the original path)
+    onnx       ONNX Runtime export of the same weights
+    onnx-int8  dynamically int8-quantized ONNX model (fastest on CPU)
+"""
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+DEFAULT_ENCODE_BATCH_SIZE = 32
+# Padded tokens per forward pass: 32 full-length (256-token) MiniLM inputs
+DEFAULT_TOKEN_BUDGET = 8192
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+DEFAULT_BACKEND = "torch"
+# Pre-quantized export shipped in the model repo; AVX2 runs on any modern x86 CPU
+QUANTIZED_ONNX_FILE = "onnx/model_quint8_avx2.onnx"
+# Shards per worker, so one slow shard doesn't leave the other workers idle
+SHARDS_PER_WORKER = 4
+
+
+class LocalEmbedder:
+    """Lazily-loaded sentence-transformers model with optional embedding cache."""
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, device: str = None,
+                 batch_size: int = DEFAULT_ENCODE_BATCH_SIZE, cache=None, backend: str = DEFAULT_BACKEND,
+                 token_budget: int = DEFAULT_TOKEN_BUDGET, workers: int = 1, threads_per_worker: int = None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend '{backend}', expected one of {BACKENDS}")
+        self.model_name = model_name
+        self.backend = backend
+        self.batch_size = batch_size
+        self.token_budget = token_budget
+        self.cache = cache
+        self.workers = max(1, workers)
+        # Default: split the cores evenly between workers
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // self.workers)
+        self._device = device
+        self._model = None
+        self._pool = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            start = time.perf_counter()
+            print(f"Loading sentence-transformers model {self.model_name} ({self.backend} backend)...")
+            import torch
+            from sentence_transformers import SentenceTransformer
+
+            if self._device is None:
+                # Move model to GPU if available
+                self._device = 'cuda' if torch.cuda.is_available() else 'cpu'
+            if self.backend == "torch":
+                self._model = SentenceTransformer(self.model_name, device=self._device)
+            else:
+                try:
+                    import onnxruntime  # noqa: F401
+                except ImportError:
+                    raise RuntimeError(f"The {self.backend} backend needs ONNX Runtime: "
+                                       f"pip install 'sentence-transformers[onnx]'")
+                model_kwargs = {"file_name": QUANTIZED_ONNX_FILE} if self.backend == "onnx-int8" else {}
+                self._model = SentenceTransformer(self.model_name, device=self._device,
+                                                  backend="onnx", model_kwargs=model_kwargs)
+            print(f"Model loaded on device: {self._device} ({time.perf_counter() - start:.1f}s)")
+        return self._model
+
+    @property
+    def cache_key(self) -> str:
+        """Cache namespace: quantized vectors are close to, but not identical to, torch ones."""
+        return self.model_name if self.backend == "torch" else f"{self.model_name}@{self.backend}"
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def token_lengths(self, texts) -> np.ndarray:
+        """Tokenized length of each text, including special tokens, capped at max_seq_length."""
+        model = self.model
+        encoded = model.tokenizer(list(texts), add_special_tokens=True, truncation=True,
+                                  max_length=model.max_seq_length)
+        return np.array([len(ids) for ids in encoded["input_ids"]])
+
+    def _encode_fixed(self, texts, batch_size):
+        return self.model.encode(
+            texts,
+            batch_size=batch_size,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            device=self._device
+        )
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            print(f"Starting {self.workers} embedding workers ({self.threads_per_worker} threads each)...")
+            # spawn, not fork: forking a process that has touched torch's thread pools can deadlock
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.model_name, self.backend, self.batch_size, self.token_budget,
+                          self.threads_per_worker),
+            )
+        return self._pool
+
+    def _encode_parallel(self, texts):
+        """Encode contiguous shards in the worker pool and stack them back in input order."""
+        shard_size = max(self.batch_size, -(-len(texts) // (self.workers * SHARDS_PER_WORKER)))
+        shards = [texts[i:i + shard_size] for i in range(0, len(texts), shard_size)]
+        return np.vstack(list(self._get_pool().map(_encode_in_worker, shards)))
+
+    def _encode(self, texts):
+        if self.workers > 1 and len(texts) > self.batch_size:
+            return self._encode_parallel(texts)
+        if not self.token_budget:
+            return self._encode_fixed(texts, self.batch_size)
+
+        # Encode each length bucket as one batch, then scatter back to input order
+        batches = plan_token_batches(self.token_lengths(texts), self.token_budget)
+        output = None
+        for indices in batches:
+            vectors = self._encode_fixed([texts[i] for i in indices], len(indices))
+            if output is None:
+                output = np.empty((len(texts), vectors.shape[1]), dtype=vectors.dtype)
+            output[indices] = vectors
+        return output
+
+    def encode(self, texts) -> np.ndarray:
+        """Embed a list of texts, consulting the cache first if one is attached."""
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        if self.cache is not None:
+            return np.vstack(self.cache.cached(self.cache_key, self._encode)(texts))
+        return self._encode(texts)
+
+    def embed_chunks(self, chunks) -> np.ndarray:
+        """Pipeline embed_fn: embed a list of {"text", "metadata"} chunk dicts."""
+        return self.encode([c["text"] for c in chunks])
+
+    def close(self):
+        """Shut down the worker pool, if one was started."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+# Per-process embedder used by pool workers
+_worker_embedder = None
+
+
+def _init_worker(model_name, backend, batch_size, token_budget, threads):
+    global _worker_embedder
+    # Cap intra-op threads before torch is imported so every worker stays in its share of the cores
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["MKL_NUM_THREADS"] = str(threads)
+    import torch
+    torch.set_num_threads(threads)
+    _worker_embedder = LocalEmbedder(model_name, device="cpu", batch_size=batch_size,
+                                     backend=backend, token_budget=token_budget)
+
+
+def _encode_in_worker(texts):
+    return _worker_embedder._encode(texts)
+
+
+def plan_token_batches(lengths, token_budget: int):
+    """Group indices into batches whose padded size (n * longest) fits token_budget.
+
+    Indices are visited longest-first, so each batch holds texts of similar
+    length and padding waste stays small. Returns a list of index arrays.
+    """
+    lengths = np.asarray(lengths)
+    order = np.argsort(-lengths, kind="stable")
+    batches, current, longest = [], [], 0
+    for i in order:
+        longest_with = max(longest, int(lengths[i]))
+        if current and longest_with * (len(current) + 1) > token_budget:
+            batches.append(np.array(current))
+            current, longest_with = [], int(lengths[i])
+        current.append(i)
+        longest = longest_with
+    if current:
+        batches.append(np.array(current))
+    return batches
+
+
+_embedders = {}
+
+
+def get_embedder(model_name: str = DEFAULT_MODEL, backend: str = DEFAULT_BACKEND, cache=None,
+                 **kwargs) -> LocalEmbedder:
+    """Return the process-wide embedder for (model_name, backend), creating it (unloaded) if needed.
+
+    kwargs only apply when the embedder is first created; a cache, if given,
+    is attached to the shared instance either way.
+    """
+    embedder = _embedders.get((model_name, backend))
+    if embedder is None:
+        embedder = LocalEmbedder(model_name, backend=backend, **kwargs)
+        _embedders[(model_name, backend)] = embedder
+    if cache is not None:
+        embedder.cache = cache
+    return embedder
+
+
+def add_embedder_arguments(parser, default_model: str = DEFAULT_MODEL):
+    """Register the local-embedding CLI flags shared by the ingesters."""
+    parser.add_argument("--model", type=str, default=default_model,
+                        help="sentence-transformers model; each model gets its own store next to the others")
+    parser.add_argument("--backend", type=str, default=DEFAULT_BACKEND, choices=BACKENDS,
+                        help="Embedding backend: PyTorch, ONNX Runtime, or int8-quantized ONNX")
+    parser.add_argument("--token-budget", type=int, default=DEFAULT_TOKEN_BUDGET,
+                        help="Padded tokens per encode batch (0 = fixed batches of 32)")
+    parser.add_argument("--embed-workers", type=int, default=1,
+                        help="CPU encode processes; raise --batch-size too so each worker gets full batches")
+    parser.add_argument("--embed-threads", type=int, default=None,
+                        help="Torch threads per encode process (default: cores / --embed-workers)")
+
+
+def embedder_from_args(args, cache=None) -> LocalEmbedder:
+    """Build the shared embedder described by add_embedder_arguments() flags."""
+    return get_embedder(args.model, backend=args.backend, cache=cache, token_budget=args.token_budget,
+                        workers=args.embed_workers, threads_per_worker=args.embed_threads)
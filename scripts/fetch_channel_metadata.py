@@ -4,10 +4,11 @@ Gets channel name, avatar, description, and other metadata
 """
 import os
 import json
-import requests
 from pathlib import Path
 from dotenv import load_dotenv
 
+from http_client import default_client
+
 # Load .env from project root
 env_path = Path(__file__).parent.parent / '.env'
 load_dotenv(dotenv_path=env_path, override=True)
@@ -51,7 +52,7 @@ def resolve_channel_id(channel_url):
         "key": YOUTUBE_API_KEY,
         "maxResults": 1,
     }
-    resp = requests.get(url, params=params, timeout=10)
+    resp = default_client().get(url, params=params, timeout=10)
     resp.raise_for_status()
     data = resp.json()
     items = data.get("items", [])
@@ -69,7 +70,7 @@ def get_channel_metadata(channel_id):
         "key": YOUTUBE_API_KEY,
     }
 
-    resp = requests.get(url, params=params, timeout=10)
+    resp = default_client().get(url, params=params, timeout=10)
     resp.raise_for_status()
     data = resp.json()
 
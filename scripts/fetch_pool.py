@@ -0,0 +1,78 @@
+"""
+Fetch Pool
+Bounded-concurrency fetching for network-bound ingestion stages, with
+per-host rate limiting and results delivered in input order.
+"""
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+
+class HostRateLimiter:
+    """Token bucket per host: at most `rate` requests/second with bursts of `burst`.
+
+    host_rates overrides the rate for a domain and its subdomains, which then
+    share one bucket (e.g. {"sec.gov": 10} covers www.sec.gov and data.sec.gov).
+    """
+
+    def __init__(self, rate: float, burst: int = 1, host_rates: dict = None):
+        self.rate = rate
+        self.burst = burst
+        self.host_rates = dict(host_rates or {})
+        self._buckets = {}  # host -> (tokens, last_refill)
+        self._lock = threading.Lock()
+
+    def _bucket(self, host: str):
+        for domain, rate in self.host_rates.items():
+            if host == domain or host.endswith("." + domain):
+                return domain, rate
+        return host, self.rate
+
+    def wait(self, url_or_host: str):
+        """Block until a request to this host is allowed."""
+        host = urlparse(url_or_host).hostname if "://" in url_or_host else url_or_host
+        host, rate = self._bucket(host or "")
+        if not rate:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            tokens, last = self._buckets.get(host, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * rate)
+            # Take a token now (possibly going negative) and sleep off the debt
+            tokens -= 1
+            self._buckets[host] = (tokens, now)
+            delay = -tokens / rate if tokens < 0 else 0.0
+
+        if delay:
+            time.sleep(delay)
+
+
+def fetch_ordered(fn, items, workers: int = 8):
+    """Run fn(item) on a thread pool and yield (item, result) in input order.
+
+    At most 2 * workers calls are in flight, so a slow head-of-line item
+    doesn't let completed results pile up without bound. Results are yielded
+    as soon as they and everything before them are done, so a consumer can
+    start work while later items are still being fetched.
+    """
+    items = iter(items)
+    pool = ThreadPoolExecutor(max_workers=workers)
+    pending = deque()
+    try:
+        for item in items:
+            pending.append((item, pool.submit(fn, item)))
+            if len(pending) >= workers * 2:
+                break
+
+        while pending:
+            item, future = pending.popleft()
+            result = future.result()
+            for next_item in items:
+                pending.append((next_item, pool.submit(fn, next_item)))
+                break
+            yield item, result
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
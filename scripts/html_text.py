@@ -0,0 +1,226 @@
+"""
+HTML Text
+Single-pass streaming HTML-to-text extraction for filings and web pages,
+built on html.parser.HTMLParser so no document tree is ever held in memory.
+
+- script/style/noscript/template/head and nav blocks are dropped, plus any
+  extra tags the caller names (page chrome such as header/footer).
+- Inline XBRL's <ix:header> (hidden facts, contexts, units) and any element
+  styled display:none are dropped with everything inside them.
+- Block elements (p, div, tr, li, headings...) end a block of text; table
+  cells and <br> are separated by a space. Whitespace inside a block is
+  collapsed and blocks are joined by blank lines, so the chunker sees one
+  paragraph per block.
+
+Usage:
+    text = html_to_text(response.content)
+    for block in html_blocks(response.content): ...
+    for block in iter_blocks(decode_chunks(byte_chunks)): ...
+"""
+import re
+import codecs
+from html.parser import HTMLParser
+
+SKIPPED_TAGS = frozenset({"script", "style", "noscript", "template", "head", "nav"})
+# Inline XBRL metadata that is never displayed
+HIDDEN_TAGS = frozenset({"ix:header"})
+# Site navigation and boilerplate around the content of a web page
+PAGE_CHROME_TAGS = frozenset({"header", "footer", "aside"})
+BLOCK_TAGS = frozenset({
+    "address", "article", "blockquote", "body", "caption", "center", "dd", "div", "dl", "dt",
+    "figcaption", "figure", "form", "h1", "h2", "h3", "h4", "h5", "h6", "hr", "html", "li", "main",
+    "ol", "p", "pre", "section", "table", "tbody", "tfoot", "thead", "title", "tr", "ul",
+})
+CELL_TAGS = frozenset({"td", "th"})
+# Elements that never have an end tag
+VOID_TAGS = frozenset({"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta",
+                       "param", "source", "track", "wbr"})
+# Characters fed to the parser at a time
+FEED_CHARS = 1 << 20
+IX_HEADER_START = "<ix:header"
+IX_HEADER_END = "</ix:header>"
+CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?([\w.:-]+)""", re.IGNORECASE)
+
+
+def _hidden_style(attrs) -> bool:
+    for name, value in attrs:
+        if name == "style" and value and "none" in value:
+            return "display:none" in value.replace(" ", "").lower()
+    return False
+
+
+class TextExtractor(HTMLParser):
+    """HTMLParser that collects visible text as blocks; completed blocks accumulate in .blocks."""
+
+    def __init__(self, skip_tags=SKIPPED_TAGS):
+        super().__init__(convert_charrefs=True)
+        self.skip_tags = frozenset(skip_tags) | HIDDEN_TAGS
+        self.blocks = []
+        self._pieces = []
+        # Tag of the skipped element we are inside, and how deeply it is nested in itself
+        self._skipping = None
+        self._skip_depth = 0
+        # Blocks inside <main>, which win over the rest of the page when present
+        self.main_blocks = []
+        self._main_depth = 0
+
+    def _flush(self):
+        if self._pieces:
+            text = " ".join("".join(self._pieces).split())
+            self._pieces = []
+            if text:
+                self.blocks.append(text)
+                if self._main_depth:
+                    self.main_blocks.append(text)
+
+    def handle_starttag(self, tag, attrs):
+        if self._skipping is not None:
+            if tag == self._skipping:
+                self._skip_depth += 1
+            return
+        if tag in VOID_TAGS:
+            if tag == "br":
+                self._pieces.append(" ")
+            elif tag == "hr":
+                self._flush()
+            return
+        if tag in self.skip_tags or _hidden_style(attrs):
+            self._flush()
+            self._skipping = tag
+            self._skip_depth = 1
+            return
+        if tag in CELL_TAGS:
+            self._pieces.append(" ")
+        elif tag in BLOCK_TAGS:
+            self._flush()
+        if tag == "main":
+            self._main_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        # <div/> opens nothing
+        if self._skipping is None:
+            if tag == "br":
+                self._pieces.append(" ")
+            elif tag in BLOCK_TAGS:
+                self._flush()
+
+    def handle_endtag(self, tag):
+        if self._skipping is not None:
+            if tag == self._skipping:
+                self._skip_depth -= 1
+                if not self._skip_depth:
+                    self._skipping = None
+            return
+        if tag in CELL_TAGS:
+            self._pieces.append(" ")
+        elif tag in BLOCK_TAGS:
+            self._flush()
+        if tag == "main" and self._main_depth:
+            self._main_depth -= 1
+
+    def handle_data(self, data):
+        if self._skipping is None:
+            self._pieces.append(data)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def _sniff_encoding(head: bytes) -> str:
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    match = CHARSET_RE.search(head)
+    if match:
+        try:
+            return codecs.lookup(match.group(1).decode("ascii")).name
+        except (LookupError, UnicodeDecodeError):
+            pass
+    return "utf-8"
+
+
+def decode_chunks(byte_chunks, encoding: str = None):
+    """Decode an iterable of bytes incrementally, using the document's <meta charset> if it declares one."""
+    decoder = None
+    for chunk in byte_chunks:
+        if decoder is None:
+            decoder = codecs.getincrementaldecoder(encoding or _sniff_encoding(chunk[:4096]))(errors="replace")
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    if decoder is not None:
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+
+
+def _slices(data, size: int = FEED_CHARS):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def _without_ix_header(chunks):
+    """Cut <ix:header>...</ix:header> out of the text before it reaches the parser.
+
+    The hidden facts and contexts it holds can be a fifth of a filing's tags;
+    finding its end with str.find is far cheaper than parsing them only to
+    discard them. Markers split across chunks are handled by carrying a
+    marker's length of text over to the next chunk.
+    """
+    inside = False
+    carry = ""
+    for chunk in chunks:
+        text = carry + chunk
+        kept = []
+        pos = 0
+        while True:
+            marker = IX_HEADER_END if inside else IX_HEADER_START
+            found = text.find(marker, pos)
+            if found < 0:
+                tail = max(pos, len(text) - len(marker) + 1)
+                if not inside:
+                    kept.append(text[pos:tail])
+                carry = text[tail:]
+                break
+            if not inside:
+                kept.append(text[pos:found])
+            pos = found + len(marker)
+            inside = not inside
+        if kept:
+            yield "".join(kept)
+    if carry and not inside:
+        yield carry
+
+
+def iter_blocks(chunks, skip_tags=SKIPPED_TAGS):
+    """Yield the visible text blocks of an HTML document given as an iterable of str pieces."""
+    parser = TextExtractor(skip_tags)
+    for chunk in _without_ix_header(chunks):
+        parser.feed(chunk)
+        if parser.blocks:
+            yield from parser.blocks
+            parser.blocks = []
+    parser.close()
+    yield from parser.blocks
+
+
+def html_blocks(html, skip_tags=SKIPPED_TAGS):
+    """Yield the visible text blocks of a whole HTML document (bytes or str)."""
+    chunks = decode_chunks(_slices(html)) if isinstance(html, bytes) else _slices(html)
+    return iter_blocks(chunks, skip_tags)
+
+
+def html_to_text(html, skip_tags=SKIPPED_TAGS, main_only: bool = False) -> str:
+    """Visible text of an HTML document (bytes or str), one paragraph per block.
+
+    With main_only, a page that has a <main> element yields only the text
+    inside it.
+    """
+    if not main_only:
+        return "\n\n".join(html_blocks(html, skip_tags))
+    chunks = decode_chunks(_slices(html)) if isinstance(html, bytes) else _slices(html)
+    parser = TextExtractor(skip_tags)
+    for chunk in _without_ix_header(chunks):
+        parser.feed(chunk)
+    parser.close()
+    return "\n\n".join(parser.main_blocks or parser.blocks)
@@ -0,0 +1,240 @@
+"""
+HTTP Client
+Shared HTTP layer for the ingesters: one pooled requests.Session with
+keep-alive connections, per-host token-bucket rate limiting, gzip, retries
+with jittered exponential backoff, and conditional GETs.
+
+Responses are remembered in a cache keyed by URL - in memory by default, or
+the on-disk response_cache.ResponseCache the ingesters open. A remembered
+response within its TTL (response_cache.CACHE_RULES) is returned without a
+request; past it, the GET sends If-None-Match / If-Modified-Since and a 304 is
+answered from the remembered body. An offline client only reads the cache.
+
+SEC hosts share one bucket at SEC's published 10 requests/second; every
+other host gets --rate requests/second.
+
+Usage:
+    client = HttpClient(headers={"User-Agent": "Research Project research@example.com"})
+    filings = client.get("https://data.sec.gov/submissions/CIK0000104169.json").json()
+"""
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from fetch_pool import HostRateLimiter
+from query_cache import TTLCache
+from response_cache import (CACHE_RULES, IMMUTABLE, add_response_cache_arguments, cache_key, cache_ttl,
+                            open_response_cache)
+
+DEFAULT_RATE = 5.0  # requests/second per host
+# Domain-wide limits; subdomains share the bucket
+HOST_RATES = {"sec.gov": 10.0}
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_RETRIES = 4
+BACKOFF_SECONDS = 0.5
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+POOL_SIZE = 16
+# Responses kept in memory when no persistent cache is given (--no-http-cache), at most
+# MEMORY_ENTRIES * MEMORY_MAX_BODY bytes; larger bodies (whole EDGAR filings) are not kept
+MEMORY_ENTRIES = 64
+MEMORY_MAX_BODY = 1024 ** 2
+# Headers kept with a remembered body
+KEPT_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+
+def _retry_after(response, default: float) -> float:
+    """Seconds from a Retry-After header (delta or HTTP date), else default."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return default
+
+
+class OfflineCacheMiss(requests.RequestException):
+    """An offline client was asked for a URL the cache doesn't hold."""
+
+
+def stored_response(url: str, entry: dict) -> requests.Response:
+    """Rebuild a 200 response from a remembered {"content", "headers"} entry."""
+    response = requests.Response()
+    response.status_code = 200
+    response.url = url
+    response.headers = CaseInsensitiveDict(entry["headers"])
+    response.encoding = get_encoding_from_headers(response.headers)
+    response._content = entry["content"]
+    return response
+
+
+class MemoryResponseCache(TTLCache):
+    """The in-memory fallback cache: MEMORY_ENTRIES responses of up to MEMORY_MAX_BODY bytes each."""
+
+    def __init__(self, max_entries: int = MEMORY_ENTRIES, max_body: int = MEMORY_MAX_BODY):
+        super().__init__(max_entries, ttl=0)
+        self.max_body = max_body
+
+    def put(self, key, entry):
+        if len(entry["content"]) <= self.max_body:
+            super().put(key, entry)
+
+
+class HttpClient:
+    """Pooled, rate-limited GETs with retries, caching and ETag/Last-Modified revalidation.
+
+    cache is any object with get(key) -> entry or None and put(key, entry),
+    such as a ResponseCache; by default small responses are kept in memory
+    (MemoryResponseCache) for the life of the client. cache_rules give each URL's TTL.
+    """
+
+    def __init__(self, headers: dict = None, rate: float = DEFAULT_RATE, burst: int = 1,
+                 host_rates: dict = HOST_RATES, max_retries: int = DEFAULT_RETRIES,
+                 timeout: float = DEFAULT_TIMEOUT, cache=None, pool_size: int = POOL_SIZE,
+                 cache_rules=CACHE_RULES, offline: bool = False):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Accept-Encoding"] = "gzip, deflate"
+        self.session.headers.update(headers or {})
+        self.limiter = HostRateLimiter(rate, burst=burst, host_rates=host_rates)
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.cache = cache if cache is not None else MemoryResponseCache()
+        self.cache_rules = cache_rules
+        self.offline = offline
+        self.requests = 0
+        self.retries = 0
+        self.not_modified = 0
+        self.cached = 0
+        self._lock = threading.Lock()
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _send(self, url: str, headers: dict, timeout: float, stream: bool) -> requests.Response:
+        delay = BACKOFF_SECONDS
+        for attempt in range(self.max_retries + 1):
+            self.limiter.wait(url)
+            self._count("requests")
+            try:
+                response = self.session.get(url, headers=headers, timeout=timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                wait = delay
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    return response
+                wait = _retry_after(response, delay)
+                response.close()
+            self._count("retries")
+            # Jitter keeps concurrent workers from retrying in lockstep
+            time.sleep(wait * random.uniform(0.5, 1.5))
+            delay *= 2
+
+    def cached_response(self, url: str):
+        """The remembered response for url regardless of age, or None; never touches the network."""
+        entry = self.cache.get(cache_key(url))
+        return stored_response(url, entry) if entry is not None else None
+
+    def get(self, url: str, params: dict = None, headers: dict = None, timeout: float = None,
+            stream: bool = False, conditional: bool = True) -> requests.Response:
+        """GET url, from the cache while fresh, revalidating it once stale.
+
+        Streamed responses bypass the cache. Non-2xx responses are returned
+        as-is; call raise_for_status() as with requests.
+        """
+        if params:
+            url = requests.Request("GET", url, params=params).prepare().url
+        use_cache = conditional and not stream
+        key = cache_key(url)
+        entry = self.cache.get(key) if use_cache else None
+        now = time.time()
+        if entry is not None and (self.offline or entry.get("expires") is None or entry["expires"] > now):
+            self._count("cached")
+            return stored_response(url, entry)
+        if self.offline:
+            raise OfflineCacheMiss(f"{url} is not in the response cache (offline)")
+
+        headers = dict(headers or {})
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = self._send(url, headers, timeout or self.timeout, stream)
+        ttl = cache_ttl(url, self.cache_rules)
+        expires = None if ttl == IMMUTABLE else now + ttl
+        if response.status_code == 304 and entry is not None:
+            self._count("not_modified")
+            if ttl:
+                self.cache.put(key, dict(entry, expires=expires))
+            return stored_response(url, entry)
+
+        if use_cache and response.status_code == 200:
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+            if ttl or etag or last_modified:
+                self.cache.put(key, {
+                    "etag": etag,
+                    "last_modified": last_modified,
+                    "expires": expires,
+                    "content": response.content,
+                    "headers": {k: response.headers[k] for k in KEPT_HEADERS if k in response.headers},
+                })
+        return response
+
+    def stats_line(self) -> str:
+        line = (f"HTTP: {self.requests} requests, {self.retries} retried, "
+                f"{self.not_modified} not modified, {self.cached} served from cache")
+        if hasattr(self.cache, "stats_line"):
+            line += "\n" + self.cache.stats_line()
+        return line
+
+    def close(self):
+        """Close the session and the cache, if it needs closing."""
+        self.session.close()
+        if hasattr(self.cache, "close"):
+            self.cache.close()
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def default_client() -> HttpClient:
+    """Process-wide client for callers that aren't handed one."""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = HttpClient()
+        return _default_client
+
+
+def add_http_arguments(parser, default_rate: float = DEFAULT_RATE):
+    """Register the HTTP client CLI flags shared by the ingesters."""
+    parser.add_argument("--rate", type=float, default=default_rate,
+                        help="Max requests per second to each host (0 = unlimited; SEC hosts share 10/s)")
+    parser.add_argument("--http-retries", type=int, default=DEFAULT_RETRIES,
+                        help="Retries for connection errors, 429 and 5xx responses")
+    parser.add_argument("--http-timeout", type=float, default=DEFAULT_TIMEOUT, help="Seconds per request")
+    add_response_cache_arguments(parser)
+
+
+def http_client_from_args(args, headers: dict = None, burst: int = 1) -> HttpClient:
+    """The HttpClient described by add_http_arguments() flags, with its response cache open."""
+    return HttpClient(headers=headers, rate=args.rate, burst=burst, max_retries=args.http_retries,
+                      timeout=args.http_timeout, cache=open_response_cache(args), offline=args.offline)
@@ -2,14 +2,18 @@ import os
 import json
 import argparse
 import scrapetube  # still imported but no longer used for listing; kept in case of future use
-import requests
-import time
 from youtube_transcript_api import YouTubeTranscriptApi, TranscriptsDisabled, NoTranscriptFound
 from openai import OpenAI
 from dotenv import load_dotenv
 from tqdm import tqdm
 from pathlib import Path
 
+from chunker import add_chunker_arguments, chunk_cues
+from dedup import add_dedup_arguments, deduplicator_from_args
+from embed_cache import add_cache_arguments, open_cache
+from http_client import default_client
+from remote_embeddings import DEFAULT_BATCH_SIZE, DEFAULT_MAX_IN_FLIGHT, RemoteEmbedder
+
 # Load .env from the project root (one level up from scripts/)
 env_path = Path(__file__).parent.parent / '.env'
 load_dotenv(dotenv_path=env_path, override=True)
@@ -17,11 +21,16 @@ load_dotenv(dotenv_path=env_path, override=True)
 # Configuration
 TOGETHER_API_KEY = os.getenv("TOGETHER_API_KEY")
 YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
-TOGETHER_BASE_URL = "https://api.together.xyz/v1"
+# Override to point at a local OpenAI-compatible server (e.g. scripts/stub_server.py)
+DEFAULT_TOGETHER_BASE_URL = "https://api.together.xyz/v1"
+TOGETHER_BASE_URL = os.getenv("TOGETHER_BASE_URL", DEFAULT_TOGETHER_BASE_URL)
 EMBEDDING_MODEL = "togethercomputer/m2-bert-80M-8k-retrieval"
+# Embedding cache namespace; vectors from any other endpoint (such as the stub server) are kept apart
+EMBEDDING_CACHE_KEY = (EMBEDDING_MODEL if TOGETHER_BASE_URL == DEFAULT_TOGETHER_BASE_URL
+                       else f"{EMBEDDING_MODEL}@{TOGETHER_BASE_URL}")
 OUTPUT_FILE = "data/knowledge_base.json"
 
-if not TOGETHER_API_KEY:
+if not TOGETHER_API_KEY and "api.together.xyz" in TOGETHER_BASE_URL:
     print("Error: TOGETHER_API_KEY not found in environment variables.")
     exit(1)
 
@@ -31,8 +40,9 @@ if not YOUTUBE_API_KEY:
     exit(1)
 
 client = OpenAI(
-    api_key=TOGETHER_API_KEY,
-    base_url=TOGETHER_BASE_URL
+    api_key=TOGETHER_API_KEY or "local-stub",
+    base_url=TOGETHER_BASE_URL,
+    max_retries=0  # RemoteEmbedder handles retries and 429 backoff itself
 )
 
 def _extract_handle_or_id(channel_url: str):
@@ -67,7 +77,7 @@ def _resolve_channel_id(channel_url: str) -> str:
         "key": YOUTUBE_API_KEY,
         "maxResults": 1,
     }
-    resp = requests.get(url, params=params, timeout=10)
+    resp = default_client().get(url, params=params, timeout=10)
     resp.raise_for_status()
     data = resp.json()
     items = data.get("items", [])
@@ -96,7 +106,7 @@ def get_channel_videos(channel_url):
                 "pageToken": next_page_token,
                 "key": YOUTUBE_API_KEY,
             }
-            resp = requests.get(url, params=params, timeout=10)
+            resp = default_client().get(url, params=params, timeout=10)
             resp.raise_for_status()
             data = resp.json()
             for item in data.get("items", []):
@@ -114,53 +124,50 @@ def get_channel_videos(channel_url):
         return []
 
 def get_transcript(video_id):
+    """Transcript as a list of (start, end, text) cues, or None."""
     try:
         api = YouTubeTranscriptApi()
         transcript_result = api.fetch(video_id)
-        # Combine text from snippets
-        full_text = " ".join([snippet.text for snippet in transcript_result.snippets])
-        return full_text
+        return [(snippet.start, snippet.start + snippet.duration, snippet.text)
+                for snippet in transcript_result.snippets]
     except (TranscriptsDisabled, NoTranscriptFound):
         return None
     except Exception as e:
         print(f"Error fetching transcript for {video_id}: {e}")
         return None
 
-def chunk_text(text, chunk_size=1000, overlap=200):
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        chunk = text[start:end]
-        chunks.append(chunk)
-        start += chunk_size - overlap
-    return chunks
-
-def generate_embeddings(chunks):
-    embeddings = []
-    print("Generating embeddings...")
-    # Batching could be added here, but for simplicity doing one by one or small batches
-    # Together AI rate limits might apply.
-    
-    for chunk in tqdm(chunks):
-        try:
-            response = client.embeddings.create(
-                input=chunk,
-                model=EMBEDDING_MODEL
-            )
-            embedding = response.data[0].embedding
-            embeddings.append({
-                "text": chunk,
-                "embedding": embedding
-            })
-        except Exception as e:
-            print(f"Error embedding chunk: {e}")
-    return embeddings
+def generate_embeddings(chunks, batch_size=DEFAULT_BATCH_SIZE, max_in_flight=DEFAULT_MAX_IN_FLIGHT, cache=None):
+    """Embed chunk dicts in place via batched API requests; returns the ones that succeeded."""
+    print(f"Generating embeddings for {len(chunks)} chunks "
+          f"(batch size {batch_size}, {max_in_flight} requests in flight)...")
+    embedder = RemoteEmbedder(client, EMBEDDING_MODEL, batch_size=batch_size, max_in_flight=max_in_flight)
+
+    with tqdm(total=len(chunks)) as progress:
+        embed = lambda texts: embedder.embed(texts, progress=progress)
+        # Only cache misses are sent to the API
+        if cache is not None:
+            embed = cache.cached(EMBEDDING_CACHE_KEY, embed)
+        vectors = embed([c["text"] for c in chunks])
+
+    knowledge_base = []
+    for chunk, vector in zip(chunks, vectors):
+        if vector is not None:
+            chunk["embedding"] = [float(x) for x in vector]
+            knowledge_base.append(chunk)
+
+    print(f"Embedded {len(knowledge_base)}/{len(chunks)} chunks in {embedder.requests} requests "
+          f"({embedder.rate_limited} rate-limited)")
+    return knowledge_base
 
 def main():
     parser = argparse.ArgumentParser(description="Ingest YouTube channel content.")
     parser.add_argument("--channel", type=str, help="YouTube Channel URL")
     parser.add_argument("--limit", type=int, help="Limit number of videos to process")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Texts per embedding request")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_MAX_IN_FLIGHT, help="Embedding requests in flight at once")
+    add_chunker_arguments(parser)
+    add_dedup_arguments(parser)
+    add_cache_arguments(parser)
     args = parser.parse_args()
 
     channel_url = args.channel
@@ -189,54 +196,38 @@ def main():
         video_ids = video_ids[:limit]
 
     all_chunks = []
+    dedup = deduplicator_from_args(args)
     
     print(f"Processing {len(video_ids)} videos...")
     for video_id in tqdm(video_ids):
-        transcript_text = get_transcript(video_id)
-        if transcript_text:
-            # Add video ID to text for reference? Or store metadata.
-            # Simple approach: just text. Better: Store metadata.
-            chunks = chunk_text(transcript_text)
-            # Add metadata to chunks
+        cues = get_transcript(video_id)
+        if cues:
+            if dedup is not None:
+                cues = dedup.cues(cues)
+            chunks = list(chunk_cues(cues, args.chunk_tokens, args.chunk_overlap))
+            if dedup is not None:
+                chunks = dedup.filter_chunks(chunks)
+            # Chunks carry their start/end timestamps; add the video ID alongside
             for chunk in chunks:
-                all_chunks.append({
-                    "text": chunk,
-                    "metadata": {"video_id": video_id}
-                })
+                chunk["metadata"]["video_id"] = video_id
+                all_chunks.append(chunk)
 
     print(f"Total chunks: {len(all_chunks)}")
+    if dedup is not None:
+        print(dedup.stats_line())
     if not all_chunks:
         print("No content found.")
         return
 
     # Generate embeddings
-    # We need to separate text for embedding
-    texts = [c["text"] for c in all_chunks]
-    
-    # Create the knowledge base structure
-    knowledge_base = []
-    
-    print("Generating embeddings...")
-    # Batch process if possible to save time, but let's be safe with loop
-    for item in tqdm(all_chunks):
-        max_retries = 5
-        retry_delay = 2
-        for attempt in range(max_retries):
-            try:
-                response = client.embeddings.create(
-                    input=item["text"],
-                    model=EMBEDDING_MODEL
-                )
-                item["embedding"] = response.data[0].embedding
-                knowledge_base.append(item)
-                break  # Success, exit retry loop
-            except Exception as e:
-                if attempt < max_retries - 1:
-                    print(f"\nRetry {attempt + 1}/{max_retries} after error: {str(e)[:100]}")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2  # Exponential backoff
-                else:
-                    print(f"\nFailed after {max_retries} attempts: {str(e)[:100]}")
+    cache = open_cache(args)
+    try:
+        knowledge_base = generate_embeddings(all_chunks, batch_size=args.batch_size,
+                                             max_in_flight=args.concurrency, cache=cache)
+    finally:
+        if cache is not None:
+            print(cache.stats_line())
+            cache.close()
 
     # Save to file
     with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
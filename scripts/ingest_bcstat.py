@@ -1,21 +1,19 @@
 import os
 import json
 import argparse
-import requests
-import time
 from pathlib import Path
-from sentence_transformers import SentenceTransformer
-import torch
 from tqdm import tqdm
-from bs4 import BeautifulSoup
-import re
 
-# Initialize sentence-transformers model
-print("Loading sentence-transformers model...")
-model = SentenceTransformer('all-MiniLM-L6-v2')
-device = 'cuda' if torch.cuda.is_available() else 'cpu'
-model = model.to(device)
-print(f"Model loaded on device: {device}")
+from kb_store import model_kb_dir
+from html_text import PAGE_CHROME_TAGS, SKIPPED_TAGS, html_to_text
+from http_client import add_http_arguments, default_client, http_client_from_args
+from embedder import DEFAULT_MODEL
+from manifest import IngestManifest
+from pipeline import add_pipeline_arguments, run_from_args
+
+# Default local sentence-transformers model (--model); loaded lazily on the first encode call
+# all-MiniLM-L6-v2: Fast, efficient, and produces 384-dimensional embeddings
+EMBEDDING_MODEL = DEFAULT_MODEL
 
 # Baltimore County BCstat configuration
 BCSTAT_BASE = "https://www.baltimorecountymd.gov"
@@ -33,102 +31,46 @@ BCSTAT_URLS = {
     'health_tool_info': f"{BCSTAT_BASE}/departments/county-executive/news/baltimore-county-launches-social-determinants-health-web-tool",
 }
 
-def fetch_page_content(url):
+def fetch_page_content(url, client=None):
     """Fetch and extract text content from a web page."""
+    client = client or default_client()
     print(f"Fetching content from {url}...")
 
     try:
-        response = requests.get(url, headers=HEADERS)
+        response = client.get(url, headers=HEADERS)
         response.raise_for_status()
 
-        # Parse HTML
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        # Remove script, style, and nav elements
-        for element in soup(['script', 'style', 'nav', 'header', 'footer']):
-            element.decompose()
-
-        # Get main content - look for common content containers
-        main_content = soup.find('main') or soup.find('div', class_=re.compile('content|main|article'))
-
-        if main_content:
-            text = main_content.get_text()
-        else:
-            text = soup.get_text()
-
-        # Clean up text
-        lines = (line.strip() for line in text.splitlines())
-        chunks_text = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = ' '.join(chunk for chunk in chunks_text if chunk)
-
-        # Remove excessive whitespace
-        text = re.sub(r'\s+', ' ', text).strip()
-
-        time.sleep(1.0)  # Be respectful with rate limiting
-        return text
+        # Page text without scripts, navigation, header and footer; just <main> when the page has one
+        return html_to_text(response.content, SKIPPED_TAGS | PAGE_CHROME_TAGS, main_only=True)
     except Exception as e:
         print(f"Error fetching {url}: {e}")
         return None
 
-def scrape_bcstat_data():
-    """Scrape Baltimore County BCstat pages for content."""
-    all_content = []
-
+def scrape_bcstat_data(client=None):
+    """Scrape Baltimore County BCstat pages for content, yielding each page as it is fetched."""
     for source_name, url in BCSTAT_URLS.items():
         print(f"\n{'='*60}")
         print(f"Scraping: {source_name}")
         print(f"{'='*60}")
 
-        content = fetch_page_content(url)
+        content = fetch_page_content(url, client)
 
         if content:
-            all_content.append({
+            print(f"Extracted {len(content)} characters from {source_name}")
+            yield {
                 'source': source_name,
                 'url': url,
                 'text': content
-            })
-            print(f"Extracted {len(content)} characters from {source_name}")
+            }
         else:
             print(f"Failed to extract content from {source_name}")
 
-    return all_content
-
-def chunk_text(text, chunk_size=1000, overlap=200):
-    """Split text into overlapping chunks."""
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        chunk = text[start:end]
-        if chunk.strip():  # Only add non-empty chunks
-            chunks.append(chunk)
-        start += chunk_size - overlap
-    return chunks
-
-def generate_embeddings_local(chunks):
-    """Generate embeddings using local sentence-transformers model."""
-    print(f"Generating embeddings for {len(chunks)} chunks...")
-
-    texts = [c["text"] for c in chunks]
-
-    embeddings = model.encode(
-        texts,
-        batch_size=32,
-        show_progress_bar=True,
-        convert_to_numpy=True,
-        device=device
-    )
-
-    knowledge_base = []
-    for i, chunk in enumerate(chunks):
-        chunk["embedding"] = embeddings[i].tolist()
-        knowledge_base.append(chunk)
-
-    return knowledge_base
-
 def main():
     parser = argparse.ArgumentParser(description="Ingest Baltimore County BCstat data.")
     parser.add_argument("--twin-id", type=str, default="bcstat", help="Twin ID for output directory")
+    # One page a second keeps the county site's load as light as before
+    add_http_arguments(parser, default_rate=1.0)
+    add_pipeline_arguments(parser, default_model=EMBEDDING_MODEL)
     args = parser.parse_args()
 
     twin_id = args.twin_id
@@ -156,50 +98,27 @@ def main():
         json.dump(metadata, f, indent=2)
     print(f"Saved metadata to {metadata_path}")
 
-    # Scrape BCstat data
-    content_items = scrape_bcstat_data()
-
-    if not content_items:
-        print("No content found.")
-        return
-
-    # Process each content item into chunks
-    all_chunks = []
+    client = http_client_from_args(args, headers=HEADERS)
 
-    for item in content_items:
-        # Chunk the text
-        chunks = chunk_text(item['text'])
-        print(f"Created {len(chunks)} chunks from {item['source']}")
+    # Pages can change, so the pipeline compares content hashes against the manifest
+    kb_dir = model_kb_dir(twin_dir, args.model)
+    manifest = IngestManifest.load(kb_dir)
 
-        # Add metadata to chunks
-        for chunk in chunks:
-            all_chunks.append({
-                "text": chunk,
+    def page_sources():
+        # Scrape BCstat data
+        for item in scrape_bcstat_data(client):
+            yield {
+                "key": item['url'],
+                "text": item['text'],
                 "metadata": {
                     "source": item['source'],
                     "url": item['url'],
                     "type": "bcstat_web_content"
                 }
-            })
-
-    print(f"\n{'='*60}")
-    print(f"Total chunks collected: {len(all_chunks)}")
-    print(f"{'='*60}\n")
-
-    if not all_chunks:
-        print("No chunks created.")
-        return
-
-    # Generate embeddings
-    knowledge_base = generate_embeddings_local(all_chunks)
-
-    # Save knowledge base
-    kb_path = twin_dir / "knowledge_base.json"
-    with open(kb_path, "w", encoding="utf-8") as f:
-        json.dump(knowledge_base, f)
+            }
 
-    print(f"\nSaved knowledge base with {len(knowledge_base)} chunks to {kb_path}")
-    print(f"Knowledge base size: {kb_path.stat().st_size / 1024 / 1024:.2f} MB")
+    # Chunk, embed and append each page as soon as it is scraped
+    run_from_args(args, kb_dir, manifest, page_sources(), client, noun="pages")
 
 if __name__ == "__main__":
     main()
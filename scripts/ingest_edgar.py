@@ -1,29 +1,33 @@
 import os
 import json
 import argparse
-import requests
-import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from sentence_transformers import SentenceTransformer
-import torch
 from tqdm import tqdm
-from bs4 import BeautifulSoup
-import re
 
-# Initialize sentence-transformers model
-print("Loading sentence-transformers model...")
-model = SentenceTransformer('all-MiniLM-L6-v2')
-device = 'cuda' if torch.cuda.is_available() else 'cpu'
-model = model.to(device)
-print(f"Model loaded on device: {device}")
+from kb_store import model_kb_dir
+from fetch_pool import fetch_ordered
+from edgar_sections import filing_sections, items_for_form
+from html_text import html_blocks
+from http_client import add_http_arguments, default_client, http_client_from_args
+from embedder import DEFAULT_MODEL
+from manifest import IngestManifest
+from pipeline import add_pipeline_arguments, run_from_args
+
+# Default local sentence-transformers model (--model); loaded lazily on the first encode call
+# all-MiniLM-L6-v2: Fast, efficient, and produces 384-dimensional embeddings
+EMBEDDING_MODEL = DEFAULT_MODEL
 
 # SEC Edgar API configuration
 SEC_API_BASE = "https://data.sec.gov"
-# SEC requires a proper User-Agent with company/email
+SEC_ARCHIVES_BASE = "https://www.sec.gov/Archives/edgar/data"
+# Ticker -> CIK and company name for every SEC registrant
+COMPANY_TICKERS_URL = "https://www.sec.gov/files/company_tickers.json"
+# SEC requires a proper User-Agent with company/email; the HTTP client adds gzip
+# and keeps data.sec.gov and www.sec.gov together under SEC's 10 requests/second
 HEADERS = {
-    'User-Agent': 'Research Project research@example.com',
-    'Accept-Encoding': 'gzip, deflate',
-    'Host': 'data.sec.gov'
+    'User-Agent': 'Research Project research@example.com'
 }
 
 # Major retail companies
@@ -35,17 +39,58 @@ RETAIL_COMPANIES = {
     'AMZN': {'name': 'Amazon.com Inc.', 'cik': '0001018724'}
 }
 
-def get_company_filings(cik, filing_type='10-K', count=3):
+def load_companies(path, client=None):
+    """Companies from a list file, in the same {ticker: {'name', 'cik'}} shape as RETAIL_COMPANIES.
+
+    Each line holds a ticker, a CIK, or "TICKER,CIK[,Name]"; blank lines and
+    text after # are ignored. Missing CIKs, tickers and names are looked up in
+    SEC's company_tickers.json.
+    """
+    entries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = [part.strip() for part in line.split('#', 1)[0].split(',')]
+            if not parts[0]:
+                continue
+            if parts[0].isdigit():
+                entries.append((None, parts[0], None))
+            else:
+                entries.append((parts[0].upper(), parts[1] if len(parts) > 1 and parts[1] else None,
+                                ', '.join(parts[2:]) or None))
+
+    by_ticker, by_cik = {}, {}
+    if any(cik is None or ticker is None or name is None for ticker, cik, name in entries):
+        client = client or default_client()
+        response = client.get(COMPANY_TICKERS_URL, headers=HEADERS)
+        response.raise_for_status()
+        for record in response.json().values():
+            by_ticker[record['ticker'].upper()] = record
+            # A CIK can have several tickers (share classes); keep the first listed
+            by_cik.setdefault(int(record['cik_str']), record)
+
+    companies = {}
+    for ticker, cik, name in entries:
+        record = by_ticker.get(ticker) if cik is None else by_cik.get(int(cik))
+        if record is None and cik is None:
+            print(f"Skipping {ticker}: not in SEC's ticker list")
+            continue
+        cik = str(int(cik if cik is not None else record['cik_str'])).zfill(10)
+        ticker = ticker or (record['ticker'].upper() if record else cik)
+        companies[ticker] = {'name': name or (record['title'] if record else ticker), 'cik': cik}
+    return companies
+
+def get_company_filings(cik, filing_type='10-K', count=3, client=None):
     """Fetch recent filings for a company from SEC Edgar."""
+    client = client or default_client()
     print(f"Fetching {filing_type} filings for CIK {cik}...")
 
     # Pad CIK to 10 digits
-    cik_padded = cik.replace('000000', '').zfill(10)
+    cik_padded = str(int(cik)).zfill(10)
 
     url = f"{SEC_API_BASE}/submissions/CIK{cik_padded}.json"
 
     try:
-        response = requests.get(url, headers=HEADERS)
+        response = client.get(url, headers=HEADERS)
         response.raise_for_status()
         data = response.json()
 
@@ -79,8 +124,20 @@ def get_company_filings(cik, filing_type='10-K', count=3):
         print(f"Error fetching filings for CIK {cik}: {e}")
         return []
 
-def download_filing_text(filing_info):
-    """Download and extract text from a SEC filing."""
+def extract_filing_sections(html: bytes, items=None, form: str = '10-K'):
+    """The filing's Items (only those in items; all when None) and its total text length.
+
+    Text comes without inline XBRL's hidden facts; runs in the parse worker processes.
+    """
+    blocks = list(html_blocks(html))
+    return filing_sections(blocks, items=items, form=form), sum(len(block) for block in blocks)
+
+def download_filing_sections(filing_info, client=None, parse_pool=None, items=None):
+    """Download a SEC filing and split it into its Items, parsing in parse_pool if given.
+
+    Returns extract_filing_sections()'s (sections, total_chars), or None on error.
+    """
+    client = client or default_client()
     cik = filing_info['cik']
     accession = filing_info['accession']
     accession_with_dashes = filing_info['accession_with_dashes']
@@ -89,90 +146,53 @@ def download_filing_text(filing_info):
     # Construct URL - Use www.sec.gov for document downloads, not data.sec.gov
     # CIK doesn't need leading zeros in URL path
     cik_no_leading_zeros = str(int(cik))
-    url = f"https://www.sec.gov/Archives/edgar/data/{cik_no_leading_zeros}/{accession}/{document}"
+    url = f"{SEC_ARCHIVES_BASE}/{cik_no_leading_zeros}/{accession}/{document}"
 
     try:
-        print(f"Downloading {filing_info['form']} from {filing_info['date']}...")
-        # Use appropriate headers for www.sec.gov
-        download_headers = {
-            'User-Agent': 'Research Project research@example.com'
-        }
-        response = requests.get(url, headers=download_headers)
+        print(f"Downloading {filing_info['form']} from {filing_info['date']} (CIK {cik_no_leading_zeros})...")
+        response = client.get(url, headers=HEADERS)
         response.raise_for_status()
 
-        # Parse HTML and extract text
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        # Remove script and style elements
-        for script in soup(["script", "style"]):
-            script.decompose()
-
-        # Get text
-        text = soup.get_text()
-
-        # Clean up text
-        lines = (line.strip() for line in text.splitlines())
-        chunks_text = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = ' '.join(chunk for chunk in chunks_text if chunk)
-
-        # Limit text length (filings can be very long)
-        max_chars = 500000  # ~500KB of text
-        if len(text) > max_chars:
-            text = text[:max_chars]
-
-        time.sleep(1.0)  # SEC requires 10 requests per second max, so wait 1 second
-        return text
+        # This thread waits on the parse while the other download threads keep fetching
+        if parse_pool is not None:
+            return parse_pool.submit(extract_filing_sections, response.content, items, filing_info['form']).result()
+        return extract_filing_sections(response.content, items, filing_info['form'])
     except Exception as e:
         print(f"Error downloading filing: {e}")
         return None
 
-def chunk_text(text, chunk_size=1000, overlap=200):
-    """Split text into overlapping chunks."""
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        chunk = text[start:end]
-        chunks.append(chunk)
-        start += chunk_size - overlap
-    return chunks
-
-def generate_embeddings_local(chunks):
-    """Generate embeddings using local sentence-transformers model."""
-    print(f"Generating embeddings for {len(chunks)} chunks...")
-
-    texts = [c["text"] for c in chunks]
-
-    embeddings = model.encode(
-        texts,
-        batch_size=32,
-        show_progress_bar=True,
-        convert_to_numpy=True,
-        device=device
-    )
-
-    knowledge_base = []
-    for i, chunk in enumerate(chunks):
-        chunk["embedding"] = embeddings[i].tolist()
-        knowledge_base.append(chunk)
-
-    return knowledge_base
-
 def main():
     parser = argparse.ArgumentParser(description="Ingest SEC Edgar filings for retail industry.")
     parser.add_argument("--twin-id", type=str, default="retail", help="Twin ID for output directory")
     parser.add_argument("--filing-type", type=str, default="10-K", help="Filing type (10-K, 10-Q, 8-K)")
     parser.add_argument("--filings-per-company", type=int, default=2, help="Number of filings per company")
+    parser.add_argument("--companies", type=str, default=None,
+                        help="File listing companies, one ticker, CIK or 'TICKER,CIK[,Name]' per line (default: five retailers)")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="Submissions lookups and filing downloads in flight (SEC's 10 requests/second still applies)")
+    parser.add_argument("--parse-workers", type=int, default=(os.cpu_count() or 1) - 1,
+                        help="Processes parsing filing HTML; one core is left for embedding (0 = parse in the download threads)")
+    parser.add_argument("--items", type=str, default=None,
+                        help="Comma-separated filing Items to ingest, optionally as PART:ITEM, e.g. 1,1A,7 or "
+                             "I:2,II:1A, or 'all' (default: 1,1A,7,7A,8 for a 10-K, I:1,I:2,I:3,II:1A for a 10-Q, "
+                             "every Item otherwise); use --full after changing it")
+    add_http_arguments(parser)
+    add_pipeline_arguments(parser, default_model=EMBEDDING_MODEL)
     args = parser.parse_args()
 
     twin_id = args.twin_id
     filing_type = args.filing_type
     filings_per_company = args.filings_per_company
+    items = items_for_form(args.items, filing_type)
 
     # Create twin directory
     twin_dir = Path("data/twins") / twin_id
     twin_dir.mkdir(parents=True, exist_ok=True)
 
+    client = http_client_from_args(args, headers=HEADERS)
+    companies = load_companies(args.companies, client) if args.companies else RETAIL_COMPANIES
+    print(f"Ingesting {filing_type} filings for {len(companies)} companies")
+
     # Create metadata
     metadata = {
         "channelId": "retail-industry",
@@ -186,66 +206,82 @@ def main():
         }
     }
 
+    if args.companies:
+        names = [info['name'] for info in companies.values()]
+        metadata["description"] = (f"AI assistant with knowledge of SEC filings from {len(names)} companies "
+                                   f"({', '.join(names[:5])}{', ...' if len(names) > 5 else ''}).")
+
     # Save metadata
     metadata_path = twin_dir / "metadata.json"
     with open(metadata_path, "w", encoding="utf-8") as f:
         json.dump(metadata, f, indent=2)
     print(f"Saved metadata to {metadata_path}")
 
-    all_chunks = []
-
-    # Process each retail company
-    for ticker, company_info in RETAIL_COMPANIES.items():
-        print(f"\n{'='*60}")
-        print(f"Processing {company_info['name']} ({ticker})")
-        print(f"{'='*60}")
-
-        # Get filings
-        filings = get_company_filings(
-            company_info['cik'],
-            filing_type=filing_type,
-            count=filings_per_company
-        )
-
-        for filing in filings:
-            # Download filing text
-            text = download_filing_text(filing)
-
-            if text:
-                # Chunk the text
-                chunks = chunk_text(text)
-                print(f"Created {len(chunks)} chunks from {filing['form']} filing")
-
-                # Add metadata to chunks
-                for chunk in chunks:
-                    all_chunks.append({
-                        "text": chunk,
-                        "metadata": {
-                            "company": company_info['name'],
-                            "ticker": ticker,
-                            "filing_type": filing['form'],
-                            "filing_date": filing['date']
-                        }
-                    })
-
-    print(f"\n{'='*60}")
-    print(f"Total chunks collected: {len(all_chunks)}")
-    print(f"{'='*60}\n")
-
-    if not all_chunks:
-        print("No content found.")
-        return
-
-    # Generate embeddings
-    knowledge_base = generate_embeddings_local(all_chunks)
-
-    # Save knowledge base
-    kb_path = twin_dir / "knowledge_base.json"
-    with open(kb_path, "w", encoding="utf-8") as f:
-        json.dump(knowledge_base, f)
-
-    print(f"\nSaved knowledge base with {len(knowledge_base)} chunks to {kb_path}")
-    print(f"Knowledge base size: {kb_path.stat().st_size / 1024 / 1024:.2f} MB")
+    # Filings under an accession number never change, so known ones are skipped
+    kb_dir = model_kb_dir(twin_dir, args.model)
+    manifest = IngestManifest.load(kb_dir)
+
+    def company_filings(company):
+        ticker, company_info = company
+        return get_company_filings(company_info['cik'], filing_type=filing_type,
+                                   count=filings_per_company, client=client)
+
+    def pending_filings():
+        # Submissions lookups run ahead on the thread pool, in list order
+        for (ticker, company_info), filings in fetch_ordered(company_filings, companies.items(),
+                                                             workers=args.workers):
+            print(f"{company_info['name']} ({ticker}): {len(filings)} {filing_type} filings")
+            for filing in filings:
+                if not args.full and filing['accession'] in manifest:
+                    print(f"Skipping {ticker} {filing['form']} from {filing['date']} (already ingested)")
+                    continue
+                yield ticker, company_info, filing
+
+    def filing_sources():
+        # Downloads run concurrently under the shared SEC rate limit; parsing happens in
+        # the process pool, so the next filings download while earlier ones are parsed
+        download = lambda job: download_filing_sections(job[2], client, parse_pool, items)
+        for (ticker, company_info, filing), parsed in fetch_ordered(download, pending_filings(),
+                                                                    workers=args.workers):
+            if not parsed:
+                continue
+            sections, total_chars = parsed
+            kept_chars = sum(len(section['text']) for section in sections)
+            if sections and sections[0]['item'] is None:
+                print(f"{ticker} {filing['form']} from {filing['date']}: no Item headings found, "
+                      f"keeping all {total_chars:,} chars")
+            else:
+                kept = ', '.join(section['item'] for section in sections) or 'none'
+                print(f"{ticker} {filing['form']} from {filing['date']}: Items {kept} "
+                      f"({kept_chars:,} of {total_chars:,} chars)")
+            if kept_chars:
+                yield {
+                    "key": filing['accession'],
+                    "sections": [
+                        {"text": section['text'],
+                         "metadata": {key: value for key, value in (("item", section['item']),
+                                                                    ("item_title", section['title']),
+                                                                    ("part", section['part']))
+                                      if value is not None}}
+                        for section in sections
+                    ],
+                    "metadata": {
+                        "company": company_info['name'],
+                        "ticker": ticker,
+                        "filing_type": filing['form'],
+                        "filing_date": filing['date']
+                    }
+                }
+
+    # Chunk, embed and append each filing as soon as it is downloaded
+    # spawn, not fork: the embedder may already be running torch threads in this process
+    parse_pool = ProcessPoolExecutor(max_workers=args.parse_workers,
+                                     mp_context=multiprocessing.get_context("spawn")) if args.parse_workers else None
+    try:
+        run_from_args(args, kb_dir, manifest, filing_sources(), client, noun="filings")
+    finally:
+        if parse_pool is not None:
+            parse_pool.shutdown(cancel_futures=True)
 
 if __name__ == "__main__":
     main()
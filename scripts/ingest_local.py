@@ -1,14 +1,20 @@
+import io
 import os
 import json
 import argparse
-import requests
-import time
+import threading
 import yt_dlp
 from dotenv import load_dotenv
 from tqdm import tqdm
 from pathlib import Path
-from sentence_transformers import SentenceTransformer
-import torch
+
+from captions import parse_srv3, parse_vtt
+from kb_store import model_kb_dir
+from fetch_pool import fetch_ordered
+from http_client import add_http_arguments, default_client, http_client_from_args
+from embedder import DEFAULT_MODEL
+from manifest import IngestManifest
+from pipeline import add_pipeline_arguments, run_from_args
 
 # Load .env from the project root (one level up from scripts/)
 env_path = Path(__file__).parent.parent / '.env'
@@ -24,15 +30,9 @@ if not YOUTUBE_API_KEY:
     print("Please create a YouTube Data API v3 key and set YOUTUBE_API_KEY in .env and .env.local.")
     exit(1)
 
-# Initialize sentence-transformers model
-print("Loading sentence-transformers model...")
-# Using all-MiniLM-L6-v2: Fast, efficient, and produces 384-dimensional embeddings
-model = SentenceTransformer('all-MiniLM-L6-v2')
-
-# Move model to GPU if available
-device = 'cuda' if torch.cuda.is_available() else 'cpu'
-model = model.to(device)
-print(f"Model loaded on device: {device}")
+# Default local sentence-transformers model (--model); loaded lazily on the first encode call
+# all-MiniLM-L6-v2: Fast, efficient, and produces 384-dimensional embeddings
+EMBEDDING_MODEL = DEFAULT_MODEL
 
 def _extract_handle_or_id(channel_url: str):
     # Returns (handle, channel_id) where one may be None.
@@ -51,7 +51,8 @@ def _extract_handle_or_id(channel_url: str):
         return last[1:], None
     return last, None
 
-def _resolve_channel_id(channel_url: str) -> str:
+def _resolve_channel_id(channel_url: str, client=None) -> str:
+    client = client or default_client()
     handle, channel_id = _extract_handle_or_id(channel_url)
     if channel_id:
         return channel_id
@@ -66,7 +67,7 @@ def _resolve_channel_id(channel_url: str) -> str:
         "key": YOUTUBE_API_KEY,
         "maxResults": 1,
     }
-    resp = requests.get(url, params=params, timeout=10)
+    resp = client.get(url, params=params, timeout=10)
     resp.raise_for_status()
     data = resp.json()
     items = data.get("items", [])
@@ -74,15 +75,16 @@ def _resolve_channel_id(channel_url: str) -> str:
         raise RuntimeError(f"No channel found for query '{query}'")
     return items[0]["snippet"]["channelId"]
 
-def get_channel_metadata(channel_id: str) -> dict:
+def get_channel_metadata(channel_id: str, client=None) -> dict:
     """Fetch channel metadata from YouTube Data API."""
+    client = client or default_client()
     url = "https://www.googleapis.com/youtube/v3/channels"
     params = {
         "part": "snippet,statistics",
         "id": channel_id,
         "key": YOUTUBE_API_KEY,
     }
-    resp = requests.get(url, params=params, timeout=10)
+    resp = client.get(url, params=params, timeout=10)
     resp.raise_for_status()
     data = resp.json()
     items = data.get("items", [])
@@ -105,10 +107,11 @@ def get_channel_metadata(channel_id: str) -> dict:
         }
     }
 
-def get_channel_videos(channel_url):
+def get_channel_videos(channel_url, client=None):
     print(f"Fetching videos from {channel_url} using YouTube Data API...")
+    client = client or default_client()
     try:
-        channel_id = _resolve_channel_id(channel_url)
+        channel_id = _resolve_channel_id(channel_url, client)
         print(f"Resolved channel ID: {channel_id}")
 
         url = "https://www.googleapis.com/youtube/v3/search"
@@ -126,7 +129,7 @@ def get_channel_videos(channel_url):
                 "pageToken": next_page_token,
                 "key": YOUTUBE_API_KEY,
             }
-            resp = requests.get(url, params=params, timeout=10)
+            resp = client.get(url, params=params, timeout=10)
             resp.raise_for_status()
             data = resp.json()
             for item in data.get("items", []):
@@ -143,11 +146,12 @@ def get_channel_videos(channel_url):
         print(f"Error fetching videos: {e}")
         return None, []
 
-def get_transcript(video_id, cookies_file=None):
-    """Fetch transcript using yt-dlp"""
-    try:
-        import urllib.request
+# One YoutubeDL instance per fetch thread; building one per video is expensive
+_ydl_local = threading.local()
 
+def _get_ydl(cookies_file=None):
+    ydl = getattr(_ydl_local, "ydl", None)
+    if ydl is None:
         ydl_opts = {
             'skip_download': True,
             'writesubtitles': False,  # Don't write files, just get URLs
@@ -161,88 +165,66 @@ def get_transcript(video_id, cookies_file=None):
         if cookies_file and os.path.exists(cookies_file):
             ydl_opts['cookiefile'] = cookies_file
 
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(f'https://www.youtube.com/watch?v={video_id}', download=False)
-
-            # Try to get subtitles (prefer manual, fall back to auto-generated)
-            subtitles = None
-            if 'subtitles' in info and info['subtitles'] and 'en' in info['subtitles']:
-                subtitles = info['subtitles']['en']
-            elif 'automatic_captions' in info and info['automatic_captions'] and 'en' in info['automatic_captions']:
-                subtitles = info['automatic_captions']['en']
-
-            if not subtitles:
-                return None
-
-            # Find vtt format URL
-            vtt_url = None
-            for sub in subtitles:
-                if sub.get('ext') == 'vtt':
-                    vtt_url = sub.get('url')
-                    break
-
-            if not vtt_url:
-                return None
-
-            # Download and parse the VTT file
-            with urllib.request.urlopen(vtt_url) as response:
-                vtt_content = response.read().decode('utf-8')
-
-            # Extract text from VTT (skip timestamps and metadata)
-            texts = []
-            for line in vtt_content.split('\n'):
-                line = line.strip()
-                # Skip empty lines, WEBVTT header, timestamps, and metadata
-                if (line and
-                    not line.startswith('WEBVTT') and
-                    not '-->' in line and
-                    not line.isdigit() and
-                    not line.startswith('NOTE') and
-                    not line.startswith('Kind:') and
-                    not line.startswith('Language:')):
-                    texts.append(line)
-
-            full_text = " ".join(texts).strip()
-            return full_text if full_text else None
+        ydl = yt_dlp.YoutubeDL(ydl_opts)
+        _ydl_local.ydl = ydl
+    return ydl
+
+# Cache key of a video's English caption track (kind=asr for auto-generated); see response_cache.cache_key
+CAPTION_URL = "https://www.youtube.com/api/timedtext?v={video_id}&lang=en&fmt={ext}"
+
+def _parse_captions(response, ext):
+    response.raise_for_status()
+    if ext == 'vtt':
+        return list(parse_vtt(io.StringIO(response.content.decode('utf-8'))))
+    return list(parse_srv3(io.BytesIO(response.content)))
+
+def _cached_transcript(video_id, client):
+    """Cues from a caption track in the response cache (manual before auto-generated), or None"""
+    for kind in ('', '&kind=asr'):
+        for ext in ('vtt', 'srv3'):
+            response = client.cached_response(CAPTION_URL.format(video_id=video_id, ext=ext) + kind)
+            if response is not None:
+                return _parse_captions(response, ext)
+    return None
+
+def get_transcript(video_id, cookies_file=None, client=None):
+    """Fetch a transcript using yt-dlp as a list of (start, end, text) cues"""
+    client = client or default_client()
+    try:
+        if client.offline:
+            # yt-dlp can't resolve caption URLs offline; look the track up directly
+            return _cached_transcript(video_id, client) or None
 
-    except Exception as e:
-        print(f"Error fetching transcript for {video_id}: {e}")
-        return None
+        ydl = _get_ydl(cookies_file)
+        watch_url = f'https://www.youtube.com/watch?v={video_id}'
+        # yt-dlp makes its own requests; still count them against the host's budget
+        client.limiter.wait(watch_url)
+        info = ydl.extract_info(watch_url, download=False)
 
-def chunk_text(text, chunk_size=1000, overlap=200):
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        chunk = text[start:end]
-        chunks.append(chunk)
-        start += chunk_size - overlap
-    return chunks
-
-def generate_embeddings_local(chunks):
-    """Generate embeddings using local sentence-transformers model with GPU acceleration."""
-    print(f"Generating embeddings for {len(chunks)} chunks using local model...")
-
-    # Extract just the text from chunks
-    texts = [c["text"] for c in chunks]
-
-    # Generate embeddings in batches for better GPU utilization
-    # batch_size=32 is good for most GPUs, adjust if needed
-    embeddings = model.encode(
-        texts,
-        batch_size=32,
-        show_progress_bar=True,
-        convert_to_numpy=True,
-        device=device
-    )
+        # Try to get subtitles (prefer manual, fall back to auto-generated)
+        subtitles = None
+        if 'subtitles' in info and info['subtitles'] and 'en' in info['subtitles']:
+            subtitles = info['subtitles']['en']
+        elif 'automatic_captions' in info and info['automatic_captions'] and 'en' in info['automatic_captions']:
+            subtitles = info['automatic_captions']['en']
+
+        if not subtitles:
+            return None
 
-    # Add embeddings back to chunks
-    knowledge_base = []
-    for i, chunk in enumerate(chunks):
-        chunk["embedding"] = embeddings[i].tolist()  # Convert numpy array to list for JSON
-        knowledge_base.append(chunk)
+        # Prefer VTT, fall back to SRV3 (YouTube's timed-text XML)
+        by_ext = {sub.get('ext'): sub.get('url') for sub in subtitles}
+        ext = next((e for e in ('vtt', 'srv3') if by_ext.get(e)), None)
+        if not ext:
+            return None
 
-    return knowledge_base
+        # Caption files go through the response cache, so re-ingesting doesn't download them again
+        cues = _parse_captions(client.get(by_ext[ext]), ext)
+
+        return cues if cues else None
+
+    except Exception as e:
+        print(f"Error fetching transcript for {video_id}: {e}")
+        return None
 
 def main():
     parser = argparse.ArgumentParser(description="Ingest YouTube channel content with local embeddings.")
@@ -250,6 +232,9 @@ def main():
     parser.add_argument("--limit", type=int, help="Limit number of videos to process")
     parser.add_argument("--twin-id", type=str, help="Twin ID for output directory")
     parser.add_argument("--cookies", type=str, help="Path to cookies.txt file (Netscape format) for YouTube auth")
+    parser.add_argument("--workers", type=int, default=8, help="Number of transcripts to fetch concurrently")
+    add_http_arguments(parser)
+    add_pipeline_arguments(parser, default_model=EMBEDDING_MODEL)
     args = parser.parse_args()
 
     channel_url = args.channel
@@ -271,8 +256,10 @@ def main():
         else:
             twin_id = input("Enter Twin ID (e.g., 'fireship'): ")
 
+    client = http_client_from_args(args, burst=args.workers)
+
     # Get channel info
-    channel_id, video_ids = get_channel_videos(channel_url)
+    channel_id, video_ids = get_channel_videos(channel_url, client)
 
     if not channel_id:
         print("Failed to resolve channel.")
@@ -280,7 +267,7 @@ def main():
 
     # Fetch and save channel metadata
     print("Fetching channel metadata...")
-    metadata = get_channel_metadata(channel_id)
+    metadata = get_channel_metadata(channel_id, client)
 
     # Create twin directory
     twin_dir = Path("data/twins") / twin_id
@@ -295,34 +282,29 @@ def main():
     if limit:
         video_ids = video_ids[:limit]
 
-    all_chunks = []
-
-    print(f"Processing {len(video_ids)} videos...")
-    for video_id in tqdm(video_ids):
-        transcript_text = get_transcript(video_id, cookies_file)
-        if transcript_text:
-            chunks = chunk_text(transcript_text)
-            # Add metadata to chunks
-            for chunk in chunks:
-                all_chunks.append({
-                    "text": chunk,
-                    "metadata": {"video_id": video_id}
-                })
-
-    print(f"Total chunks: {len(all_chunks)}")
-    if not all_chunks:
-        print("No content found.")
-        return
-
-    # Generate embeddings using local model
-    knowledge_base = generate_embeddings_local(all_chunks)
+    # Published transcripts don't change, so anything already in the manifest is skipped
+    kb_dir = model_kb_dir(twin_dir, args.model)
+    manifest = IngestManifest.load(kb_dir)
+    if not args.full:
+        known = [v for v in video_ids if v in manifest]
+        video_ids = [v for v in video_ids if v not in manifest]
+        if known:
+            print(f"Skipping {len(known)} videos already in the knowledge base")
+
+    print(f"Processing {len(video_ids)} videos with {args.workers} workers...")
+    fetched = fetch_ordered(
+        lambda video_id: get_transcript(video_id, cookies_file, client),
+        video_ids,
+        workers=args.workers,
+    )
 
-    # Save to twin-specific file
-    kb_path = twin_dir / "knowledge_base.json"
-    with open(kb_path, "w", encoding="utf-8") as f:
-        json.dump(knowledge_base, f)
+    def transcript_sources():
+        for video_id, cues in tqdm(fetched, total=len(video_ids)):
+            if cues:
+                yield {"key": video_id, "cues": cues, "metadata": {"video_id": video_id}}
 
-    print(f"Saved knowledge base with {len(knowledge_base)} chunks to {kb_path}")
+    # Chunk, embed and append to the twin's store while transcripts are still downloading
+    run_from_args(args, kb_dir, manifest, transcript_sources(), client, noun="videos")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,412 @@
+"""
+Knowledge Base Store
+Binary, memory-mappable on-disk format for twin knowledge bases.
+
+A store is a directory (data/twins/<id>/kb/) holding:
+
+    header.json   model name, dimension, dtype, row count, revision
+    vectors.bin   row-major embedding matrix (float32 or float16), no framing;
+                  rows are L2-normalized when the header says "normalized"
+    chunks.jsonl  one {"text": ..., "metadata": ...} record per line
+    offsets.bin   little-endian uint64 byte offsets into chunks.jsonl (count + 1)
+
+Readers mmap vectors.bin directly and only seek into chunks.jsonl for the
+rows they actually need, so nothing is parsed up front.
+
+Rewriting a store swaps in new data files and then the header. Writers hold
+an exclusive lock on publish.lock while they do, and readers a shared one
+while they open the files, so a reader never pairs one generation's header
+with another's data (no locking on platforms without fcntl). The revision
+only ever increases, even across full rebuilds, so indexes and caches
+stamped with an older revision are always recognised as stale.
+
+Vectors from different embedding models live in different spaces, so a twin
+keeps one store per model: kb/ for the model it was first built with, and
+kb@<model>/ alongside it for any other.
+"""
+import os
+import re
+import json
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import fcntl  # Not available on Windows
+except ImportError:
+    fcntl = None
+
+FORMAT_NAME = "twin-kb"
+FORMAT_VERSION = 1
+
+KB_DIRNAME = "kb"
+# Separates the store directory name from the model slug: kb@<model>
+MODEL_DIR_SEPARATOR = "@"
+HEADER_FILE = "header.json"
+VECTORS_FILE = "vectors.bin"
+CHUNKS_FILE = "chunks.jsonl"
+OFFSETS_FILE = "offsets.bin"
+LOCK_FILE = "publish.lock"
+
+SUPPORTED_DTYPES = ("float32", "float16")
+OFFSET_DTYPE = np.dtype("<u8")
+
+
+def _write_tmp(path: Path, data: bytes) -> Path:
+    """Write data to path's .tmp sibling, flushed to disk, ready to be renamed over path."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    return tmp_path
+
+
+def _atomic_write_bytes(path: Path, data: bytes):
+    """Write a file via a temp file + rename so readers never see a partial file."""
+    os.replace(_write_tmp(path, data), path)
+
+
+@contextmanager
+def _publish_lock(kb_dir, exclusive: bool):
+    """Hold the store's lock while publishing a new generation (exclusive) or opening one (shared)."""
+    if fcntl is None:
+        yield
+        return
+    try:
+        f = open(Path(kb_dir) / LOCK_FILE, "a+b")
+    except OSError:
+        # Read-only store directory: nothing can be publishing into it
+        yield
+        return
+    with f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+
+
+def read_header(kb_dir) -> dict:
+    """Load header.json for a store directory."""
+    with open(Path(kb_dir) / HEADER_FILE, "r", encoding="utf-8") as f:
+        header = json.load(f)
+    if header.get("format") != FORMAT_NAME:
+        raise ValueError(f"{kb_dir} is not a {FORMAT_NAME} store")
+    if header.get("version", 0) > FORMAT_VERSION:
+        raise ValueError(f"{kb_dir} uses format version {header['version']}, "
+                         f"this reader supports up to {FORMAT_VERSION}")
+    return header
+
+
+def store_exists(kb_dir) -> bool:
+    return (Path(kb_dir) / HEADER_FILE).exists()
+
+
+def check_model(kb_dir, model: str, dim: int = None):
+    """Raise ValueError unless the store at kb_dir was built with model (and dim)."""
+    header = read_header(kb_dir)
+    if header["model"] != model or (dim is not None and header["dim"] != dim):
+        raise ValueError(
+            f"Store {kb_dir} holds {header['model']} ({header['dim']}d) vectors, "
+            f"not {model}" + (f" ({dim}d)" if dim is not None else "")
+        )
+    return header
+
+
+def model_slug(model: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", model)
+
+
+def model_kb_dir(twin_dir, model: str) -> Path:
+    """Store directory for a model's vectors: kb/ for the twin's first model, kb@<model>/ otherwise."""
+    twin_dir = Path(twin_dir)
+    primary = twin_dir / KB_DIRNAME
+    if not store_exists(primary) or read_header(primary)["model"] == model:
+        return primary
+    return twin_dir / f"{KB_DIRNAME}{MODEL_DIR_SEPARATOR}{model_slug(model)}"
+
+
+def twin_stores(twin_dir) -> dict:
+    """Map model name -> store directory for every store a twin has, kb/ first."""
+    stores = {}
+    for kb_dir in sorted(Path(twin_dir).glob(KB_DIRNAME + "*")):
+        is_store_dir = kb_dir.name == KB_DIRNAME or kb_dir.name.startswith(KB_DIRNAME + MODEL_DIR_SEPARATOR)
+        if is_store_dir and store_exists(kb_dir):
+            stores.setdefault(read_header(kb_dir)["model"], kb_dir)
+    return stores
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    """L2-normalize each row (float32); all-zero rows are left as zeros."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class KnowledgeBaseWriter:
+    """Append chunks and their embeddings to a store.
+
+    Rows are streamed straight to disk; the header (and therefore the row count
+    visible to readers) is only updated on close(), so a crashed run leaves the
+    previous revision intact. A new store (append=False) is written to .tmp
+    files that replace the old data files on close(), so readers with the old
+    files mapped keep reading them. With normalize=True (the default) vectors are
+    unit-normalized on the way in, so cosine similarity is a plain dot product.
+    """
+
+    def __init__(self, kb_dir, dim: int, model: str, dtype: str = "float32", append: bool = False,
+                 normalize: bool = True):
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"Unsupported dtype '{dtype}', expected one of {SUPPORTED_DTYPES}")
+
+        self.kb_dir = Path(kb_dir)
+        self.kb_dir.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self.model = model
+        self.dtype = np.dtype(dtype)
+        self.normalize = normalize
+        self.revision = 0
+        # Data files being written beside the live ones, swapped in by close()
+        self._replacing = []
+
+        if append and store_exists(self.kb_dir):
+            header = read_header(self.kb_dir)
+            if header["dim"] != dim or header["model"] != model:
+                raise ValueError(
+                    f"Cannot append {model} ({dim}d) vectors to a store built with "
+                    f"{header['model']} ({header['dim']}d)"
+                )
+            self.dtype = np.dtype(header["dtype"])
+            # Stores written before normalization existed stay un-normalized so rows are consistent
+            self.normalize = header.get("normalized", False)
+            self.revision = header.get("revision", 0)
+            self.count = header["count"]
+            self.offsets = list(np.fromfile(self.kb_dir / OFFSETS_FILE, dtype=OFFSET_DTYPE)[:self.count + 1])
+            # Drop anything past the committed row count left over from an interrupted run
+            self._vectors = open(self.kb_dir / VECTORS_FILE, "r+b")
+            self._vectors.truncate(self.count * self.dim * self.dtype.itemsize)
+            self._vectors.seek(0, os.SEEK_END)
+            self._chunks = open(self.kb_dir / CHUNKS_FILE, "r+b")
+            self._chunks.truncate(int(self.offsets[-1]))
+            self._chunks.seek(0, os.SEEK_END)
+        else:
+            # Keep counting from the replaced store so its indexes and caches read as stale
+            if store_exists(self.kb_dir):
+                self.revision = read_header(self.kb_dir).get("revision", 0)
+            self.count = 0
+            self.offsets = [0]
+            self._replacing = [self.kb_dir / VECTORS_FILE, self.kb_dir / CHUNKS_FILE]
+            self._vectors = open(self.kb_dir / (VECTORS_FILE + ".tmp"), "wb")
+            self._chunks = open(self.kb_dir / (CHUNKS_FILE + ".tmp"), "wb")
+
+    def add(self, chunks, embeddings):
+        """Append a batch of chunk dicts and their (n, dim) embedding matrix."""
+        embeddings = np.asarray(embeddings)
+        if embeddings.ndim != 2 or embeddings.shape[1] != self.dim:
+            raise ValueError(f"Expected embeddings of shape (n, {self.dim}), got {embeddings.shape}")
+        if len(chunks) != embeddings.shape[0]:
+            raise ValueError(f"Got {len(chunks)} chunks but {embeddings.shape[0]} embeddings")
+
+        if self.normalize:
+            embeddings = normalize_rows(embeddings)
+        self._vectors.write(np.ascontiguousarray(embeddings, dtype=self.dtype).tobytes())
+
+        position = self.offsets[-1]
+        for chunk in chunks:
+            record = {"text": chunk["text"], "metadata": chunk.get("metadata", {})}
+            line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+            self._chunks.write(line)
+            position += len(line)
+            self.offsets.append(position)
+
+        self.count += len(chunks)
+
+    def close(self):
+        """Flush data files, then publish offsets and header."""
+        for f in (self._vectors, self._chunks):
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+
+        self.revision += 1
+        header = {
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "model": self.model,
+            "dim": self.dim,
+            "dtype": self.dtype.name,
+            "count": self.count,
+            "revision": self.revision,
+            "normalized": self.normalize,
+        }
+        staged = [(path.with_name(path.name + ".tmp"), path) for path in self._replacing]
+        staged.append((_write_tmp(self.kb_dir / OFFSETS_FILE, np.asarray(self.offsets, dtype=OFFSET_DTYPE).tobytes()),
+                       self.kb_dir / OFFSETS_FILE))
+        # The header goes last, once every data file of this generation is in place
+        staged.append((_write_tmp(self.kb_dir / HEADER_FILE, json.dumps(header, indent=2).encode("utf-8")),
+                       self.kb_dir / HEADER_FILE))
+        with _publish_lock(self.kb_dir, exclusive=True):
+            for tmp_path, path in staged:
+                os.replace(tmp_path, path)
+
+    def __enter__(self):
+        return self
+
+    def abort(self):
+        """Close without publishing, leaving the last committed revision in place."""
+        self._vectors.close()
+        self._chunks.close()
+        for path in self._replacing:
+            path.with_name(path.name + ".tmp").unlink(missing_ok=True)
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class KnowledgeBaseReader:
+    """Read-only view over a store: mmapped vectors plus on-demand chunk lookup."""
+
+    def __init__(self, kb_dir):
+        self.kb_dir = Path(kb_dir)
+        # The open files stay on this generation even after a writer replaces them
+        with _publish_lock(self.kb_dir, exclusive=False):
+            self.header = read_header(self.kb_dir)
+            self.count = self.header["count"]
+            self.dim = self.header["dim"]
+            self.model = self.header["model"]
+            self.revision = self.header.get("revision", 0)
+            self.normalized = self.header.get("normalized", False)
+
+            if self.count:
+                self.vectors = np.memmap(
+                    self.kb_dir / VECTORS_FILE,
+                    dtype=np.dtype(self.header["dtype"]),
+                    mode="r",
+                    shape=(self.count, self.dim),
+                )
+            else:
+                self.vectors = np.zeros((0, self.dim), dtype=np.dtype(self.header["dtype"]))
+            self.offsets = np.fromfile(self.kb_dir / OFFSETS_FILE, dtype=OFFSET_DTYPE)[:self.count + 1]
+            self._chunks = open(self.kb_dir / CHUNKS_FILE, "rb")
+
+    def __len__(self):
+        return self.count
+
+    def get_chunk(self, index: int) -> dict:
+        """Read a single chunk record by row index."""
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        self._chunks.seek(start)
+        return json.loads(self._chunks.read(end - start))
+
+    def get_chunks(self, indices) -> list:
+        return [self.get_chunk(int(i)) for i in indices]
+
+    def iter_chunks(self):
+        """Yield every chunk record in row order."""
+        self._chunks.seek(0)
+        for _ in range(self.count):
+            yield json.loads(self._chunks.readline())
+
+    def close(self):
+        self._chunks.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def write_knowledge_base(kb_dir, chunks, embeddings, model: str, dtype: str = "float32"):
+    """Replace the store at kb_dir with the given chunks and embeddings."""
+    embeddings = np.asarray(embeddings)
+    with KnowledgeBaseWriter(kb_dir, dim=embeddings.shape[1], model=model, dtype=dtype) as writer:
+        writer.add(chunks, embeddings)
+    return writer
+
+
+def delete_rows(kb_dir, rows) -> np.ndarray:
+    """Rewrite the store without the given row indices.
+
+    Returns an array mapping each old row index to its new index (-1 for
+    deleted rows). Remaining rows keep their relative order.
+    """
+    kb_dir = Path(kb_dir)
+    with KnowledgeBaseReader(kb_dir) as reader:
+        keep = np.ones(reader.count, dtype=bool)
+        keep[np.asarray(list(rows), dtype=np.int64)] = False
+        mapping = np.full(reader.count, -1, dtype=np.int64)
+        mapping[keep] = np.arange(int(keep.sum()))
+
+        vectors = np.array(reader.vectors[keep])
+        with open(kb_dir / CHUNKS_FILE, "rb") as f:
+            records = []
+            for i in np.flatnonzero(keep):
+                start, end = int(reader.offsets[i]), int(reader.offsets[i + 1])
+                f.seek(start)
+                records.append(f.read(end - start))
+        header = reader.header
+
+    offsets = np.zeros(len(records) + 1, dtype=OFFSET_DTYPE)
+    offsets[1:] = np.cumsum([len(r) for r in records], dtype=OFFSET_DTYPE)
+
+    header = dict(header, count=len(records), revision=header.get("revision", 0) + 1)
+    staged = [(_write_tmp(kb_dir / name, data), kb_dir / name) for name, data in (
+        (VECTORS_FILE, vectors.tobytes()), (CHUNKS_FILE, b"".join(records)), (OFFSETS_FILE, offsets.tobytes()),
+        (HEADER_FILE, json.dumps(header, indent=2).encode("utf-8")))]
+    # Swapped in data files first and header last, matching the writer's commit order
+    with _publish_lock(kb_dir, exclusive=True):
+        for tmp_path, path in staged:
+            os.replace(tmp_path, path)
+    return mapping
+
+
+def store_size_bytes(kb_dir) -> int:
+    kb_dir = Path(kb_dir)
+    return sum(p.stat().st_size for p in kb_dir.iterdir() if p.is_file())
+
+
+def convert_json(json_path, kb_dir, model: str, dtype: str = "float32"):
+    """Convert a legacy knowledge_base.json (list of {text, metadata, embedding}) to a store."""
+    with open(json_path, "r", encoding="utf-8") as f:
+        knowledge_base = json.load(f)
+    if not knowledge_base:
+        raise ValueError(f"{json_path} is empty")
+
+    embeddings = np.array([item["embedding"] for item in knowledge_base], dtype=np.float32)
+    chunks = [{"text": item["text"], "metadata": item.get("metadata", {})} for item in knowledge_base]
+    return write_knowledge_base(kb_dir, chunks, embeddings, model=model, dtype=dtype)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect or convert twin knowledge base stores.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    convert_parser = subparsers.add_parser("convert", help="Convert a legacy knowledge_base.json to a binary store")
+    convert_parser.add_argument("json_path", type=str, help="Path to knowledge_base.json")
+    convert_parser.add_argument("--out", type=str, help="Output store directory (default: kb/ next to the JSON file)")
+    convert_parser.add_argument("--model", type=str, default="all-MiniLM-L6-v2", help="Model that produced the embeddings")
+    convert_parser.add_argument("--dtype", type=str, default="float32", choices=SUPPORTED_DTYPES)
+
+    info_parser = subparsers.add_parser("info", help="Print a store's header")
+    info_parser.add_argument("kb_dir", type=str, help="Store directory")
+
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        json_path = Path(args.json_path)
+        kb_dir = Path(args.out) if args.out else json_path.parent / KB_DIRNAME
+        writer = convert_json(json_path, kb_dir, model=args.model, dtype=args.dtype)
+        print(f"Wrote {writer.count} chunks to {kb_dir}")
+        print(f"Size: {json_path.stat().st_size / 1024 / 1024:.2f} MB JSON -> "
+              f"{store_size_bytes(kb_dir) / 1024 / 1024:.2f} MB binary")
+    elif args.command == "info":
+        print(json.dumps(read_header(args.kb_dir), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Ingestion Manifest
+Per-twin record of which sources (video IDs, filing accessions, page URLs) are
+already in the knowledge base, with content hashes and the store rows they
+occupy, so re-running an ingester only fetches and embeds what is new or changed.
+"""
+import json
+import hashlib
+from pathlib import Path
+
+from kb_store import read_header, store_exists
+
+MANIFEST_FILE = "manifest.json"
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class IngestManifest:
+    """Source key -> {"hash", "rows": [start, end), "ingested_at"} for one store."""
+
+    def __init__(self, kb_dir, sources=None, revision=0):
+        self.kb_dir = Path(kb_dir)
+        self.sources = sources or {}
+        self.revision = revision
+
+    @classmethod
+    def load(cls, kb_dir):
+        """Load the manifest for a store, or an empty one if it can't be trusted."""
+        kb_dir = Path(kb_dir)
+        path = kb_dir / MANIFEST_FILE
+        if not path.exists() or not store_exists(kb_dir):
+            return cls(kb_dir)
+
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        store_revision = read_header(kb_dir).get("revision", 0)
+        if data.get("revision") != store_revision:
+            # The store was written without updating the manifest (e.g. an
+            # interrupted run); we can't tell which rows belong to which source.
+            print(f"Warning: {path} is out of date with the store, ignoring it (full re-ingest)")
+            return cls(kb_dir)
+        return cls(kb_dir, data.get("sources", {}), store_revision)
+
+    def __contains__(self, key):
+        return key in self.sources
+
+    def __len__(self):
+        return len(self.sources)
+
+    def is_unchanged(self, key, digest: str) -> bool:
+        entry = self.sources.get(key)
+        return entry is not None and entry["hash"] == digest
+
+    def save(self):
+        data = {"revision": self.revision, "sources": self.sources}
+        tmp_path = self.kb_dir / (MANIFEST_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        tmp_path.replace(self.kb_dir / MANIFEST_FILE)
@@ -0,0 +1,212 @@
+"""
+Metadata Index
+Columnar copy of chunk metadata (company, ticker, filing_type, filing_date,
+source, video_id, ...) used to pre-filter rows before they are scored.
+
+Each field is stored as a sorted index: the distinct values in sorted order
+and the rows grouped by value, so every value - and every range of values -
+is one contiguous slice of row ids. A filter such as
+
+    {"ticker": "WMT", "filing_type": "10-K", "filing_date": {"gte": "2024"}}
+
+costs a few binary searches plus the size of the matching slices, never a
+pass over the whole corpus. Numeric fields sort numerically; everything else
+(including ISO dates) sorts as strings.
+
+The index is saved as metadata.npz inside the store directory, stamped with
+the store revision like the other indexes.
+"""
+import os
+import time
+import json
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from kb_store import KnowledgeBaseReader, read_header
+
+INDEX_FILE = "metadata.npz"
+RANGE_OPERATORS = ("gt", "gte", "lt", "lte")
+
+
+class MetadataColumn:
+    """Sorted distinct values of one field and the rows holding each value."""
+
+    def __init__(self, values, value_starts, rows):
+        self.values = values
+        self.value_starts = value_starts
+        self.rows = rows
+
+    @classmethod
+    def build(cls, column):
+        """column: list aligned with the store rows, None where a row lacks the field."""
+        present = [(row, value) for row, value in enumerate(column) if value is not None]
+        numeric = all(isinstance(v, (int, float)) and not isinstance(v, bool) for _, v in present)
+        keys = np.array([v if numeric else str(v) for _, v in present],
+                        dtype=np.float64 if numeric else str)
+        rows = np.array([row for row, _ in present], dtype=np.int64)
+        values, codes = np.unique(keys, return_inverse=True)
+        order = np.argsort(codes, kind="stable")
+        value_starts = np.zeros(len(values) + 1, dtype=np.int64)
+        value_starts[1:] = np.cumsum(np.bincount(codes, minlength=len(values)))
+        return cls(values, value_starts, rows[order])
+
+    @property
+    def numeric(self) -> bool:
+        return self.values.dtype.kind == "f"
+
+    def _key(self, value):
+        return float(value) if self.numeric else str(value)
+
+    def _slice(self, lo: int, hi: int) -> np.ndarray:
+        return self.rows[self.value_starts[lo]:self.value_starts[hi]]
+
+    def select(self, condition) -> np.ndarray:
+        """Rows matching a value, a list of values, or a {"gt"/"gte"/"lt"/"lte": ...} range."""
+        if isinstance(condition, dict):
+            unknown = set(condition) - set(RANGE_OPERATORS)
+            if unknown:
+                raise ValueError(f"Unknown filter operators {sorted(unknown)}, expected {RANGE_OPERATORS}")
+            lo, hi = 0, len(self.values)
+            if "gte" in condition:
+                lo = max(lo, int(np.searchsorted(self.values, self._key(condition["gte"]), "left")))
+            if "gt" in condition:
+                lo = max(lo, int(np.searchsorted(self.values, self._key(condition["gt"]), "right")))
+            if "lte" in condition:
+                hi = min(hi, int(np.searchsorted(self.values, self._key(condition["lte"]), "right")))
+            if "lt" in condition:
+                hi = min(hi, int(np.searchsorted(self.values, self._key(condition["lt"]), "left")))
+            return np.sort(self._slice(lo, hi)) if lo < hi else np.zeros(0, dtype=np.int64)
+
+        selected = []
+        for value in condition if isinstance(condition, (list, tuple)) else [condition]:
+            key = self._key(value)
+            i = int(np.searchsorted(self.values, key))
+            if i < len(self.values) and self.values[i] == key:
+                selected.append(self._slice(i, i + 1))
+        if not selected:
+            return np.zeros(0, dtype=np.int64)
+        # Rows within one value are already ascending
+        return selected[0] if len(selected) == 1 else np.sort(np.concatenate(selected))
+
+
+class MetadataIndex:
+    """Per-field sorted indexes over a store's chunk metadata."""
+
+    def __init__(self, columns: dict, count: int, revision: int):
+        self.columns = columns
+        self.count = count
+        self.revision = revision
+
+    @classmethod
+    def build(cls, metadatas, revision: int = 0) -> "MetadataIndex":
+        raw = {}
+        count = 0
+        for row, metadata in enumerate(metadatas):
+            count += 1
+            for field, value in (metadata or {}).items():
+                # Nested values (lists, dicts) aren't filterable
+                if isinstance(value, (str, int, float, bool)):
+                    raw.setdefault(field, {})[row] = value
+        columns = {field: MetadataColumn.build([values.get(row) for row in range(count)])
+                   for field, values in raw.items()}
+        return cls(columns, count, revision)
+
+    def save(self, kb_dir):
+        arrays = {"fields": np.array(list(self.columns), dtype=str),
+                  "count": self.count, "revision": self.revision}
+        for i, column in enumerate(self.columns.values()):
+            arrays[f"values_{i}"] = column.values
+            arrays[f"value_starts_{i}"] = column.value_starts
+            arrays[f"rows_{i}"] = column.rows
+        path = Path(kb_dir) / INDEX_FILE
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, kb_dir, revision: int = None):
+        """Load the store's index, or None if there isn't one or it predates `revision`."""
+        path = Path(kb_dir) / INDEX_FILE
+        if not path.exists():
+            return None
+        with np.load(path) as data:
+            columns = {
+                str(field): MetadataColumn(data[f"values_{i}"], data[f"value_starts_{i}"], data[f"rows_{i}"])
+                for i, field in enumerate(data["fields"])
+            }
+            index = cls(columns, int(data["count"]), int(data["revision"]))
+        if revision is not None and index.revision != revision:
+            return None
+        return index
+
+    def filter(self, filters: dict) -> np.ndarray:
+        """Ascending row ids matching every field condition in filters."""
+        selections = []
+        for field, condition in filters.items():
+            column = self.columns.get(field)
+            if column is None:
+                return np.zeros(0, dtype=np.int64)
+            selections.append(column.select(condition))
+        if not selections:
+            return np.arange(self.count)
+        # Intersect smallest-first so the work tracks the most selective field
+        selections.sort(key=len)
+        rows = selections[0]
+        for other in selections[1:]:
+            if not len(rows):
+                break
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        return rows
+
+
+def build_index(kb_dir) -> MetadataIndex:
+    """Read every chunk's metadata and save the columnar index next to the store."""
+    start = time.perf_counter()
+    with KnowledgeBaseReader(kb_dir) as reader:
+        index = MetadataIndex.build((chunk.get("metadata") for chunk in reader.iter_chunks()),
+                                    revision=reader.revision)
+    index.save(kb_dir)
+    print(f"Built metadata index: {index.count} rows, fields {', '.join(index.columns) or '(none)'} "
+          f"({time.perf_counter() - start:.1f}s)")
+    return index
+
+
+def refresh_index(kb_dir):
+    """Rebuild the index unless it already matches the store revision."""
+    existing = MetadataIndex.load(kb_dir, read_header(kb_dir).get("revision", 0))
+    return existing if existing is not None else build_index(kb_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query a store's metadata index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Save metadata.npz next to a store")
+    build_parser.add_argument("kb_dir", type=str, help="Store directory")
+
+    fields_parser = subparsers.add_parser("fields", help="List indexed fields and their distinct value counts")
+    fields_parser.add_argument("kb_dir", type=str, help="Store directory")
+
+    count_parser = subparsers.add_parser("count", help="Count rows matching a JSON filter")
+    count_parser.add_argument("kb_dir", type=str, help="Store directory")
+    count_parser.add_argument("filters", type=str, help='e.g. \'{"ticker": "WMT", "filing_date": {"gte": "2024"}}\'')
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_index(args.kb_dir)
+    elif args.command == "fields":
+        index = refresh_index(args.kb_dir)
+        for field, column in index.columns.items():
+            kind = "numeric" if column.numeric else "string"
+            print(f"{field:20s} {kind:8s} {len(column.values):6d} values  {len(column.rows):8d} rows")
+    elif args.command == "count":
+        index = refresh_index(args.kb_dir)
+        print(f"{len(index.filter(json.loads(args.filters)))} of {index.count} rows match")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""
+Ingestion Pipeline
+Streaming source -> chunk -> batch-embed -> append-to-store pipeline shared by
+the local ingesters.
+
+A source is {"key", "text", "metadata"}, {"key", "cues", "metadata"} for
+timed captions (a list of (start, end, text)), or {"key", "sections",
+"metadata"} for documents split into sections (a list of {"text",
+"metadata"}, e.g. a filing's Items); chunk_fn turns it into {"text",
+"metadata"} chunks (see chunker.py).
+
+Sources are consumed lazily from a generator running on a prefetch thread, so
+the next download overlaps with embedding the current one. Chunks are embedded
+in fixed-size batches as soon as a batch fills, and each batch is appended to
+the store straight away. Only one batch of chunks and vectors (plus a few
+prefetched sources) is held in memory, however many sources there are.
+
+add_pipeline_arguments() and run_from_args() are the ingesters' shared CLI:
+each one registers its own source flags, builds a source generator and hands
+it to run_from_args(), which embeds it, refreshes the store's indexes and
+prints the summary.
+"""
+import json
+import time
+import queue
+import hashlib
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+from ann_index import add_index_arguments, refresh_index_from_args
+from bm25_index import refresh_index as refresh_bm25_index
+from chunker import add_chunker_arguments, chunker_from_args
+from dedup import add_dedup_arguments, deduplicator_from_args
+from embed_cache import add_cache_arguments, open_cache
+from embedder import DEFAULT_MODEL, add_embedder_arguments, embedder_from_args
+from kb_store import (SUPPORTED_DTYPES, KnowledgeBaseReader, KnowledgeBaseWriter, check_model, delete_rows,
+                      read_header, store_exists, store_size_bytes)
+from manifest import content_hash
+from metadata_index import refresh_index as refresh_metadata_index
+
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_PREFETCH = 4
+
+_DONE = object()
+
+
+def prefetch(iterable, depth=DEFAULT_PREFETCH):
+    """Run a (network-bound) generator on a background thread.
+
+    Up to `depth` items are buffered ahead of the consumer, so fetching the
+    next source overlaps with chunking and embedding the current one while
+    memory stays bounded. Exceptions from the producer are re-raised here.
+    """
+    buffer = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                while not stop.is_set():
+                    try:
+                        buffer.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            buffer.put(_DONE)
+        except BaseException as e:
+            buffer.put(e)
+
+    thread = threading.Thread(target=produce, name="source-prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def source_hash(source: dict) -> str:
+    """Content hash of a source's text, or of its cue texts or sections, without joining them."""
+    if "sections" in source:
+        # Section metadata is hashed too, so selecting different sections re-ingests the source
+        digest = hashlib.sha256()
+        for section in source["sections"]:
+            digest.update(json.dumps(section["metadata"], sort_keys=True).encode("utf-8"))
+            digest.update(section["text"].encode("utf-8"))
+            digest.update(b"\n")
+        return digest.hexdigest()
+    if "cues" not in source:
+        return content_hash(source["text"])
+    digest = hashlib.sha256()
+    for _, _, text in source["cues"]:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def chunk_sources(sources, chunk_fn, manifest, full=False, dedup=None):
+    """Stage 1: turn sources into (key, digest, chunks).
+
+    Sources whose content hash matches the manifest are dropped here, before
+    any chunking or embedding work is done. Each chunk's metadata is the
+    source's metadata plus whatever chunk_fn recorded (section, timestamps,
+    offsets).
+    With a dedup.Deduplicator, repeated cues and near-duplicate chunks are
+    dropped before they reach the embedder.
+    """
+    for source in sources:
+        digest = source_hash(source)
+        if not full and manifest.is_unchanged(source["key"], digest):
+            print(f"Unchanged since last run: {source['key']}")
+            continue
+        if dedup is not None and "cues" in source:
+            source = dict(source, cues=dedup.cues(source["cues"]))
+        chunks = [
+            {"text": chunk["text"], "metadata": dict(source.get("metadata", {}), **chunk["metadata"])}
+            for chunk in chunk_fn(source)
+        ]
+        if dedup is not None:
+            chunks = dedup.filter_chunks(chunks)
+        yield source["key"], digest, chunks
+
+
+def embed_batches(chunks, embed_fn, batch_size=DEFAULT_BATCH_SIZE):
+    """Stage 2: group (chunk, vector-or-None) pairs into batches and fill in vectors.
+
+    Pairs that already carry a vector (reused from the previous version of a
+    source) pass through; the rest are embedded together with embed_fn.
+    Yields (chunks, vectors, n_embedded) per batch.
+    """
+    batch = []
+    for item in chunks:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield _embed_batch(batch, embed_fn)
+            batch = []
+    if batch:
+        yield _embed_batch(batch, embed_fn)
+
+
+def _embed_batch(batch, embed_fn):
+    missing = [i for i, (_, vector) in enumerate(batch) if vector is None]
+    vectors = [vector for _, vector in batch]
+    if missing:
+        embedded = embed_fn([batch[i][0] for i in missing])
+        for i, vector in zip(missing, embedded):
+            vectors[i] = vector
+    return [chunk for chunk, _ in batch], np.vstack(vectors), len(missing)
+
+
+def ingest(kb_dir, manifest, sources, chunk_fn, embed_fn, model: str, dtype: str = "float32",
+           full: bool = False, batch_size: int = DEFAULT_BATCH_SIZE, dedup=None) -> dict:
+    """Stream sources into the store at kb_dir and update the manifest.
+
+    New sources are appended. For sources that changed, the new rows are
+    appended and the old rows removed once the run commits; chunk texts that
+    were already embedded for that source reuse their stored vector instead of
+    going through embed_fn(chunks) -> (n, dim) array. With full=True the store
+    is rebuilt from just these sources.
+
+    Returns counts of sources, chunks, embedded and reused chunks, plus the
+    seconds spent in embed_fn.
+    """
+    kb_dir = Path(kb_dir)
+    if not full and store_exists(kb_dir):
+        # Fail before downloading or embedding anything, not at the first append
+        check_model(kb_dir, model)
+    if full or not store_exists(kb_dir):
+        manifest.sources = {}
+    reader = KnowledgeBaseReader(kb_dir) if manifest.sources else None
+
+    stats = {"sources": 0, "chunks": 0, "embedded": 0, "reused": 0, "embed_seconds": 0.0}
+    stale_rows = []
+    new_entries = {}
+    writer = None
+    rows_assigned = 0
+    now = datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+    def pending_chunks():
+        # Assigns each source its row range and pairs chunks with reusable vectors
+        nonlocal rows_assigned
+        for key, digest, chunks in chunk_sources(prefetch(sources), chunk_fn, manifest, full, dedup):
+            reusable = {}
+            previous = manifest.sources.get(key)
+            if previous and reader is not None:
+                start, end = previous["rows"]
+                stale_rows.extend(range(start, end))
+                for row in range(start, end):
+                    reusable[content_hash(reader.get_chunk(row)["text"])] = np.array(reader.vectors[row])
+
+            start = (reader.count if reader is not None else 0) + rows_assigned
+            rows_assigned += len(chunks)
+            new_entries[key] = {"hash": digest, "rows": [start, start + len(chunks)], "ingested_at": now}
+            stats["sources"] += 1
+
+            for chunk in chunks:
+                yield chunk, reusable.get(content_hash(chunk["text"]))
+
+    def timed_embed(chunks):
+        start = time.perf_counter()
+        vectors = embed_fn(chunks)
+        stats["embed_seconds"] += time.perf_counter() - start
+        return vectors
+
+    try:
+        for chunks, vectors, n_embedded in embed_batches(pending_chunks(), timed_embed, batch_size):
+            if writer is None:
+                writer = KnowledgeBaseWriter(kb_dir, dim=vectors.shape[1], model=model,
+                                             dtype=dtype, append=reader is not None)
+            writer.add(chunks, vectors)
+            stats["chunks"] += len(chunks)
+            stats["embedded"] += n_embedded
+            stats["reused"] += len(chunks) - n_embedded
+            print(f"Stored {stats['chunks']} chunks ({stats['embedded']} embedded) from {stats['sources']} sources")
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    finally:
+        if reader is not None:
+            reader.close()
+        if dedup is not None:
+            # Removed chunks would have cost about as much as the ones that were embedded
+            print(dedup.stats_line(stats["embed_seconds"] / stats["embedded"] if stats["embedded"] else None))
+
+    if writer is None and reader is None:
+        # No store to append to or clean up
+        return stats
+    if writer is not None:
+        writer.close()
+        revision = writer.revision
+    else:
+        # Changed sources that now produce no chunks still drop their old rows
+        revision = read_header(kb_dir).get("revision", 0)
+
+    manifest.sources.update(new_entries)
+    if stale_rows:
+        mapping = delete_rows(kb_dir, stale_rows)
+        for entry in manifest.sources.values():
+            start, end = entry["rows"]
+            new_start = int(mapping[start]) if end > start else 0
+            entry["rows"] = [new_start, new_start + (end - start)]
+        revision += 1
+
+    manifest.revision = revision
+    manifest.save()
+    return stats
+
+
+def add_pipeline_arguments(parser, default_model: str = DEFAULT_MODEL):
+    """Register the store, chunking, dedup, embedding, cache and index flags shared by the ingesters."""
+    parser.add_argument("--dtype", type=str, default="float32", choices=SUPPORTED_DTYPES,
+                        help="Storage dtype for embedding vectors")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Chunks per embed-and-append batch")
+    parser.add_argument("--full", action="store_true",
+                        help="Ignore the manifest and rebuild the knowledge base from scratch")
+    add_chunker_arguments(parser)
+    add_dedup_arguments(parser)
+    add_embedder_arguments(parser, default_model=default_model)
+    add_cache_arguments(parser)
+    add_index_arguments(parser)
+
+
+def run_from_args(args, kb_dir, manifest, sources, client=None, noun: str = "sources") -> dict:
+    """Ingest sources as add_pipeline_arguments() flags describe, then refresh the store's indexes.
+
+    client, if given, is the HTTP client the sources download through; it is
+    closed (and its stats printed) once the sources are consumed. noun names
+    the sources in the summary. Returns ingest()'s stats.
+    """
+    cache = open_cache(args)
+    embedder = embedder_from_args(args, cache=cache)
+    try:
+        stats = ingest(kb_dir, manifest, sources, chunker_from_args(args), embedder.embed_chunks,
+                       model=args.model, dtype=args.dtype, full=args.full, batch_size=args.batch_size,
+                       dedup=deduplicator_from_args(args))
+    finally:
+        embedder.close()
+        if client is not None:
+            print(client.stats_line())
+            client.close()
+        if cache is not None:
+            print(cache.stats_line())
+            cache.close()
+
+    # Keyword, metadata and ANN indexes are rebuilt whenever the store has changed
+    if store_exists(kb_dir):
+        refresh_bm25_index(kb_dir)
+        refresh_metadata_index(kb_dir)
+        refresh_index_from_args(args, kb_dir)
+
+    print(f"\n{'='*60}")
+    print(f"Total new or changed chunks: {stats['chunks']} from {stats['sources']} {noun}")
+    print(f"{'='*60}\n")
+    if not stats["chunks"]:
+        print("No new or changed content.")
+        return stats
+
+    print(f"\nEmbedded {stats['embedded']} chunks; knowledge base now covers {len(manifest)} {noun} in {kb_dir}")
+    print(f"Knowledge base size: {store_size_bytes(kb_dir) / 1024 / 1024:.2f} MB")
+    return stats
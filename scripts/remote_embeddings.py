@@ -0,0 +1,96 @@
+"""
+Remote Embeddings
+Batched, concurrent embedding requests against an OpenAI-compatible
+/embeddings endpoint (Together AI, or scripts/stub_server.py for local testing).
+
+Texts are sent as list inputs in batches, with a small pool of requests in
+flight. A 429 shrinks the batch size for every later request and the
+rejected batch is retried in smaller pieces after a backoff.
+"""
+import time
+import random
+import threading
+
+from openai import RateLimitError
+
+from fetch_pool import fetch_ordered
+
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_MAX_IN_FLIGHT = 4
+MAX_RETRIES = 5
+
+
+class RemoteEmbedder:
+    """Embed lists of texts with batched requests and adaptive backoff on 429s."""
+
+    def __init__(self, client, model: str, batch_size: int = DEFAULT_BATCH_SIZE,
+                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT, max_retries: int = MAX_RETRIES):
+        self.client = client
+        self.model = model
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.requests = 0
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+
+    def _shrink(self, failed_size: int):
+        with self._lock:
+            self.rate_limited += 1
+            if self.batch_size >= failed_size:
+                self.batch_size = max(1, failed_size // 2)
+                print(f"\nRate limited; reducing embedding batch size to {self.batch_size}")
+
+    def _request(self, texts):
+        with self._lock:
+            self.requests += 1
+        response = self.client.embeddings.create(input=texts, model=self.model)
+        # Results carry an index; don't rely on the server preserving order
+        return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+    def _embed_batch(self, texts):
+        """Embed one batch, splitting it further if the endpoint pushes back.
+
+        Returns a list aligned with texts; entries that could not be embedded
+        after all retries are None.
+        """
+        delay = 1.0
+        for attempt in range(self.max_retries):
+            try:
+                return self._request(texts)
+            except RateLimitError as e:
+                self._shrink(len(texts))
+                retry_after = e.response.headers.get("retry-after") if e.response is not None else None
+                time.sleep(float(retry_after) if retry_after else delay + random.uniform(0, delay))
+                delay *= 2
+                if len(texts) > self.batch_size:
+                    size = self.batch_size
+                    results = []
+                    for i in range(0, len(texts), size):
+                        results.extend(self._embed_batch(texts[i:i + size]))
+                    return results
+            except Exception as e:
+                if attempt < self.max_retries - 1:
+                    print(f"\nRetry {attempt + 1}/{self.max_retries} after error: {str(e)[:100]}")
+                    time.sleep(delay)
+                    delay *= 2
+                else:
+                    print(f"\nFailed after {self.max_retries} attempts: {str(e)[:100]}")
+        return [None] * len(texts)
+
+    def _batches(self, texts):
+        start = 0
+        while start < len(texts):
+            # Read batch_size lazily so a 429 shrinks the batches not yet sent
+            size = self.batch_size
+            yield texts[start:start + size]
+            start += size
+
+    def embed(self, texts, progress=None):
+        """Embed texts in order. Returns a list of vectors (None for failures)."""
+        results = []
+        for batch, vectors in fetch_ordered(self._embed_batch, self._batches(texts), workers=self.max_in_flight):
+            results.extend(vectors)
+            if progress is not None:
+                progress.update(len(batch))
+        return results
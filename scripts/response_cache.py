@@ -0,0 +1,175 @@
+"""
+Response Cache
+Persistent cache of fetched source documents (filing HTML, submissions JSON,
+caption files, pages), keyed by URL, stored in a single SQLite file shared by
+every ingester. Entries are evicted least-recently-used once the cache
+exceeds its size cap.
+
+How long an entry may be used without asking the server again comes from
+CACHE_RULES: EDGAR archive documents never change once filed, so they are
+kept forever; submissions JSON, BCstat pages and YouTube API responses get a
+TTL. Past its TTL an entry is revalidated with its ETag/Last-Modified (see
+http_client.py). With --offline the ingesters read only from the cache.
+
+Cache keys drop query parameters that are secret or change per request (API
+keys, signed caption URL parameters), so the same document maps to one entry.
+"""
+import re
+import json
+import math
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+DEFAULT_CACHE_PATH = Path(__file__).parent.parent / "data" / "cache" / "responses.sqlite"
+DEFAULT_MAX_BYTES = 1024 ** 3  # 1 GB
+
+IMMUTABLE = math.inf
+HOUR = 3600
+DAY = 24 * HOUR
+# (URL pattern, seconds an entry is used without revalidating); first match wins
+CACHE_RULES = (
+    # Documents under an accession number are never rewritten
+    (re.compile(r"^https?://www\.sec\.gov/Archives/edgar/data/"), IMMUTABLE),
+    # A company's filing index grows whenever it files
+    (re.compile(r"^https?://data\.sec\.gov/submissions/"), 12 * HOUR),
+    (re.compile(r"^https?://www\.sec\.gov/files/company_tickers"), DAY),
+    (re.compile(r"^https?://www\.baltimorecountymd\.gov/"), DAY),
+    (re.compile(r"^https?://www\.youtube\.com/api/timedtext"), 7 * DAY),
+    (re.compile(r"^https?://www\.googleapis\.com/youtube/"), HOUR),
+)
+# Never part of a cache key (or stored on disk)
+SECRET_PARAMS = frozenset({"key", "api_key", "access_token"})
+# Signed caption URLs carry per-request signatures; these identify the track
+TIMEDTEXT_PARAMS = frozenset({"v", "lang", "kind", "fmt", "tlang"})
+
+
+def cache_key(url: str) -> str:
+    """url with secret and per-request query parameters dropped and the rest sorted."""
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if parts.path.endswith("/api/timedtext"):
+        query = [(k, v) for k, v in query if k in TIMEDTEXT_PARAMS]
+    else:
+        query = [(k, v) for k, v in query if k not in SECRET_PARAMS]
+    return urlunsplit((parts.scheme, parts.netloc.lower(), parts.path, urlencode(sorted(query)), ""))
+
+
+def cache_ttl(url: str, rules=CACHE_RULES) -> float:
+    """Seconds a response for url stays fresh (0 = revalidate every time)."""
+    for pattern, ttl in rules:
+        if pattern.match(url):
+            return ttl
+    return 0
+
+
+class ResponseCache:
+    """URL -> {"content", "headers", "etag", "last_modified", "expires"}, with size-capped LRU eviction.
+
+    expires is a Unix time, or None for responses that never go stale.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                content BLOB NOT NULL,
+                headers TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                expires REAL,
+                last_used REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._db.commit()
+
+    def get(self, url: str):
+        """Return the stored entry (fresh or not), or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT content, headers, etag, last_modified, expires FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET last_used = ? WHERE url = ?", (time.time(), url))
+            self._db.commit()
+        self.hits += 1
+        content, headers, etag, last_modified, expires = row
+        return {"content": content, "headers": json.loads(headers), "etag": etag,
+                "last_modified": last_modified, "expires": expires}
+
+    def put(self, url: str, entry: dict):
+        row = (url, entry["content"], json.dumps(entry["headers"]), entry.get("etag"),
+               entry.get("last_modified"), entry.get("expires"), time.time())
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+            self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(LENGTH(content)), 0) FROM responses").fetchone()[0]
+
+    def evict(self) -> int:
+        """Drop least-recently-used entries until the cache fits in max_bytes."""
+        excess = self.size_bytes() - self.max_bytes
+        if excess <= 0:
+            return 0
+        with self._lock:
+            cursor = self._db.execute("SELECT url, LENGTH(content) FROM responses ORDER BY last_used")
+            doomed = []
+            for url, size in cursor:
+                if excess <= 0:
+                    break
+                doomed.append((url,))
+                excess -= size
+            self._db.executemany("DELETE FROM responses WHERE url = ?", doomed)
+            self._db.commit()
+        return len(doomed)
+
+    def stats_line(self) -> str:
+        return (f"Response cache: {self.hits} hits, {self.misses} misses, "
+                f"{self.size_bytes() / 1024 / 1024:.1f} MB on disk")
+
+    def close(self):
+        """Evict down to the size cap and close the database."""
+        removed = self.evict()
+        if removed:
+            print(f"Response cache: evicted {removed} least-recently-used entries")
+        with self._lock:
+            self._db.close()
+
+
+def add_response_cache_arguments(parser):
+    """Register the response-cache CLI flags shared by the ingesters."""
+    parser.add_argument("--offline", action="store_true",
+                        help="Make no network requests; ingest only what the response cache holds")
+    parser.add_argument("--no-http-cache", action="store_true", help="Don't read or write the response cache")
+    parser.add_argument("--http-cache-path", type=str, default=str(DEFAULT_CACHE_PATH), help="Response cache SQLite file")
+    parser.add_argument("--http-cache-max-mb", type=int, default=DEFAULT_MAX_BYTES // 1024 ** 2,
+                        help="Evict LRU responses above this size")
+
+
+def open_response_cache(args):
+    """Open the cache described by add_response_cache_arguments() flags, or None with --no-http-cache."""
+    if args.no_http_cache:
+        if args.offline:
+            raise SystemExit("--offline needs the response cache; drop --no-http-cache")
+        return None
+    return ResponseCache(args.http_cache_path, max_bytes=args.http_cache_max_mb * 1024 ** 2)
@@ -0,0 +1,384 @@
+"""
+Retrieval Engine
+Top-k chunk search over a twin's binary knowledge base store.
+
+Vectors are unit-normalized at ingest time (see kb_store.py), so cosine
+similarity for every chunk is a single matrix-vector product, and the top k
+rows are picked with argpartition instead of sorting the whole corpus.
+Stores written before normalization was added are normalized once in memory.
+If the store has an up-to-date IVF index (ann_index.py), queries only score
+the rows in the nprobe nearest lists; nprobe=0 forces an exact scan.
+
+When the query text is given too and the store has a BM25 index
+(bm25_index.py), the vector and keyword rankings are merged with reciprocal
+rank fusion, so exact terms like "10-Q" or "code enforcement" still surface.
+
+Metadata filters ({"ticker": "WMT", "filing_date": {"gte": "2024"}}) are
+resolved against the columnar metadata index (metadata_index.py) first, and
+only the matching rows are scored.
+
+Queries sent as text are embedded locally with the model recorded in the
+store's header, so query and chunk vectors always share a space. A twin can
+hold one store per model (kb_store.model_kb_dir); "model" picks which, and
+asking for a model the twin has no store for fails instead of returning
+meaningless neighbours.
+
+Usage:
+    python scripts/retrieval.py search bcstat --k 5 --text "code enforcement" --embed
+    python scripts/retrieval.py search retail --filters '{"ticker": "WMT", "filing_type": "10-K"}' < query_embedding.json
+    python scripts/retrieval.py serve --port 8770
+
+The HTTP server answers POST /search with {"twin", "query", "embedding",
+"model", "k", "nprobe", "filters"}; "embedding" is optional when "query" is
+given. It is what the chat route calls when RETRIEVAL_URL is set. Query
+embeddings and top-k results are cached (LRU with a TTL); result keys name the
+opened Retriever they came from, so reopening a re-ingested store (or one with
+rebuilt indexes) retires its cached results.
+GET /stats reports cache hits and misses.
+"""
+import os
+import sys
+import json
+import hashlib
+import argparse
+import itertools
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from ann_index import DEFAULT_NPROBE, IVFIndex
+from ann_index import INDEX_FILE as ANN_FILE
+from bm25_index import BM25Index
+from bm25_index import INDEX_FILE as BM25_FILE
+from embedder import BACKENDS, DEFAULT_BACKEND, get_embedder
+from metadata_index import MetadataIndex
+from metadata_index import INDEX_FILE as METADATA_INDEX_FILE
+from query_cache import DEFAULT_MAX_ENTRIES, DEFAULT_TTL, TTLCache
+from kb_store import HEADER_FILE, KB_DIRNAME, KnowledgeBaseReader, normalize_rows, store_exists, twin_stores
+
+TWINS_DIR = Path(__file__).parent.parent / "data" / "twins"
+DEFAULT_K = 5
+DEFAULT_PORT = 8770
+# Candidates taken from each ranking before fusion
+FUSION_DEPTH = 50
+# Standard RRF damping constant
+RRF_K = 60
+# Largest filtered subset (as a fraction of the store) scored by gathering its rows
+GATHER_FRACTION = 0.25
+# Numbers each opened Retriever, so cached results never outlive the files they were computed from
+_GENERATIONS = itertools.count()
+# Files whose change means a store must be reopened; the indexes are rebuilt after the store is committed
+STORE_FILES = (HEADER_FILE, ANN_FILE, BM25_FILE, METADATA_INDEX_FILE)
+
+
+def _mtime(path: Path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def store_fingerprint(kb_dir) -> tuple:
+    """mtimes of a store's header and of each of its indexes (None for a missing file)."""
+    return tuple(_mtime(Path(kb_dir) / name) for name in STORE_FILES)
+
+
+def twin_kb_dir(twin_id: str, twins_dir=TWINS_DIR, model: str = None) -> Path:
+    """The twin's store for model, or its primary kb/ store when model is None."""
+    # Twin ids come from URLs; refuse anything that could escape the twins directory
+    if not twin_id or "/" in twin_id or "\\" in twin_id or twin_id.startswith("."):
+        raise ValueError(f"Invalid twin id '{twin_id}'")
+    twin_dir = Path(twins_dir) / twin_id
+    if model is None:
+        return twin_dir / KB_DIRNAME
+    stores = twin_stores(twin_dir)
+    if model not in stores:
+        raise FileNotFoundError(f"Twin '{twin_id}' has no store for {model} "
+                                f"(available: {', '.join(stores) or 'none'})")
+    return stores[model]
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first, without sorting every score."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def reciprocal_rank_fusion(rankings, k: int, rrf_k: int = RRF_K):
+    """Merge ranked row lists: each row scores sum(1 / (rrf_k + rank)). Returns [(row, score), ...]."""
+    fused = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+class Retriever:
+    """Exact cosine top-k over one store, with its vectors held as unit-norm float32."""
+
+    def __init__(self, kb_dir, backend: str = DEFAULT_BACKEND):
+        self.kb_dir = Path(kb_dir)
+        self.backend = backend
+        self.reader = KnowledgeBaseReader(self.kb_dir)
+        self.generation = next(_GENERATIONS)
+        self.revision = self.reader.revision
+        self.model = self.reader.model
+        self.dim = self.reader.dim
+        if self.reader.normalized and self.reader.vectors.dtype == np.float32:
+            # Already unit-norm float32: search the mmap directly
+            self.vectors = self.reader.vectors
+        else:
+            self.vectors = normalize_rows(self.reader.vectors)
+        self.ann = IVFIndex.load(self.kb_dir, self.revision)
+        self.bm25 = BM25Index.load(self.kb_dir, self.revision)
+        self.metadata = MetadataIndex.load(self.kb_dir, self.revision)
+        # The reader shares one file handle for chunk lookups
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.reader.count
+
+    def embed_query(self, text: str) -> np.ndarray:
+        """Embed query text locally with the model this store was built with."""
+        return get_embedder(self.model, backend=self.backend).encode([text])[0]
+
+    def filter_rows(self, filters: dict) -> np.ndarray:
+        """Ascending row ids whose metadata matches filters."""
+        if self.metadata is None:
+            raise ValueError(f"Store {self.kb_dir} has no up-to-date metadata index to filter with")
+        return self.metadata.filter(filters)
+
+    def search(self, query, k: int = DEFAULT_K, nprobe: int = DEFAULT_NPROBE, filters: dict = None):
+        """Return [(row, score), ...] for the k most similar rows, best first.
+
+        With filters, only the matching rows are scored (exactly). Otherwise uses
+        the IVF index when there is one and nprobe > 0, or scans every row.
+        """
+        query = np.asarray(query, dtype=np.float32).ravel()
+        if query.shape[0] != self.dim:
+            raise ValueError(f"Query has {query.shape[0]} dimensions, store {self.kb_dir} has {self.dim}")
+        if not len(self):
+            return []
+        query = normalize_rows(query)
+        rows = None
+        if filters:
+            rows = self.filter_rows(filters)
+        elif self.ann is not None and nprobe > 0:
+            rows = self.ann.candidates(query, nprobe)
+        if rows is not None:
+            # Gathering rows costs more per row than a sequential scan; past a quarter
+            # of the store, scan everything and pick out the subset's scores instead
+            if len(rows) > len(self) * GATHER_FRACTION:
+                scores = (self.vectors @ query)[rows]
+            else:
+                scores = self.vectors[rows] @ query
+            best = top_k(scores, k)
+            return [(int(rows[i]), float(scores[i])) for i in best]
+        scores = self.vectors @ query
+        rows = top_k(scores, k)
+        return [(int(row), float(scores[row])) for row in rows]
+
+    def hybrid_search(self, query, text: str, k: int = DEFAULT_K, nprobe: int = DEFAULT_NPROBE,
+                      filters: dict = None):
+        """Fuse vector and BM25 rankings with RRF; falls back to search() without a BM25 index."""
+        if self.bm25 is None or not text:
+            return self.search(query, k, nprobe, filters)
+        depth = max(k, FUSION_DEPTH)
+        vector_rows = [row for row, _ in self.search(query, depth, nprobe, filters)]
+        rows = self.filter_rows(filters) if filters else None
+        keyword_rows = [row for row, _ in self.bm25.search(text, depth, rows)]
+        return reciprocal_rank_fusion([vector_rows, keyword_rows], k)
+
+    def search_chunks(self, query, k: int = DEFAULT_K, nprobe: int = DEFAULT_NPROBE, text: str = None,
+                      filters: dict = None) -> list:
+        """Like search() (or hybrid_search() given text), but returns chunk records with "row" and "score" added.
+
+        query may be None when text is given; the text is then embedded locally.
+        """
+        if query is None:
+            if not text:
+                raise ValueError("Need a query embedding or query text")
+            query = self.embed_query(text)
+        return self.chunks_for(self.hybrid_search(query, text, k, nprobe, filters))
+
+    def chunks_for(self, hits) -> list:
+        """Chunk records for [(row, score), ...] hits, with "row" and "score" added."""
+        with self._lock:
+            chunks = self.reader.get_chunks([row for row, _ in hits])
+        return [dict(chunk, row=row, score=score) for chunk, (row, score) in zip(chunks, hits)]
+
+    def close(self):
+        self.reader.close()
+
+
+class RetrieverPool:
+    """One Retriever per (twin, model) store, reopened whenever the store or one of its indexes changes."""
+
+    def __init__(self, twins_dir=TWINS_DIR, backend: str = DEFAULT_BACKEND):
+        self.twins_dir = Path(twins_dir)
+        self.backend = backend
+        self._retrievers = {}
+        self._lock = threading.Lock()
+
+    def get(self, twin_id: str, model: str = None) -> Retriever:
+        kb_dir = twin_kb_dir(twin_id, self.twins_dir, model)
+        if not store_exists(kb_dir):
+            raise FileNotFoundError(f"No knowledge base store for twin '{twin_id}'")
+        fingerprint = store_fingerprint(kb_dir)
+        with self._lock:
+            cached = self._retrievers.get(kb_dir)
+            if cached is not None and cached[0] == fingerprint:
+                return cached[1]
+            retriever = Retriever(kb_dir, self.backend)
+            self._retrievers[kb_dir] = (fingerprint, retriever)
+        # Requests already holding the old retriever keep working on its open mmap
+        return retriever
+
+
+class QueryService:
+    """RetrieverPool plus caches of query text -> embedding and query -> top-k rows."""
+
+    def __init__(self, twins_dir=TWINS_DIR, backend: str = DEFAULT_BACKEND,
+                 cache_size: int = DEFAULT_MAX_ENTRIES, cache_ttl: float = DEFAULT_TTL, pool=None):
+        # pool: anything with get(twin_id, model) -> Retriever; defaults to opening stores on demand
+        self.pool = pool if pool is not None else RetrieverPool(twins_dir, backend)
+        self.embeddings = TTLCache(cache_size, cache_ttl)
+        self.results = TTLCache(cache_size, cache_ttl)
+
+    def _embed(self, retriever: Retriever, text: str) -> np.ndarray:
+        key = (retriever.model, retriever.backend, text)
+        vector = self.embeddings.get(key)
+        if vector is None:
+            vector = retriever.embed_query(text)
+            self.embeddings.put(key, vector)
+        return vector
+
+    def search(self, twin_id: str, embedding=None, text: str = None, model: str = None, k: int = DEFAULT_K,
+               nprobe: int = DEFAULT_NPROBE, filters: dict = None):
+        """Top-k chunk records for a query; returns (retriever, results)."""
+        retriever = self.pool.get(twin_id, model)
+        if embedding is not None:
+            query = np.asarray(embedding, dtype=np.float32).ravel()
+        elif text:
+            query = self._embed(retriever, text)
+        else:
+            raise ValueError("Need a query embedding or query text")
+
+        # Reopening the store (any change to its files) changes the key, so older results never match
+        key = (retriever.generation, hashlib.sha1(query.tobytes()).hexdigest(),
+               k, nprobe, text or "", json.dumps(filters, sort_keys=True) if filters else "")
+        hits = self.results.get(key)
+        if hits is None:
+            hits = retriever.hybrid_search(query, text, k, nprobe, filters)
+            self.results.put(key, hits)
+        return retriever, retriever.chunks_for(hits)
+
+    def stats(self) -> dict:
+        return {"embeddings": self.embeddings.stats(), "results": self.results.stats()}
+
+
+class SearchHandler(BaseHTTPRequestHandler):
+    server_version = "TwinRetrieval/1.0"
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/stats":
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        self._send_json(200, self.server.service.stats())
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/search":
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+            retriever, results = self.server.service.search(
+                request.get("twin", ""), request.get("embedding"), request.get("query"), request.get("model"),
+                int(request.get("k", DEFAULT_K)), int(request.get("nprobe", DEFAULT_NPROBE)), request.get("filters"))
+        except FileNotFoundError as e:
+            self._send_json(404, {"error": str(e)})
+            return
+        except (KeyError, ValueError, TypeError) as e:
+            self._send_json(400, {"error": f"Bad request: {e}"})
+            return
+        self._send_json(200, {"results": results, "model": retriever.model, "revision": retriever.revision})
+
+
+def make_server(host="127.0.0.1", port=DEFAULT_PORT, twins_dir=TWINS_DIR, quiet=True, backend=DEFAULT_BACKEND,
+                cache_size=DEFAULT_MAX_ENTRIES, cache_ttl=DEFAULT_TTL):
+    server = ThreadingHTTPServer((host, port), SearchHandler)
+    server.service = QueryService(twins_dir, backend, cache_size, cache_ttl)
+    server.quiet = quiet
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search twin knowledge bases by embedding.")
+    parser.add_argument("--twins-dir", type=str, default=str(TWINS_DIR), help="Directory holding one folder per twin")
+    parser.add_argument("--backend", type=str, default=DEFAULT_BACKEND, choices=BACKENDS,
+                        help="Backend for embedding query text locally")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    search_parser = subparsers.add_parser("search", help="Read a JSON embedding from stdin and print the top-k chunks")
+    search_parser.add_argument("twin_id", type=str)
+    search_parser.add_argument("--model", type=str, default=None, help="Which of the twin's stores to search (default: kb/)")
+    search_parser.add_argument("--embed", action="store_true", help="Embed --text locally instead of reading stdin")
+    search_parser.add_argument("--k", type=int, default=DEFAULT_K)
+    search_parser.add_argument("--nprobe", type=int, default=DEFAULT_NPROBE, help="IVF lists to scan (0 = exact search)")
+    search_parser.add_argument("--text", type=str, default=None, help="Query text, to fuse in BM25 keyword matches")
+    search_parser.add_argument("--filters", type=json.loads, default=None, help="JSON metadata filter")
+
+    serve_parser = subparsers.add_parser("serve", help="Serve POST /search over HTTP")
+    serve_parser.add_argument("--host", type=str, default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_ENTRIES,
+                              help="Entries per query cache (0 disables caching)")
+    serve_parser.add_argument("--cache-ttl", type=float, default=DEFAULT_TTL, help="Seconds before a cached entry expires (0 = never)")
+
+    args = parser.parse_args()
+
+    if args.command == "search":
+        retriever = Retriever(twin_kb_dir(args.twin_id, args.twins_dir, args.model), args.backend)
+        try:
+            query = None if args.embed else json.load(sys.stdin)
+            results = retriever.search_chunks(query, args.k, args.nprobe, args.text, args.filters)
+        finally:
+            retriever.close()
+        print(json.dumps({"results": results, "model": retriever.model, "revision": retriever.revision},
+                         ensure_ascii=False))
+    elif args.command == "serve":
+        server = make_server(args.host, args.port, args.twins_dir, quiet=False, backend=args.backend,
+                             cache_size=args.cache_size, cache_ttl=args.cache_ttl)
+        print(f"Retrieval server listening on http://{args.host}:{args.port}/search")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Local Stub Server
+Minimal OpenAI-compatible /v1/embeddings endpoint for exercising the ingest
+scripts without network access or API keys.
+
+Vectors are deterministic (seeded by the text's hash) so repeated runs give
+identical results. --max-batch makes oversized requests fail with 429 to
+exercise the adaptive backoff in remote_embeddings.py.
+
+--static-dir also serves the files of a directory at GET /static/<path>, with
+ETag/Last-Modified validators, 304 responses and gzip, for exercising
+http_client.py; --fail-every N answers every Nth of those GETs with a 503.
+
+Usage:
+    python scripts/stub_server.py --port 8765 --max-batch 16
+    TOGETHER_BASE_URL=http://127.0.0.1:8765/v1 python scripts/ingest.py ...
+    python scripts/stub_server.py --static-dir data/fixtures --fail-every 5
+"""
+import gzip
+import json
+import time
+import hashlib
+import argparse
+import mimetypes
+import threading
+from pathlib import Path
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+def stub_embedding(text: str, dim: int) -> list:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server_version = "TwinStub/1.0"
+    # Keep-alive, so pooled clients can reuse connections; without Nagle the
+    # separately written headers and body don't wait on a delayed ACK
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, payload: dict, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _static_file(self):
+        """The file under --static-dir named by the request path, or None."""
+        root = self.server.static_dir
+        relative = self.path.split("?", 1)[0][len("/static/"):]
+        path = (root / relative).resolve()
+        if root not in path.parents or not path.is_file():
+            return None
+        return path
+
+    def do_GET(self):
+        if not self.server.static_dir or not self.path.startswith("/static/"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        with self.server.lock:
+            self.server.stats["gets"] += 1
+            count = self.server.stats["gets"]
+        if self.server.fail_every and count % self.server.fail_every == 0:
+            self.server.stats["failed"] += 1
+            self._send_json(503, {"error": {"message": "Try again"}}, headers={"Retry-After": "0"})
+            return
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        path = self._static_file()
+        if path is None:
+            self._send_json(404, {"error": {"message": f"No such file {self.path}"}})
+            return
+
+        body = path.read_bytes()
+        mtime = int(path.stat().st_mtime)
+        etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+        validators = {"ETag": etag, "Last-Modified": formatdate(mtime, usegmt=True)}
+        if_none_match = self.headers.get("If-None-Match")
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_none_match is not None:
+            fresh = etag in (tag.strip() for tag in if_none_match.split(","))
+        elif if_modified_since is not None:
+            try:
+                fresh = mtime <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                fresh = False
+        else:
+            fresh = False
+        if fresh:
+            self.server.stats["not_modified"] += 1
+            self.send_response(304)
+            for name, value in validators.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        headers = dict(validators)
+        headers["Content-Type"] = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+        self.send_response(200)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.server.stats["bytes_sent"] += len(body)
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/v1/embeddings":
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        inputs = request.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+
+        self.server.stats["requests"] += 1
+        if self.server.max_batch and len(inputs) > self.server.max_batch:
+            self.server.stats["rate_limited"] += 1
+            self._send_json(429, {"error": {"message": "Too many inputs", "type": "rate_limit"}},
+                            headers={"Retry-After": "0.1"})
+            return
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        data = [
+            {"object": "embedding", "index": i, "embedding": stub_embedding(text, self.server.dim)}
+            for i, text in enumerate(inputs)
+        ]
+        self._send_json(200, {
+            "object": "list",
+            "model": request.get("model", "stub"),
+            "data": data,
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        })
+
+
+def make_server(host="127.0.0.1", port=8765, dim=768, max_batch=0, latency=0.0, quiet=True,
+                static_dir=None, fail_every=0):
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.dim = dim
+    server.max_batch = max_batch
+    server.latency = latency
+    server.quiet = quiet
+    server.static_dir = Path(static_dir).resolve() if static_dir else None
+    server.fail_every = fail_every
+    server.lock = threading.Lock()
+    server.stats = {"requests": 0, "rate_limited": 0, "gets": 0, "not_modified": 0, "failed": 0, "bytes_sent": 0}
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stub of the embeddings API.")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dim", type=int, default=768, help="Embedding dimension to return")
+    parser.add_argument("--max-batch", type=int, default=0, help="Return 429 for requests with more inputs than this (0 = never)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to sleep per request")
+    parser.add_argument("--static-dir", type=str, default=None, help="Serve this directory's files at /static/")
+    parser.add_argument("--fail-every", type=int, default=0, help="Return 503 for every Nth static GET (0 = never)")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.dim, args.max_batch, args.latency, quiet=False,
+                         static_dir=args.static_dir, fail_every=args.fail_every)
+    print(f"Stub server listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+Twin Server
+Long-lived retrieval daemon. Loads every active twin listed in
+data/twins.json once at startup - metadata.json plus a Retriever per store,
+with the vector matrices mmapped and paged in - so requests never touch the
+filesystem except to read the returned chunks.
+
+A watcher thread polls the twins' files every few seconds and reopens a twin
+in the background when its metadata, store header or indexes change (or when
+twins.json gains or drops a twin); requests keep using the previous version
+until the new one is ready.
+
+Serves the same API as `retrieval.py serve`, over HTTP/1.1 with keep-alive
+or over a Unix socket:
+
+    POST /search        {"twin", "query", "embedding", "model", "k", "nprobe", "filters"}
+    GET  /twins         loaded twins with their stores
+    GET  /twins/<id>    one twin's metadata.json and stores
+    GET  /stats         query cache counters
+
+Usage:
+    python scripts/twin_server.py --port 8770
+    python scripts/twin_server.py --socket /tmp/twins.sock
+"""
+import os
+import json
+import time
+import argparse
+import threading
+import socketserver
+from pathlib import Path
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+
+from embedder import BACKENDS, DEFAULT_BACKEND
+from kb_store import KB_DIRNAME, twin_stores
+from query_cache import DEFAULT_MAX_ENTRIES, DEFAULT_TTL
+from retrieval import DEFAULT_PORT, TWINS_DIR, QueryService, Retriever, SearchHandler, store_fingerprint, twin_kb_dir
+
+TWINS_FILE = TWINS_DIR.parent / "twins.json"
+METADATA_FILE = "metadata.json"
+DEFAULT_POLL_INTERVAL = 2.0
+
+
+def _mtime(path: Path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class LoadedTwin:
+    """A twin's metadata and one open Retriever per embedding model."""
+
+    def __init__(self, twin_id: str, entry: dict, twin_dir: Path, backend: str):
+        self.twin_id = twin_id
+        self.entry = entry
+        self.twin_dir = twin_dir
+        self.fingerprint = self.current_fingerprint(twin_dir)
+        metadata_path = twin_dir / METADATA_FILE
+        self.metadata = json.loads(metadata_path.read_text(encoding="utf-8")) if metadata_path.exists() else {}
+        self.retrievers = {}
+        for model, kb_dir in twin_stores(twin_dir).items():
+            retriever = Retriever(kb_dir, backend)
+            # Fault the mmapped vectors in now rather than on the first query
+            if len(retriever):
+                float(np.asarray(retriever.vectors).sum())
+            self.retrievers[model] = retriever
+        # Requests that don't name a model search kb/
+        self.primary = next((r for r in self.retrievers.values() if r.kb_dir == twin_dir / KB_DIRNAME), None)
+
+    @staticmethod
+    def current_fingerprint(twin_dir: Path) -> tuple:
+        """mtimes of everything the loaded twin depends on."""
+        parts = [(METADATA_FILE, _mtime(twin_dir / METADATA_FILE))]
+        for kb_dir in sorted(twin_dir.glob(KB_DIRNAME + "*")):
+            parts.append((kb_dir.name, store_fingerprint(kb_dir)))
+        return tuple(parts)
+
+    def describe(self) -> dict:
+        return {
+            "id": self.twin_id,
+            "name": self.entry.get("name"),
+            "stores": {model: {"count": len(r), "dim": r.dim, "revision": r.revision,
+                               "ann": r.ann is not None, "bm25": r.bm25 is not None}
+                       for model, r in self.retrievers.items()},
+        }
+
+
+class TwinRegistry:
+    """Every active twin from twins.json, loaded up front and reloaded when its files change."""
+
+    def __init__(self, twins_file=TWINS_FILE, twins_dir=TWINS_DIR, backend: str = DEFAULT_BACKEND):
+        self.twins_file = Path(twins_file)
+        self.twins_dir = Path(twins_dir)
+        self.backend = backend
+        self.twins = {}
+        self.reloads = 0
+        self._twins_file_mtime = None
+        self._stop = threading.Event()
+
+    def _entries(self) -> dict:
+        with open(self.twins_file, "r", encoding="utf-8") as f:
+            return {entry["id"]: entry for entry in json.load(f) if entry.get("isActive", True)}
+
+    def _load(self, twin_id: str, entry: dict):
+        # Validates the id the same way request lookups do
+        twin_dir = twin_kb_dir(twin_id, self.twins_dir).parent
+        start = time.perf_counter()
+        twin = LoadedTwin(twin_id, entry, twin_dir, self.backend)
+        stores = ", ".join(f"{m} ({len(r)} rows)" for m, r in twin.retrievers.items()) or "no stores"
+        print(f"Loaded twin {twin_id}: {stores} ({time.perf_counter() - start:.2f}s)")
+        return twin
+
+    def poll(self):
+        """Load new twins, drop removed ones and reload any whose files changed."""
+        twins_file_mtime = _mtime(self.twins_file)
+        if twins_file_mtime != self._twins_file_mtime:
+            entries = self._entries()
+            self._twins_file_mtime = twins_file_mtime
+        else:
+            entries = {twin_id: twin.entry for twin_id, twin in self.twins.items()}
+
+        for twin_id in set(self.twins) - set(entries):
+            print(f"Unloaded twin {twin_id}")
+            # Swap in a new dict so lookups never see a half-updated one
+            twins = dict(self.twins)
+            twins.pop(twin_id)
+            self.twins = twins
+
+        for twin_id, entry in entries.items():
+            current = self.twins.get(twin_id)
+            if current is not None and current.entry == entry and \
+                    current.fingerprint == LoadedTwin.current_fingerprint(current.twin_dir):
+                continue
+            try:
+                twin = self._load(twin_id, entry)
+            except Exception as e:
+                # Typically a store caught mid-write; the next poll retries
+                print(f"Could not load twin {twin_id}: {e}")
+                continue
+            if current is not None:
+                self.reloads += 1
+            self.twins = dict(self.twins, **{twin_id: twin})
+
+    def watch(self, interval: float = DEFAULT_POLL_INTERVAL) -> threading.Thread:
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.poll()
+                except Exception as e:
+                    print(f"Reload check failed: {e}")
+
+        thread = threading.Thread(target=run, name="twin-watcher", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+    def twin(self, twin_id: str) -> LoadedTwin:
+        twin = self.twins.get(twin_id)
+        if twin is None:
+            raise FileNotFoundError(f"Twin '{twin_id}' is not loaded")
+        return twin
+
+    def get(self, twin_id: str, model: str = None) -> Retriever:
+        """QueryService pool interface: the resident Retriever for a twin's store."""
+        twin = self.twin(twin_id)
+        retriever = twin.primary if model is None else twin.retrievers.get(model)
+        if retriever is None:
+            raise FileNotFoundError(f"Twin '{twin_id}' has no store for {model or 'its primary model'} "
+                                    f"(available: {', '.join(twin.retrievers) or 'none'})")
+        return retriever
+
+
+class TwinHandler(SearchHandler):
+    server_version = "TwinServer/1.0"
+    # Keep-alive, so clients don't pay a TCP handshake per query
+    protocol_version = "HTTP/1.1"
+
+    def address_string(self):
+        # Unix socket peers have no (host, port)
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def do_GET(self):
+        path = self.path.rstrip("/")
+        registry = self.server.registry
+        if path == "/twins":
+            self._send_json(200, {"twins": [twin.describe() for twin in registry.twins.values()],
+                                  "reloads": registry.reloads})
+        elif path.startswith("/twins/"):
+            try:
+                twin = registry.twin(path[len("/twins/"):])
+            except FileNotFoundError as e:
+                self._send_json(404, {"error": str(e)})
+                return
+            self._send_json(200, dict(twin.describe(), metadata=twin.metadata))
+        else:
+            super().do_GET()
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(registry: TwinRegistry, host="127.0.0.1", port=DEFAULT_PORT, socket_path=None, quiet=True,
+                cache_size=DEFAULT_MAX_ENTRIES, cache_ttl=DEFAULT_TTL):
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = ThreadingUnixHTTPServer(socket_path, TwinHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), TwinHandler)
+    server.registry = registry
+    server.service = QueryService(cache_size=cache_size, cache_ttl=cache_ttl, pool=registry)
+    server.quiet = quiet
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve retrieval for every twin from one resident process.")
+    parser.add_argument("--twins-file", type=str, default=str(TWINS_FILE), help="twins.json listing the twins to load")
+    parser.add_argument("--twins-dir", type=str, default=str(TWINS_DIR), help="Directory holding one folder per twin")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--socket", type=str, default=None, help="Listen on this Unix socket instead of TCP")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL,
+                        help="Seconds between checks for changed twin files (0 = never reload)")
+    parser.add_argument("--backend", type=str, default=DEFAULT_BACKEND, choices=BACKENDS,
+                        help="Backend for embedding query text locally")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_ENTRIES,
+                        help="Entries per query cache (0 disables caching)")
+    parser.add_argument("--cache-ttl", type=float, default=DEFAULT_TTL, help="Seconds before a cached entry expires (0 = never)")
+    parser.add_argument("--quiet", action="store_true", help="Don't log each request")
+    args = parser.parse_args()
+
+    registry = TwinRegistry(args.twins_file, args.twins_dir, args.backend)
+    registry.poll()
+    if args.poll_interval:
+        registry.watch(args.poll_interval)
+
+    server = make_server(registry, args.host, args.port, args.socket, quiet=args.quiet,
+                         cache_size=args.cache_size, cache_ttl=args.cache_ttl)
+    where = f"unix:{args.socket}" if args.socket else f"http://{args.host}:{server.server_address[1]}"
+    print(f"Twin server listening on {where} with {len(registry.twins)} twins", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        registry.stop()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()